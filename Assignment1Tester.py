@@ -6,6 +6,7 @@
 RATINGS_TABLE = 'ratings'
 RANGE_TABLE_PREFIX = 'range_part'
 RROBIN_TABLE_PREFIX = 'rrobin_part'
+HASH_TABLE_PREFIX = 'hash_part'
 USER_ID_COLNAME = 'userid'
 MOVIE_ID_COLNAME = 'movieid'
 RATING_COLNAME = 'rating'
@@ -27,6 +28,12 @@ def get_range_partition_index(rating, number_of_partitions):
         index = index - 1
     return str(index)
 
+def get_hash_partition_index(userid, number_of_partitions):
+    """
+    Tính toán index của phân mảnh hash dựa trên userid và số phân mảnh
+    """
+    return str(((userid * 2654435761) & 0xFFFFFFFF) % number_of_partitions)
+
 if __name__ == '__main__':
     try:
         # Nhập tên database từ bàn phím
@@ -94,6 +101,22 @@ if __name__ == '__main__':
             else:
                 print("Hàm roundrobininsert thất bại!")
 
+            # Thực hiện hash partition theo userid trên bảng ratings hiện tại
+            [result, e] = testHelper.testhashpartition(MyAssignment, RATINGS_TABLE, number_of_partitions, conn, 0, ACTUAL_ROWS_IN_INPUT_FILE + 1)
+            if result :
+                print("Hàm hashpartition đã chạy thành công!")
+            else:
+                print("Hàm hashpartition thất bại!")
+
+            # Test hashinsert với partition index được tính toán dựa trên userid
+            test_userid = 9999998
+            partition_index = get_hash_partition_index(test_userid, number_of_partitions)
+            [result, e] = testHelper.testhashinsert(MyAssignment, RATINGS_TABLE, test_userid, 1, 4.5, conn, partition_index)
+            if result:
+                print("Hàm hashinsert đã chạy thành công!")
+            else:
+                print("Hàm hashinsert thất bại!")
+
             choice = input('\nNhấn Enter để xóa tất cả các bảng? ')
             if choice == '':
                 testHelper.deleteAllPublicTables(conn)
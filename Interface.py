@@ -3,16 +3,100 @@
 # Interface for the assignement
 #
 
-import psycopg2
+import asyncio
+import bisect
+import functools
+import inspect
+import itertools
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import closing, contextmanager
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.pool
+
+try:
+    import numpy as np
+except ImportError:  # numpy là tùy chọn, không có thì dùng bộ phân tích thuần Python
+    np = None
+
+# Cấu hình kết nối: giá trị mặc định < biến môi trường PGUSER/PGPASSWORD/PGHOST/PGPORT < DSN trong CSDLPT_DSN
+DEFAULT_CONNECTION_SETTINGS = {'user': 'postgres', 'password': '1234', 'host': 'localhost', 'port': '5432'}
+CONNECTION_ENVIRONMENT = {'user': 'PGUSER', 'password': 'PGPASSWORD', 'host': 'PGHOST', 'port': 'PGPORT'}
+DSN_ENVIRONMENT_VARIABLE = 'CSDLPT_DSN'  # Ví dụ: "host=db.local port=5433 user=app password=secret"
+POOL_MIN_SIZE = int(os.environ.get('CSDLPT_POOL_MIN', '1'))  # Số kết nối mở sẵn trong mỗi pool
+POOL_MAX_SIZE = int(os.environ.get('CSDLPT_POOL_MAX', '10'))  # Số kết nối tối đa của mỗi pool
+
+# Pool dùng chung trong tiến trình: (pid, dbname) -> ConnectionPool
+CONNECTION_POOLS = {}
+CONNECTION_POOLS_LOCK = threading.Lock()
 
 # Các hằng số định nghĩa prefix và tên cột
 RANGE_TABLE_PREFIX = 'range_part'  # Prefix cho tên bảng phân vùng theo khoảng giá trị
 RROBIN_TABLE_PREFIX = 'rrobin_part'  # Prefix cho tên bảng phân vùng theo round-robin
+HASH_TABLE_PREFIX = 'hash_part'  # Prefix cho tên bảng phân vùng theo hash của userid
 USER_ID_COLNAME = 'userid'  # Tên cột chứa ID của user
 MOVIE_ID_COLNAME = 'movieid'  # Tên cột chứa ID của movie
 RATING_COLNAME = 'rating'  # Tên cột chứa giá trị rating
 
+# Các hằng số cho đường nạp dữ liệu bằng binary COPY
+LOAD_CHUNK_SIZE = 16 * 1024 * 1024  # Kích thước mỗi khối (byte) khi phân tích file ratings
+COPY_BUFFER_SIZE = 1024 * 1024  # Kích thước bộ đệm gửi dữ liệu COPY lên server
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)  # Header của định dạng binary COPY
+PGCOPY_TRAILER = struct.pack('!h', -1)  # Trailer đánh dấu kết thúc dữ liệu
+PGCOPY_ROW = struct.Struct('!hiiiiid')  # Một dòng (userid, movieid, rating) trong định dạng binary COPY
+
+# Hàm băm nhân (Knuth) 32 bit dùng cho phân mảnh hash, tính được giống hệt nhau trong SQL và Python
+HASH_USER_MULTIPLIER = 2654435761
+HASH_MOVIE_MULTIPLIER = 2246822519
+HASH_MASK = 0xFFFFFFFF
+HASH_KEY_USER = 'userid'  # Giá trị cột mode trong partition_catalog: băm theo userid
+HASH_KEY_USER_MOVIE = 'userid,movieid'  # Băm theo cả userid và movieid
+
+# Cache metadata phân mảnh: (host, port, dbname, prefix) -> dòng tương ứng trong partition_catalog
+PARTITION_METADATA_CACHE = {}
+METADATA_RETRIES = 3  # Số lần đọc lại metadata khi phát hiện cache đã cũ
+PARTITION_METADATA_COLUMNS = ('prefix', 'scheme', 'mode', 'numberofpartitions', 'boundaries', 'tablenames',
+                              'version', 'migrationcount', 'migrationboundaries', 'indexes', 'nodes', 'replicas')
+REPARTITION_BATCH_SIZE = 50000  # Số dòng được chuyển trong mỗi transaction của repartition
+SPLIT_CHECK_INTERVAL = 60.0  # Chu kỳ (giây) kiểm tra kích thước các phân mảnh range
+SPLIT_MIN_ROWS = 10000  # Phân mảnh nhỏ hơn ngưỡng này không bị tách
+
+# Bản sao (replica) của các phân mảnh
+REPLICA_MAX_STALENESS = 1.0  # Độ trễ tối đa (giây) để một bản sao được dùng cho truy vấn đọc
+REPLICA_SYNC_INTERVAL = 0.5  # Chu kỳ (giây) đồng bộ các bản sao từ insert log
+REPLICA_READ_COUNTER = itertools.count()  # Dùng để chia đều truy vấn đọc giữa các bản sao
+
+# Index trên các bảng phân mảnh
+PARTITION_INDEX_METHODS = ('btree', 'brin', 'hash', 'unique')  # unique: btree với ràng buộc duy nhất
+PARTITION_INDEX_COLUMNS = (USER_ID_COLNAME, MOVIE_ID_COLNAME, RATING_COLNAME)
+
+# Các tham số của truy vấn trên phân mảnh
+QUERY_BATCH_SIZE = 10000  # Số dòng mỗi lần lấy từ server-side cursor
+QUERY_CURSOR_IDS = itertools.count()  # Dùng để đặt tên duy nhất cho các server-side cursor
+QUERY_WORKERS = 4  # Số phân mảnh được đọc song song trong pointquery
+
+# Instrumentation: mỗi span (một hàm hoặc một giai đoạn của hàm) gửi một event đến các sink
+INSTRUMENTATION_SINKS = ()  # Không có sink: instrumentation tắt
+INSTRUMENTATION_EXPLAIN = False  # Ghi lại EXPLAIN (ANALYZE, BUFFERS) của các câu lệnh nặng
+INSTRUMENTATION_LOCK = threading.Lock()
+INSTRUMENTATION_LOCAL = threading.local()  # Stack các span đang mở của mỗi thread
+INSTRUMENTATION_SPAN_IDS = itertools.count(1)
+
+# Các tham số mặc định của InsertService (group commit)
+INSERT_BATCH_SIZE = 1000  # Số dòng tối đa trong một lô
+INSERT_FLUSH_INTERVAL = 0.005  # Thời gian chờ tối đa (giây) trước khi ghi một lô
+INSERT_QUEUE_SIZE = 10000  # Số dòng tối đa đang chờ ghi
+
 def getopenconnection(dbname='postgres'):
     """
     Hàm tạo kết nối đến PostgreSQL database
@@ -35,23 +119,18 @@ def getopenconnection(dbname='postgres'):
     Notes:
     -----
     - Hàm này sử dụng thư viện psycopg2 để kết nối đến PostgreSQL
-    - Các thông số kết nối mặc định:
+    - Các thông số kết nối mặc định (xem connection_dsn để ghi đè bằng biến môi trường):
         + user: postgres
-        + password: postgres
+        + password: 1234
         + host: localhost
         + port: 5432
     - Nếu không truyền tên database, sẽ kết nối đến database mặc định 'postgres'
+    - Mỗi lần gọi mở một kết nối mới; dùng ConnectionPool/get_connection_pool để tái sử dụng kết nối
     - Database 'postgres' thường được sử dụng để tạo/xóa các database khác
     """
     try:
-        # Tạo kết nối đến database với các thông số mặc định
-        connection = psycopg2.connect(
-            database=dbname,  # Tên database
-            user="postgres",  # Tên người dùng
-            password="1234",  # Mật khẩu
-            host="localhost", # Địa chỉ host
-            port="5432"      # Cổng kết nối
-        )
+        # Tạo kết nối đến database với các thông số cấu hình
+        connection = psycopg2.connect(connection_dsn(dbname))
         return connection
     except Exception as e:
         # In thông báo lỗi nếu không thể kết nối
@@ -59,369 +138,5032 @@ def getopenconnection(dbname='postgres'):
         print(e)
         raise e
 
-def loadratings(ratingstablename, ratingsfilepath, openconnection):
+def connection_dsn(dbname=None):
     """
-    Function to load data in @ratingsfilepath file to a table called @ratingstablename.
-    """
-    try:
-        start_time = time.time()
-        
-        # Tạo bảng với cấu trúc phù hợp cho file input
-        cur = openconnection.cursor()
-        cur.execute(f"""
-        CREATE TABLE {ratingstablename} (
-            {USER_ID_COLNAME} INTEGER,
-            extra1 CHAR,
-            {MOVIE_ID_COLNAME} INTEGER,
-            extra2 CHAR,
-            {RATING_COLNAME} FLOAT,
-            extra3 CHAR,
-            timestamp BIGINT
-        )
-        """)
-        
-        # Copy trực tiếp từ file vào bảng
-        with open(ratingsfilepath, 'r') as f:
-            cur.copy_from(f, ratingstablename, sep=':')
-        
-        # Xóa các cột không cần thiết
-        cur.execute(f"""
-        ALTER TABLE {ratingstablename} 
-        DROP COLUMN extra1,
-        DROP COLUMN extra2,
-        DROP COLUMN extra3,
-        DROP COLUMN timestamp
-        """)
-        
-        # Thêm primary key
-        cur.execute(f"""
-        ALTER TABLE {ratingstablename} 
-        ADD PRIMARY KEY ({USER_ID_COLNAME}, {MOVIE_ID_COLNAME})
-        """)
-        
-        # Commit và đóng cursor
-        openconnection.commit()
-        cur.close()
+    Function to build the libpq DSN used for new connections.
+    
+    Parameters:
+    -----------
+    dbname : str, optional
+        Tên database; None để giữ dbname trong CSDLPT_DSN (nếu có)
         
-        # Tính và in thời gian thực thi
-        end_time = time.time()
-        execution_time = end_time - start_time
-        print(f"Thời gian thực thi hàm loadratings: {execution_time:.2f} giây")
+    Returns:
+    --------
+    str
+        Chuỗi DSN, ví dụ "user=postgres password=1234 host=localhost port=5432 dbname=postgres"
         
-    except Exception as e:
-        openconnection.rollback()
-        print("Error: Could not load ratings from file")
-        print(e)
-        raise e
+    Notes:
+    -----
+    - Thứ tự ưu tiên: DEFAULT_CONNECTION_SETTINGS < PGUSER/PGPASSWORD/PGHOST/PGPORT < CSDLPT_DSN
+    - CSDLPT_DSN có thể chứa bất kỳ tham số libpq nào (sslmode, connect_timeout, ...)
+    """
+    settings = dict(DEFAULT_CONNECTION_SETTINGS)
+    for key, variable in CONNECTION_ENVIRONMENT.items():
+        if os.environ.get(variable):
+            settings[key] = os.environ[variable]
+    settings.update(psycopg2.extensions.parse_dsn(os.environ.get(DSN_ENVIRONMENT_VARIABLE, '')))
+    if dbname is not None:
+        settings['dbname'] = dbname
+    return psycopg2.extensions.make_dsn(**settings)
 
-def rangepartition(ratingstablename, numberofpartitions, openconnection):
+class ConnectionPool(object):
     """
-    Function to create partitions of main table based on range of ratings.
-    Sử dụng truy vấn SQL để phân mảnh dựa trên khoảng giá trị của rating
-    
-    Thuật toán phân vùng theo khoảng giá trị:
-    1. Tính toán khoảng giá trị cho mỗi phân vùng:
-       - Khoảng giá trị rating là từ 0 đến 5.0
-       - Chia đều khoảng này thành numberofpartitions phần
-       - Delta = 5.0/numberofpartitions là độ rộng của mỗi khoảng
-    
-    2. Tạo các bảng con:
-       - Mỗi bảng con có prefix 'range_part'
-       - Cấu trúc bảng: userid, movieid, rating
-       - Tên bảng: range_part0, range_part1, ...
-    
-    3. Phân phối dữ liệu:
-       - Phân vùng 0: [0, delta] - chứa các rating từ 0 đến delta
-       - Phân vùng 1: (delta, 2*delta] - chứa các rating từ delta đến 2*delta
-       - Phân vùng 2: (2*delta, 3*delta] - chứa các rating từ 2*delta đến 3*delta
-       - ...
-       - Phân vùng cuối: ((n-1)*delta, 5.0] - chứa các rating từ (n-1)*delta đến 5.0
-    
-    4. Ưu điểm:
-       - Phân phối dữ liệu đều theo giá trị rating
-       - Dễ dàng tìm kiếm theo khoảng giá trị
-       - Hiệu quả cho các truy vấn có điều kiện trên rating
+    Thread-safe pool of psycopg2 connections with health checks and per-connection session settings.
+    Dựa trên psycopg2.pool.ThreadedConnectionPool; getconn() chờ khi pool đã dùng hết maxconn kết nối.
     
-    5. Nhược điểm:
-       - Có thể dẫn đến phân phối không đều nếu dữ liệu tập trung ở một khoảng
-       - Cần tính toán lại khi thêm/xóa phân vùng
+    Parameters:
+    -----------
+    dbname : str, optional
+        Tên database (mặc định lấy từ cấu hình, xem connection_dsn)
+    minconn, maxconn : int, optional
+        Số kết nối mở sẵn và số kết nối tối đa
+    dsn : str, optional
+        DSN đầy đủ, dùng thay cho connection_dsn(dbname)
+    settings : dict, optional
+        Các tham số session (ví dụ {'work_mem': '64MB', 'synchronous_commit': 'off'}),
+        được áp dụng một lần khi kết nối được dùng lần đầu
+    healthcheck : bool, optional
+        True để kiểm tra kết nối (SELECT 1) trước khi giao cho người dùng
+    timeout : float, optional
+        Thời gian chờ tối đa (giây) khi pool đã hết kết nối; None là chờ mãi
+        
+    Notes:
+    -----
+    - Dùng với mọi hàm trong Interface:
+        with pool.connection() as con:
+            rangeinsert('ratings', 1, 1, 3.5, con)
+    - Khi trả về pool, phần việc chưa commit bị rollback và autocommit được đặt lại là False
+    - Kết nối hỏng (server restart, bị terminate, ...) bị loại bỏ và thay bằng kết nối mới
     """
-    try:
-        start_time = time.time()
+    
+    def __init__(self, dbname=None, minconn=POOL_MIN_SIZE, maxconn=POOL_MAX_SIZE, dsn=None, settings=None,
+                 healthcheck=True, timeout=None):
+        self.dsn = connection_dsn(dbname) if dsn is None else dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.settings = dict(settings or {})
+        self.healthcheck = healthcheck
+        self.timeout = timeout
+        self.pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, self.dsn,
+                                                         cursor_factory=InstrumentedCursor)
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.configured = set()  # id của các kết nối đã được áp dụng session settings
         
-        con = openconnection
-        cur = con.cursor()
+    def usable(self, con):
+        if con.closed:
+            return False
+        if not self.healthcheck:
+            return True
+        try:
+            cur = con.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            if not con.autocommit:
+                con.rollback()
+            return True
+        except psycopg2.Error:
+            return False
         
-        # Tính khoảng giá trị cho mỗi phân mảnh
-        delta = 5.0 / numberofpartitions
+    def getconn(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise psycopg2.pool.PoolError("connection pool exhausted")
+        try:
+            con = self.pool.getconn()
+            while not self.usable(con):
+                # Loại kết nối hỏng, pool sẽ mở kết nối mới
+                self.configured.discard(id(con))
+                self.pool.putconn(con, close=True)
+                con = self.pool.getconn()
+            
+            if id(con) not in self.configured:
+                cur = con.cursor()
+                for name, value in self.settings.items():
+                    cur.execute("SELECT set_config(%s, %s, false)", (name, str(value)))
+                cur.close()
+                if not con.autocommit:
+                    con.commit()
+                self.configured.add(id(con))
+            return con
+        except Exception:
+            self.slots.release()
+            raise
         
-        # Tạo các bảng phân mảnh
-        for i in range(numberofpartitions):
-            min_range = i * delta
-            max_range = min_range + delta
-            table_name = RANGE_TABLE_PREFIX + str(i)
+    def putconn(self, con):
+        try:
+            close = con.closed or con.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+            if not close:
+                if con.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    con.rollback()
+                con.autocommit = False
+            if close:
+                self.configured.discard(id(con))
+            self.pool.putconn(con, close=close)
+        finally:
+            self.slots.release()
             
-            # Tạo bảng phân mảnh
-            cur.execute(f"""
-                CREATE TABLE {table_name} (
-                    userid INTEGER,
-                    movieid INTEGER,
-                    rating FLOAT
-                )
-            """)
+    @contextmanager
+    def connection(self):
+        con = self.getconn()
+        try:
+            yield con
+        finally:
+            self.putconn(con)
             
-            # Chèn dữ liệu vào bảng phân mảnh dựa trên khoảng giá trị
-            if i == 0:
-                # Phân mảnh đầu tiên: [min_range, max_range]
-                cur.execute(f"""
-                    INSERT INTO {table_name} (userid, movieid, rating)
-                    SELECT userid, movieid, rating
-                    FROM {ratingstablename}
-                    WHERE rating >= {min_range} AND rating <= {max_range}
-                """)
-            else:
-                # Các phân mảnh còn lại: (min_range, max_range]
-                cur.execute(f"""
-                    INSERT INTO {table_name} (userid, movieid, rating)
-                    SELECT userid, movieid, rating
-                    FROM {ratingstablename}
-                    WHERE rating > {min_range} AND rating <= {max_range}
-                """)
+    def closeall(self):
+        self.configured.clear()
+        self.pool.closeall()
         
-        # Commit và đóng cursor
-        openconnection.commit()
-        cur.close()
-        
-        # Tính và in thời gian thực thi
-        end_time = time.time()
-        execution_time = end_time - start_time
-        print(f"Thời gian thực thi hàm rangepartition: {execution_time:.2f} giây")
-        
-    except Exception as e:
-        openconnection.rollback()
-        print("Error: Could not create range partitions")
-        print(e)
-        raise e
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.closeall()
 
-def roundrobinpartition(ratingstablename, numberofpartitions, openconnection):
+def get_connection_pool(dbname):
     """
-    Function to create partitions of main table using round robin approach.
-    Sử dụng truy vấn SQL để phân mảnh dữ liệu theo round robin
-    
-    Thuật toán phân vùng theo round-robin:
-    1. Nguyên lý hoạt động:
-       - Phân phối dữ liệu luân phiên vào các bảng con
-       - Mỗi bản ghi được gán một số thứ tự (row_num)
-       - Bảng con được chọn dựa trên phép chia lấy dư: row_num % numberofpartitions
-    
-    2. Tạo các bảng con:
-       - Mỗi bảng con có prefix 'rrobin_part'
-       - Cấu trúc bảng: userid, movieid, rating
-       - Tên bảng: rrobin_part0, rrobin_part1, ...
-    
-    3. Phân phối dữ liệu:
-       - Bản ghi 0 -> rrobin_part0
-       - Bản ghi 1 -> rrobin_part1
-       - Bản ghi 2 -> rrobin_part2
-       - ...
-       - Bản ghi n -> rrobin_part(n % numberofpartitions)
-    
-    4. Ưu điểm:
-       - Phân phối dữ liệu đều giữa các bảng con
-       - Không phụ thuộc vào giá trị của dữ liệu
-       - Dễ dàng thêm/xóa phân vùng
-       - Hiệu quả cho các truy vấn song song
+    Function to get the process-wide ConnectionPool of @dbname, created on first use from connection_dsn.
     
-    5. Nhược điểm:
-       - Không tối ưu cho các truy vấn có điều kiện trên rating
-       - Cần quét tất cả các bảng con khi tìm kiếm theo giá trị
-       - Khó khăn trong việc tìm kiếm theo khoảng giá trị
+    Notes:
+    -----
+    - Pool được lưu theo (pid, dbname): tiến trình con tạo bằng fork không dùng lại
+      các kết nối của tiến trình cha
     """
-    try:
-        start_time = time.time()
-        
-        con = openconnection
-        cur = con.cursor()
-        RROBIN_TABLE_PREFIX = 'rrobin_part'
+    key = (os.getpid(), dbname)
+    with CONNECTION_POOLS_LOCK:
+        pool = CONNECTION_POOLS.get(key)
+        if pool is None:
+            pool = CONNECTION_POOLS[key] = ConnectionPool(dbname)
+        return pool
 
-        # Tạo các bảng phân mảnh
-        for i in range(numberofpartitions):
-            table_name = RROBIN_TABLE_PREFIX + str(i)
-            cur.execute(f"""
-                CREATE TABLE {table_name} (
-                    userid INTEGER,
-                    movieid INTEGER,
-                    rating FLOAT
-                )
-            """)
-        
-        # Phân phối dữ liệu theo round robin
-        query = f"""
-        DO $$
-        DECLARE
-            target_partition text;
-            row_data record;
-        BEGIN
-            FOR row_data IN 
-                SELECT 
-                    userid,
-                    movieid,
-                    rating,
-                    ROW_NUMBER() OVER (ORDER BY userid, movieid) - 1 as row_num
-                FROM {ratingstablename}
-            LOOP
-                -- Tính toán tên bảng phân mảnh
-                target_partition := '{RROBIN_TABLE_PREFIX}' || (row_data.row_num % {numberofpartitions})::text;
-                
-                -- Insert dữ liệu vào phân mảnh tương ứng
-                EXECUTE format('INSERT INTO %I (userid, movieid, rating) VALUES ($1, $2, $3)', target_partition)
-                USING row_data.userid, row_data.movieid, row_data.rating;
-            END LOOP;
-        END $$;
-        """
-        
-        cur.execute(query)
-        
-        # Commit và đóng cursor
-        openconnection.commit()
-        cur.close()
-        
-        # Tính và in thời gian thực thi
-        end_time = time.time()
-        execution_time = end_time - start_time
-        print(f"Thời gian thực thi hàm roundrobinpartition: {execution_time:.2f} giây")
-        
-    except Exception as e:
-        openconnection.rollback()
-        print("Error: Could not create round robin partitions")
-        print(e)
-        raise e
+def close_connection_pools(dbname=None):
+    """
+    Function to close the shared pools of this process (all databases, or only @dbname), e.g. before DROP DATABASE.
+    """
+    with CONNECTION_POOLS_LOCK:
+        for key in list(CONNECTION_POOLS):
+            if key[0] == os.getpid() and dbname in (None, key[1]):
+                CONNECTION_POOLS.pop(key).closeall()
 
-def roundrobininsert(ratingstablename, userid, itemid, rating, openconnection):
+def node_dsn(node):
     """
-    Function to insert a new row into the main table and specific partition based on round robin
-    approach.
+    Function to build the DSN of a partition node.
     
     Parameters:
     -----------
-    ratingstablename : str
-        Tên bảng ratings
-    userid : int
-        ID của user
-    itemid : int
-        ID của movie
-    rating : float
-        Giá trị rating
-    openconnection : psycopg2.extensions.connection
-        Kết nối đến database
+    node : str
+        Tên database (ví dụ 'csdlpt_node1') hoặc DSN/URI libpq (ví dụ 'port=5433 dbname=csdlpt')
         
+    Returns:
+    --------
+    str
+        DSN đầy đủ; các tham số không có trong @node lấy từ connection_dsn (user, password, ...)
+    """
+    if '=' not in node and '://' not in node:
+        return connection_dsn(node)
+    settings = psycopg2.extensions.parse_dsn(connection_dsn())
+    settings.update(psycopg2.extensions.parse_dsn(node))
+    return psycopg2.extensions.make_dsn(**settings)
+
+def get_node_pool(openconnection, node):
+    """
+    Function to get the process-wide ConnectionPool of @node (None: the database of @openconnection).
+    
     Notes:
     -----
-    - Insert bản ghi vào bảng chính
-    - Xác định bảng con cần insert dựa trên số lượng bản ghi
-    - Insert vào bảng con tương ứng
+    - Pool của node được lưu theo (pid, DSN) cùng với các pool theo tên database, nên
+      close_connection_pools() cũng đóng các pool này
     """
-    con = openconnection
-    cur = con.cursor()
-    RROBIN_TABLE_PREFIX = 'rrobin_part'
+    if node is None:
+        return get_connection_pool(connection_dbname(openconnection))
+    dsn = node_dsn(node)
+    key = (os.getpid(), dsn)
+    with CONNECTION_POOLS_LOCK:
+        pool = CONNECTION_POOLS.get(key)
+        if pool is None:
+            pool = CONNECTION_POOLS[key] = ConnectionPool(dsn=dsn)
+        return pool
+
+@contextmanager
+def transaction(openconnection):
+    """
+    Context manager to run a block of statements as one transaction, whether or not
+    @openconnection is in autocommit mode.
     
+    Notes:
+    -----
+    - Kết nối autocommit (như trong Assignment1Tester): tự mở BEGIN và COMMIT/ROLLBACK
+    - Kết nối thường: commit khi khối kết thúc, rollback nếu có lỗi
+    """
+    cur = openconnection.cursor()
+    explicit = openconnection.autocommit
     try:
-        # Insert vào bảng ratings trước
-        cur.execute(f"INSERT INTO {ratingstablename} (userid, movieid, rating) VALUES (%s, %s, %s)",
-                   (userid, itemid, rating))
-        
-        # Đếm tổng số dòng trong bảng ratings sau khi insert
-        cur.execute(f"SELECT COUNT(*) FROM {ratingstablename}")
-        total_rows = cur.fetchone()[0]
-        
-        # Tính toán số phân mảnh
-        numberofpartitions = count_partitions(RROBIN_TABLE_PREFIX, openconnection)
-        
-        # Tính toán index của phân mảnh cần insert (trừ 1 vì đã insert vào bảng chính)
-        partition_index = (total_rows - 1) % numberofpartitions
-        
-        # Tạo truy vấn SQL để insert dữ liệu vào phân mảnh
-        query = f"""
-        DO $$
-        DECLARE
-            target_partition text;
-        BEGIN
-            -- Tính toán tên bảng phân mảnh
-            target_partition := '{RROBIN_TABLE_PREFIX}' || '{partition_index}';
-            
-            -- Insert dữ liệu vào phân mảnh tương ứng
-            EXECUTE format('INSERT INTO %I (userid, movieid, rating) VALUES ($1, $2, $3)', target_partition)
-            USING {userid}, {itemid}, {rating};
-        END $$;
-        """
-        
-        cur.execute(query)
-        con.commit()
-        
-    except Exception as e:
-        con.rollback()
-        raise e
+        if explicit:
+            cur.execute("BEGIN")
+        yield cur
+        if explicit:
+            cur.execute("COMMIT")
+        else:
+            count_transaction_end(openconnection)
+            openconnection.commit()
+    except Exception:
+        if explicit:
+            cur.execute("ROLLBACK")
+        else:
+            count_transaction_end(openconnection)
+            openconnection.rollback()
+        raise
     finally:
         cur.close()
 
-def rangeinsert(ratingstablename, userid, itemid, rating, openconnection):
+class InstrumentedCursor(psycopg2.extensions.cursor):
     """
-    Function to insert a new row into the main table and specific partition based on range rating.
-    Sử dụng truy vấn SQL để xác định phân mảnh và insert dữ liệu
+    Cursor that counts its statements and server round trips in the active span (see span).
+    Khi instrumentation tắt, mỗi lệnh chỉ tốn thêm một lần kiểm tra INSTRUMENTATION_SINKS.
     
-    Parameters:
-    -----------
-    ratingstablename : str
-        Tên bảng ratings
-    userid : int
-        ID của user
-    itemid : int
-        ID của movie
-    rating : float
-        Giá trị rating
-    openconnection : psycopg2.extensions.connection
-        Kết nối đến database
-        
     Notes:
     -----
-    - Xác định bảng con dựa trên giá trị rating
-    - Insert vào bảng con tương ứng
+    - Kết nối của các pool (ConnectionPool) luôn dùng cursor này; kết nối của người dùng dùng nó
+      trong thời gian một hàm của Interface đang chạy (xem instrumented)
+    - Round trip: mỗi execute/copy, mỗi dòng của executemany, mỗi lần fetch của server-side cursor
+      và câu BEGIN ngầm mà psycopg2 gửi trước lệnh đầu tiên của một transaction; COMMIT/ROLLBACK
+      được đếm ở transaction(), các giai đoạn commit và các hàm insert (xem count_transaction_end)
     """
-    con = openconnection
-    cur = con.cursor()
-    RANGE_TABLE_PREFIX = 'range_part'
-    numberofpartitions = count_partitions(RANGE_TABLE_PREFIX, openconnection)
-    delta = 5.0 / numberofpartitions
     
-    # Tạo truy vấn SQL để xác định phân mảnh và insert dữ liệu
-    query = f"""
-    DO $$
-    DECLARE
-        target_partition text;
-    BEGIN
-        WITH partition_ranges AS (
-            SELECT 
-                generate_series(0, {numberofpartitions-1}) as partition_index,
-                generate_series(0, {numberofpartitions-1}) * {delta} as min_range,
-                (generate_series(0, {numberofpartitions-1}) + 1) * {delta} as max_range
-        )
-        SELECT '{RANGE_TABLE_PREFIX}' || partition_index::text INTO target_partition
-        FROM partition_ranges
-        WHERE 
-            CASE 
-                WHEN partition_index = 0 THEN {rating} >= min_range AND {rating} <= max_range
-                ELSE {rating} > min_range AND {rating} <= max_range
-            END
-        LIMIT 1;
+    def execute(self, query, vars=None):
+        if INSTRUMENTATION_SINKS:
+            count_statements(self, 1)
+        return super().execute(query, vars)
+    
+    def executemany(self, query, vars_list):
+        if INSTRUMENTATION_SINKS:
+            vars_list = list(vars_list)
+            count_statements(self, len(vars_list))
+        return super().executemany(query, vars_list)
+    
+    def copy_expert(self, sql, file, size=8192):
+        if INSTRUMENTATION_SINKS:
+            count_statements(self, 1)
+        return super().copy_expert(sql, file, size)
+    
+    def copy_from(self, file, table, sep='\t', null='\\N', size=8192, columns=None):
+        if INSTRUMENTATION_SINKS:
+            count_statements(self, 1)
+        return super().copy_from(file, table, sep, null, size, columns)
+    
+    def fetchone(self):
+        if INSTRUMENTATION_SINKS and self.name is not None:
+            current_span().count(roundtrips=1)
+        return super().fetchone()
+    
+    def fetchmany(self, size=None):
+        if INSTRUMENTATION_SINKS and self.name is not None:
+            current_span().count(roundtrips=1)
+        return super().fetchmany(self.arraysize if size is None else size)
+    
+    def fetchall(self):
+        if INSTRUMENTATION_SINKS and self.name is not None:
+            current_span().count(roundtrips=1)
+        return super().fetchall()
+
+def count_statements(cur, statements):
+    """
+    Function to count @statements statements of @cur (and the implicit BEGIN, if any) in the active span.
+    """
+    span = current_span()
+    con = cur.connection
+    begin = not con.autocommit and con.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    span.count(statements, statements + begin)
 
-        EXECUTE format('INSERT INTO %I (userid, movieid, rating) VALUES ($1, $2, $3)', target_partition)
-        USING {userid}, {itemid}, {rating};
-    END $$;
+def count_transaction_end(openconnection):
     """
+    Function to count, in the active span, the round trip of the commit/rollback about to be sent on @openconnection.
     
-    cur.execute(query)
+    Notes:
+    -----
+    - psycopg2 không gửi gì cho commit()/rollback() khi không có transaction đang mở (kể cả ở
+      chế độ autocommit), nên chỉ đếm khi kết nối đang trong một transaction
+    """
+    if INSTRUMENTATION_SINKS and \
+            openconnection.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        current_span().count(roundtrips=1)
+
+class NullSpan(object):
+    """
+    Span used when instrumentation is disabled: every method does nothing.
+    """
+    
+    rows = None
+    
+    def add_rows(self, rows):
+        pass
+    
+    def set(self, **attributes):
+        pass
+    
+    def count(self, statements=0, roundtrips=0):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Span(object):
+    """
+    One timed phase of an Interface operation; sent to every sink as an event when it ends.
+    
+    Parameters:
+    -----------
+    name : str
+        Tên hàm (span gốc) hoặc tên giai đoạn, ví dụ 'fill', 'commit'
+    parent : Span, optional
+        Span cha; số lệnh và round trip của span con được cộng vào span cha khi nó kết thúc
+    attributes : dict, optional
+        Thông tin thêm (bảng, số phân mảnh, ...) được ghi vào event
+        
+    Notes:
+    -----
+    - Dùng với with (xem span); stack các span đang mở được lưu riêng cho từng thread, nên span
+      con chạy trong thread khác cần truyền parent
+    """
+    
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.id = next(INSTRUMENTATION_SPAN_IDS)
+        self.parent = parent
+        self.operation = name if parent is None else parent.operation
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.attributes = dict(attributes or {})
+        self.rows = None
+        self.statements = 0
+        self.roundtrips = 0
+        self.plans = []
+        self.lock = threading.Lock()
+        self.start = None
+        self.started = None
+        
+    def add_rows(self, rows):
+        with self.lock:
+            self.rows = (self.rows or 0) + rows
+            
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        
+    def count(self, statements=0, roundtrips=0):
+        with self.lock:
+            self.statements += statements
+            self.roundtrips += roundtrips
+            
+    def begin(self):
+        self.start = time.time()
+        self.started = time.perf_counter()
+        
+    def activate(self):
+        span_stack().append(self)
+        
+    def deactivate(self):
+        stack = span_stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        elif self in stack:
+            stack.remove(self)
+            
+    def end(self, error=None):
+        seconds = time.perf_counter() - self.started
+        if self.parent is not None:
+            self.parent.count(self.statements, self.roundtrips)
+        event = {
+            'operation': self.operation, 'span': self.name, 'id': self.id,
+            'parent': None if self.parent is None else self.parent.id, 'depth': self.depth,
+            'thread': threading.current_thread().name, 'start': self.start, 'seconds': seconds,
+            'rows': self.rows, 'rowspersecond': self.rows / seconds if self.rows and seconds > 0 else None,
+            'statements': self.statements, 'roundtrips': self.roundtrips, 'attributes': self.attributes,
+            'error': None if error is None else "{0}: {1}".format(type(error).__name__, error),
+        }
+        if self.plans:
+            event['plans'] = self.plans
+        for sink in INSTRUMENTATION_SINKS:
+            try:
+                sink.emit(event)
+            except Exception:
+                # Sink lỗi không được làm hỏng thao tác trên database
+                pass
+            
+    def __enter__(self):
+        self.begin()
+        self.activate()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.deactivate()
+        self.end(exc)
+        return False
+
+def span_stack():
+    """
+    Function to get the stack of the spans open in the current thread.
+    """
+    stack = getattr(INSTRUMENTATION_LOCAL, 'spans', None)
+    if stack is None:
+        stack = INSTRUMENTATION_LOCAL.spans = []
+    return stack
+
+def current_span():
+    """
+    Function to get the innermost open span of the current thread (NULL_SPAN if there is none).
+    """
+    if not INSTRUMENTATION_SINKS:
+        return NULL_SPAN
+    stack = span_stack()
+    return stack[-1] if stack else NULL_SPAN
+
+def span(name, parent=None, **attributes):
+    """
+    Function to open a span (a timed phase) under the current span, or under @parent.
+    
+    Parameters:
+    -----------
+    name : str
+        Tên giai đoạn
+    parent : Span, optional
+        Span cha khi chạy trong một thread khác (lấy bằng current_span() ở thread gốc)
+    **attributes
+        Thông tin thêm ghi vào event
+        
+    Returns:
+    --------
+    Span or NullSpan
+        Dùng với with; NULL_SPAN (không làm gì) khi instrumentation tắt
+        
+    Notes:
+    -----
+    - Ví dụ: with span('fill', table=table_name) as phase: ...; phase.add_rows(cur.rowcount)
+    """
+    if not INSTRUMENTATION_SINKS:
+        return NULL_SPAN
+    if parent is None:
+        parent = current_span()
+    return Span(name, parent if isinstance(parent, Span) else None, attributes)
+
+def find_connection(args, kwargs):
+    """
+    Function to find the psycopg2 connection among the arguments of an Interface function.
+    """
+    con = kwargs.get('openconnection')
+    if con is None:
+        con = next((arg for arg in args if isinstance(arg, psycopg2.extensions.connection)), None)
+    return con
+
+@contextmanager
+def instrumented_cursors(openconnection):
+    """
+    Context manager to make the cursors of @openconnection count their statements (InstrumentedCursor).
+    
+    Notes:
+    -----
+    - Không đổi kết nối đã có cursor_factory riêng; cursor_factory được trả lại khi khối kết thúc
+    """
+    if openconnection is None or openconnection.cursor_factory is not None:
+        yield
+        return
+    openconnection.cursor_factory = InstrumentedCursor
+    try:
+        yield
+    finally:
+        openconnection.cursor_factory = None
+
+def instrumented(function):
+    """
+    Decorator that runs an Interface function inside a span named after it.
+    
+    Notes:
+    -----
+    - Instrumentation tắt: chỉ tốn một lần kiểm tra INSTRUMENTATION_SINKS
+    - rows của span: số phần tử đã trả về với generator (rangequery, pointquery), trường rows
+      của dict thống kê được trả về, hoặc giá trị do chính hàm ghi (current_span().add_rows)
+    - Với generator, span chỉ được kích hoạt trong lúc generator chạy, không phải lúc người
+      dùng xử lý kết quả
+    """
+    name = function.__name__
+    
+    if inspect.isgeneratorfunction(function):
+        @functools.wraps(function)
+        def generator_wrapper(*args, **kwargs):
+            if not INSTRUMENTATION_SINKS:
+                return (yield from function(*args, **kwargs))
+            con = find_connection(args, kwargs)
+            operation = span(name)
+            operation.begin()
+            generator = function(*args, **kwargs)
+            count = 0
+            error = None
+            try:
+                while True:
+                    operation.activate()
+                    try:
+                        with instrumented_cursors(con):
+                            item = next(generator)
+                    except StopIteration as stop:
+                        return stop.value
+                    finally:
+                        operation.deactivate()
+                    count += 1
+                    yield item
+            except GeneratorExit:
+                raise
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                operation.activate()
+                try:
+                    with instrumented_cursors(con):
+                        generator.close()
+                finally:
+                    operation.deactivate()
+                if operation.rows is None:
+                    operation.rows = count
+                operation.end(error)
+        return generator_wrapper
+    
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not INSTRUMENTATION_SINKS:
+            return function(*args, **kwargs)
+        with span(name) as operation, instrumented_cursors(find_connection(args, kwargs)):
+            result = function(*args, **kwargs)
+            if operation.rows is None and isinstance(result, dict) and isinstance(result.get('rows'), int):
+                operation.rows = result['rows']
+        return result
+    return wrapper
+
+def execute_heavy(cur, query, params=None):
+    """
+    Function to run a heavy data-modifying statement (bulk INSERT ... SELECT, CREATE TABLE AS, row moves);
+    with EXPLAIN capture on, it runs as EXPLAIN (ANALYZE, BUFFERS) and its plan is attached to the current span.
+    
+    Returns:
+    --------
+    dict or None
+        Kế hoạch thực thi (định dạng JSON của PostgreSQL) nếu đã được ghi lại, None nếu không
+        
+    Notes:
+    -----
+    - EXPLAIN ANALYZE vẫn thực thi câu lệnh nên dữ liệu thay đổi như bình thường, nhưng kết quả
+      trả về là kế hoạch thực thi: người gọi lấy số dòng từ kế hoạch (plan_inserted_rows)
+    """
+    operation = current_span()
+    if not INSTRUMENTATION_EXPLAIN or not isinstance(operation, Span):
+        cur.execute(query, params)
+        return None
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, params)
+    plan = cur.fetchone()[0][0]
+    operation.plans.append({'statement': ' '.join(query.split()), 'plan': plan})
+    return plan
+
+def plan_inserted_rows(plan):
+    """
+    Function to count the rows inserted by every INSERT node of an EXPLAIN ANALYZE @plan.
+    """
+    rows = 0
+    nodes = [plan['Plan']]
+    while nodes:
+        node = nodes.pop()
+        children = node.get('Plans', [])
+        if node['Node Type'] == 'ModifyTable' and node.get('Operation') == 'Insert' and children:
+            rows += children[0]['Actual Rows'] * children[0]['Actual Loops']
+        nodes.extend(children)
+    return int(rows)
+
+class MemorySink(object):
+    """
+    Instrumentation sink that keeps the events in memory (events), e.g. for tests and benchmarks.
+    """
+    
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+        
+    def emit(self, event):
+        with self.lock:
+            self.events.append(event)
+            
+    def clear(self):
+        with self.lock:
+            self.events = []
+
+class JsonlSink(object):
+    """
+    Instrumentation sink that appends each event as one JSON line to @path.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+        
+    def emit(self, event):
+        line = json.dumps(event, default=str, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+            
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class LoggingSink(object):
+    """
+    Instrumentation sink that writes each event to a logging.Logger (default: the 'Interface' logger).
+    Event đầy đủ nằm trong thuộc tính instrumentation của LogRecord.
+    """
+    
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logging.getLogger('Interface') if logger is None else logger
+        self.level = level
+        
+    def emit(self, event):
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, "%s/%s %.4fs rows=%s statements=%s roundtrips=%s",
+                            event['operation'], event['span'], event['seconds'], event['rows'],
+                            event['statements'], event['roundtrips'], extra={'instrumentation': event})
+
+def add_instrumentation_sink(sink):
+    """
+    Function to start sending instrumentation events to @sink (any object with an emit(event) method).
+    
+    Notes:
+    -----
+    - Instrumentation bật khi có ít nhất một sink; mỗi span kết thúc gửi một event (dict) gồm:
+      operation (hàm gốc), span, id, parent, depth, thread, start, seconds, rows, rowspersecond,
+      statements, roundtrips, attributes, error và plans (khi bật EXPLAIN, xem set_explain_capture)
+    """
+    global INSTRUMENTATION_SINKS
+    with INSTRUMENTATION_LOCK:
+        INSTRUMENTATION_SINKS = INSTRUMENTATION_SINKS + (sink,)
+
+def remove_instrumentation_sink(sink):
+    """
+    Function to stop sending instrumentation events to @sink.
+    """
+    global INSTRUMENTATION_SINKS
+    with INSTRUMENTATION_LOCK:
+        INSTRUMENTATION_SINKS = tuple(s for s in INSTRUMENTATION_SINKS if s is not sink)
+
+def set_explain_capture(enabled):
+    """
+    Function to turn on/off the capture of EXPLAIN (ANALYZE, BUFFERS) plans for the heavy statements (execute_heavy).
+    """
+    global INSTRUMENTATION_EXPLAIN
+    INSTRUMENTATION_EXPLAIN = bool(enabled)
+
+@contextmanager
+def instrumentation(*sinks, explain=False):
+    """
+    Context manager to send the events of the block to @sinks, optionally with EXPLAIN capture.
+    
+    Notes:
+    -----
+    - Ví dụ:
+        sink = MemorySink()
+        with instrumentation(sink):
+            rangepartition('ratings', 5, con)
+        print(sink.events)
+    """
+    previous = INSTRUMENTATION_EXPLAIN
+    for sink in sinks:
+        add_instrumentation_sink(sink)
+    set_explain_capture(explain)
+    try:
+        yield sinks[0] if len(sinks) == 1 else sinks
+    finally:
+        set_explain_capture(previous)
+        for sink in sinks:
+            remove_instrumentation_sink(sink)
+
+@instrumented
+def loadratings(ratingstablename, ratingsfilepath, openconnection):
+    """
+    Function to load data in @ratingsfilepath file to a table called @ratingstablename.
+    """
+    try:
+        start_time = time.time()
+        
+        # Tạo bảng với cấu trúc phù hợp cho file input
+        cur = openconnection.cursor()
+        with span('create'):
+            cur.execute(f"""
+            CREATE TABLE {ratingstablename} (
+                {USER_ID_COLNAME} INTEGER,
+                extra1 CHAR,
+                {MOVIE_ID_COLNAME} INTEGER,
+                extra2 CHAR,
+                {RATING_COLNAME} FLOAT,
+                extra3 CHAR,
+                timestamp BIGINT
+            )
+            """)
+        
+        # Copy trực tiếp từ file vào bảng
+        with span('copy') as phase, open(ratingsfilepath, 'r') as f:
+            cur.copy_from(f, ratingstablename, sep=':')
+            phase.add_rows(cur.rowcount)
+        current_span().add_rows(cur.rowcount)
+        
+        with span('finish'):
+            # Xóa các cột không cần thiết
+            cur.execute(f"""
+            ALTER TABLE {ratingstablename} 
+            DROP COLUMN extra1,
+            DROP COLUMN extra2,
+            DROP COLUMN extra3,
+            DROP COLUMN timestamp
+            """)
+            
+            # Thêm primary key
+            cur.execute(f"""
+            ALTER TABLE {ratingstablename} 
+            ADD PRIMARY KEY ({USER_ID_COLNAME}, {MOVIE_ID_COLNAME})
+            """)
+        
+        # Commit và đóng cursor
+        with span('commit'):
+            count_transaction_end(openconnection)
+            openconnection.commit()
+        cur.close()
+        
+        # Tính và in thời gian thực thi
+        end_time = time.time()
+        execution_time = end_time - start_time
+        print(f"Thời gian thực thi hàm loadratings: {execution_time:.2f} giây")
+        
+    except Exception as e:
+        openconnection.rollback()
+        print("Error: Could not load ratings from file")
+        print(e)
+        raise e
+
+def iter_line_chunks(buf, start, end, chunksize=LOAD_CHUNK_SIZE):
+    """
+    Function to split the byte range [@start, @end) of @buf into chunks that end on line boundaries.
+    
+    Parameters:
+    -----------
+    buf : mmap.mmap | bytes
+        Nội dung file ratings (thường là một mmap)
+    start, end : int
+        Khoảng byte cần chia
+    chunksize : int
+        Kích thước gần đúng của mỗi khối
+        
+    Returns:
+    --------
+    generator of (int, int)
+        Các cặp (vị trí bắt đầu, vị trí kết thúc) của từng khối
+    """
+    pos = start
+    while pos < end:
+        cut = min(pos + chunksize, end)
+        if cut < end:
+            # Kéo dài khối đến hết dòng hiện tại để không cắt đôi một bản ghi
+            newline = buf.find(b'\n', cut - 1, end)
+            cut = end if newline == -1 else newline + 1
+        yield pos, cut
+        pos = cut
+
+def parse_ratings_chunk(data):
+    """
+    Function to parse a block of 'userid::movieid::rating::timestamp' lines.
+    
+    Parameters:
+    -----------
+    data : bytes
+        Một khối gồm các dòng hoàn chỉnh của file ratings
+        
+    Returns:
+    --------
+    tuple
+        (userids, movieids, ratings) dạng mảng numpy nếu có numpy, ngược lại là list
+        
+    Raises:
+    -------
+    ValueError
+        Nếu khối chứa dòng không đúng định dạng
+        
+    Notes:
+    -----
+    - Với numpy: đếm dấu '::' của từng dòng bằng thao tác vector để kiểm tra số trường, rồi
+      tách toàn bộ khối một lần và chuyển từng cột (userid, movieid là số nguyên) bằng np.array
+    - Không có numpy: phân tích từng dòng bằng Python
+    """
+    data = bytes(data).rstrip()
+    if not data:
+        if np is not None:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+        return [], [], []
+    expected_rows = data.count(b'\n') + 1
+    
+    if np is not None:
+        # Mỗi dòng phải có đúng 3 dấu '::' (đếm theo dòng, không chỉ tổng số trường của cả khối)
+        raw = np.frombuffer(data, dtype=np.uint8)
+        newlines = np.flatnonzero(raw == ord('\n'))
+        separators = np.flatnonzero((raw[:-1] == ord(':')) & (raw[1:] == ord(':')))
+        perline = np.bincount(np.searchsorted(newlines, separators), minlength=expected_rows)
+        malformed = np.flatnonzero(perline != 3)
+        if malformed.size:
+            raise ValueError("Malformed ratings data: line {0} of the block does not have 4 fields".format(
+                int(malformed[0]) + 1))
+        fields = data.replace(b'::', b' ').split()
+        if len(fields) != expected_rows * 4:
+            raise ValueError("Malformed ratings data: expected {0} rows of 4 fields".format(expected_rows))
+        # userid/movieid phân tích như số nguyên nên giá trị như '3.7' bị từ chối thay vì bị cắt
+        return (np.array(fields[0::4], dtype=np.int32), np.array(fields[1::4], dtype=np.int32),
+                np.array(fields[2::4], dtype=np.float64))
+    
+    userids, movieids, ratings = [], [], []
+    for line in data.split(b'\n'):
+        fields = line.strip().split(b'::')
+        if len(fields) != 4:
+            raise ValueError("Malformed ratings line: {0!r}".format(line))
+        userids.append(int(fields[0]))
+        movieids.append(int(fields[1]))
+        ratings.append(float(fields[2]))
+    return userids, movieids, ratings
+
+def encode_binary_copy(userids, movieids, ratings):
+    """
+    Function to encode (userid, movieid, rating) columns as PostgreSQL binary COPY tuples.
+    
+    Parameters:
+    -----------
+    userids, movieids, ratings : sequence
+        Các cột dữ liệu (kết quả của parse_ratings_chunk)
+        
+    Returns:
+    --------
+    bytes
+        Dữ liệu các dòng (không gồm header/trailer)
+        
+    Notes:
+    -----
+    - Mỗi dòng: int16 số cột (3), rồi với mỗi cột là int32 độ dài + giá trị big-endian
+    - Với numpy: dựng một mảng có cấu trúc (30 byte/dòng) và lấy tobytes()
+    """
+    if np is not None:
+        rows = np.empty(len(userids), dtype=[
+            ('fields', '>i2'),
+            ('userid_len', '>i4'), ('userid', '>i4'),
+            ('movieid_len', '>i4'), ('movieid', '>i4'),
+            ('rating_len', '>i4'), ('rating', '>f8'),
+        ])
+        rows['fields'] = 3
+        rows['userid_len'] = 4
+        rows['userid'] = userids
+        rows['movieid_len'] = 4
+        rows['movieid'] = movieids
+        rows['rating_len'] = 8
+        rows['rating'] = ratings
+        return rows.tobytes()
+    
+    return b''.join(PGCOPY_ROW.pack(3, 4, u, 4, m, 8, r) for u, m, r in zip(userids, movieids, ratings))
+
+class CopyStream(object):
+    """
+    File-like wrapper over a generator of byte blocks, used as the source of cursor.copy_expert.
+    Cho phép stream dữ liệu lên server mà không cần dựng toàn bộ file binary trong bộ nhớ.
+    """
+    
+    def __init__(self, blocks):
+        self.blocks = iter(blocks)
+        self.buffer = b''
+        self.offset = 0
+        
+    def read(self, size=-1):
+        # Lấy thêm khối mới khi bộ đệm hiện tại đã được đọc hết
+        while self.offset >= len(self.buffer):
+            try:
+                self.buffer = next(self.blocks)
+                self.offset = 0
+            except StopIteration:
+                return b''
+        if size is None or size < 0:
+            size = len(self.buffer) - self.offset
+        data = self.buffer[self.offset:self.offset + size]
+        self.offset += len(data)
+        return data
+
+def binary_copy_blocks(buf, start, end, stats, chunksize=LOAD_CHUNK_SIZE):
+    """
+    Function to generate the full binary COPY payload for the lines in byte range [@start, @end).
+    Số dòng đã mã hóa được cộng dồn vào stats['rows'].
+    """
+    yield PGCOPY_HEADER
+    for chunk_start, chunk_end in iter_line_chunks(buf, start, end, chunksize):
+        userids, movieids, ratings = parse_ratings_chunk(buf[chunk_start:chunk_end])
+        stats['rows'] += len(userids)
+        yield encode_binary_copy(userids, movieids, ratings)
+    yield PGCOPY_TRAILER
+
+def copy_binary_ratings(cur, tablename, buf, start, end, chunksize=LOAD_CHUNK_SIZE):
+    """
+    Function to stream the ratings in byte range [@start, @end) of @buf into @tablename with binary COPY.
+    
+    Returns:
+    --------
+    int
+        Số dòng đã được COPY
+    """
+    stats = {'rows': 0}
+    stream = CopyStream(binary_copy_blocks(buf, start, end, stats, chunksize))
+    cur.copy_expert(
+        f"COPY {tablename} ({USER_ID_COLNAME}, {MOVIE_ID_COLNAME}, {RATING_COLNAME}) FROM STDIN WITH (FORMAT binary)",
+        stream, size=COPY_BUFFER_SIZE)
+    return stats['rows']
+
+@instrumented
+def loadratings_binary(ratingstablename, ratingsfilepath, openconnection, chunksize=LOAD_CHUNK_SIZE):
+    """
+    Function to load data in @ratingsfilepath file to a table called @ratingstablename using binary COPY.
+    
+    Parameters:
+    -----------
+    ratingstablename : str
+        Tên bảng ratings cần tạo
+    ratingsfilepath : str
+        Đường dẫn file ratings (định dạng userid::movieid::rating::timestamp)
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database
+    chunksize : int, optional
+        Kích thước (byte) mỗi khối được phân tích một lần
+        
+    Returns:
+    --------
+    dict
+        Thống kê: rows, bytes, seconds, rows_per_sec, mb_per_sec
+        
+    Notes:
+    -----
+    - File được ánh xạ vào bộ nhớ (mmap) và phân tích theo từng khối bằng numpy (vector hóa)
+    - Chỉ gửi đúng 3 cột userid, movieid, rating theo định dạng binary COPY, không cần
+      các cột phụ và không phải DROP COLUMN sau khi nạp
+    - Primary key được tạo sau khi nạp xong dữ liệu
+    """
+    try:
+        start_time = time.time()
+        
+        cur = openconnection.cursor()
+        with span('create'):
+            cur.execute(f"""
+            CREATE TABLE {ratingstablename} (
+                {USER_ID_COLNAME} INTEGER,
+                {MOVIE_ID_COLNAME} INTEGER,
+                {RATING_COLNAME} FLOAT
+            )
+            """)
+        
+        # Ánh xạ file vào bộ nhớ và stream binary COPY theo từng khối
+        rows = 0
+        with span('copy') as phase, open(ratingsfilepath, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    rows = copy_binary_ratings(cur, ratingstablename, buf, 0, size, chunksize)
+            phase.add_rows(rows)
+        
+        # Thêm primary key
+        with span('index'):
+            cur.execute(f"""
+            ALTER TABLE {ratingstablename} 
+            ADD PRIMARY KEY ({USER_ID_COLNAME}, {MOVIE_ID_COLNAME})
+            """)
+        
+        with span('commit'):
+            count_transaction_end(openconnection)
+            openconnection.commit()
+        cur.close()
+        
+        # Tính và in thời gian thực thi cùng thông lượng
+        execution_time = max(time.time() - start_time, 1e-9)
+        stats = {
+            'rows': rows,
+            'bytes': size,
+            'seconds': execution_time,
+            'rows_per_sec': rows / execution_time,
+            'mb_per_sec': size / execution_time / (1024 * 1024),
+        }
+        print(f"Thời gian thực thi hàm loadratings_binary: {execution_time:.2f} giây "
+              f"({stats['rows_per_sec']:.0f} dòng/giây, {stats['mb_per_sec']:.2f} MB/giây)")
+        return stats
+        
+    except Exception as e:
+        openconnection.rollback()
+        print("Error: Could not load ratings from file")
+        print(e)
+        raise e
+
+def connection_dbname(openconnection):
+    """
+    Function to get the database name of an open connection, so worker processes can connect to the same database.
+    """
+    return openconnection.get_dsn_parameters()['dbname']
+
+def split_line_ranges(buf, size, parts):
+    """
+    Function to split a file of @size bytes into at most @parts byte ranges that start and end on line boundaries.
+    
+    Returns:
+    --------
+    list of (int, int)
+        Các khoảng (vị trí bắt đầu, vị trí kết thúc), không chồng lấn và phủ toàn bộ file
+    """
+    ranges = []
+    start = 0
+    for i in range(1, parts + 1):
+        if start >= size:
+            break
+        cut = size if i == parts else max(size * i // parts, start)
+        if cut < size:
+            newline = buf.find(b'\n', max(cut - 1, start), size)
+            cut = size if newline == -1 else newline + 1
+        ranges.append((start, cut))
+        start = cut
+    return ranges
+
+def copy_ratings_range_worker(dbname, tablename, ratingsfilepath, start, end, chunksize=LOAD_CHUNK_SIZE):
+    """
+    Worker function (runs in a separate process) to binary COPY the lines in byte range [@start, @end)
+    of @ratingsfilepath into @tablename over its own connection.
+    
+    Returns:
+    --------
+    int
+        Số dòng đã nạp
+    """
+    con = getopenconnection(dbname=dbname)
+    try:
+        cur = con.cursor()
+        with open(ratingsfilepath, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                rows = copy_binary_ratings(cur, tablename, buf, start, end, chunksize)
+        con.commit()
+        cur.close()
+        return rows
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+
+@instrumented
+def loadratings_parallel(ratingstablename, ratingsfilepath, openconnection, workers=None, chunksize=LOAD_CHUNK_SIZE):
+    """
+    Function to load data in @ratingsfilepath file to a table called @ratingstablename
+    using several connections in parallel.
+    
+    Parameters:
+    -----------
+    ratingstablename : str
+        Tên bảng ratings cần tạo
+    ratingsfilepath : str
+        Đường dẫn file ratings
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database (dùng để tạo bảng và primary key)
+    workers : int, optional
+        Số tiến trình/kết nối nạp song song. Mặc định là số CPU
+    chunksize : int, optional
+        Kích thước (byte) mỗi khối được phân tích một lần trong từng tiến trình
+        
+    Returns:
+    --------
+    dict
+        Thống kê: rows, bytes, seconds, rows_per_sec, mb_per_sec, workers
+        
+    Notes:
+    -----
+    - File được chia thành các đoạn theo vị trí byte, mỗi đoạn kết thúc ở cuối một dòng
+    - Bảng được tạo dưới dạng UNLOGGED (bảng tạm) để các tiến trình COPY song song không ghi WAL
+    - Sau khi tất cả tiến trình xong: chuyển bảng sang LOGGED và tạo primary key một lần duy nhất
+    - Kết quả giống hệt loadratings tuần tự; nếu có lỗi thì bảng bị xóa
+    """
+    workers = workers or os.cpu_count() or 1
+    created = False
+    try:
+        start_time = time.time()
+        
+        # Tạo bảng UNLOGGED và commit để các kết nối khác nhìn thấy
+        cur = openconnection.cursor()
+        cur.execute(f"""
+        CREATE UNLOGGED TABLE {ratingstablename} (
+            {USER_ID_COLNAME} INTEGER,
+            {MOVIE_ID_COLNAME} INTEGER,
+            {RATING_COLNAME} FLOAT
+        )
+        """)
+        openconnection.commit()
+        created = True
+        
+        # Chia file theo ranh giới dòng và COPY song song từng đoạn
+        with open(ratingsfilepath, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    ranges = split_line_ranges(buf, size, workers)
+            else:
+                ranges = []
+        
+        dbname = connection_dbname(openconnection)
+        rows = 0
+        if ranges:
+            with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+                futures = [executor.submit(copy_ratings_range_worker, dbname, ratingstablename,
+                                           ratingsfilepath, start, end, chunksize)
+                           for start, end in ranges]
+                for future in futures:
+                    rows += future.result()
+        
+        # Chuyển bảng sang LOGGED và thêm primary key
+        cur.execute(f"ALTER TABLE {ratingstablename} SET LOGGED")
+        cur.execute(f"""
+        ALTER TABLE {ratingstablename} 
+        ADD PRIMARY KEY ({USER_ID_COLNAME}, {MOVIE_ID_COLNAME})
+        """)
+        
+        openconnection.commit()
+        cur.close()
+        
+        # Tính và in thời gian thực thi cùng thông lượng
+        execution_time = max(time.time() - start_time, 1e-9)
+        stats = {
+            'rows': rows,
+            'bytes': size,
+            'seconds': execution_time,
+            'rows_per_sec': rows / execution_time,
+            'mb_per_sec': size / execution_time / (1024 * 1024),
+            'workers': len(ranges),
+        }
+        print(f"Thời gian thực thi hàm loadratings_parallel: {execution_time:.2f} giây "
+              f"({stats['rows_per_sec']:.0f} dòng/giây, {stats['mb_per_sec']:.2f} MB/giây, {len(ranges)} tiến trình)")
+        return stats
+        
+    except Exception as e:
+        openconnection.rollback()
+        if created:
+            # Xóa bảng đã tạo (có thể chứa dữ liệu nạp dở từ các tiến trình khác)
+            cur = openconnection.cursor()
+            cur.execute(f"DROP TABLE IF EXISTS {ratingstablename}")
+            openconnection.commit()
+            cur.close()
+        print("Error: Could not load ratings from file in parallel")
+        print(e)
+        raise e
+
+def partition_rows(userids, movieids, ratings, indices, numberofpartitions):
+    """
+    Function to split parsed rating columns by target partition index.
+    Các dòng có index ngoài [0, numberofpartitions) bị bỏ qua; thứ tự trong từng phân mảnh giữ như trong file.
+    
+    Returns:
+    --------
+    list of tuple
+        Danh sách (userids, movieids, ratings) của từng phân mảnh
+    """
+    if np is not None:
+        indices = np.asarray(indices)
+        order = np.argsort(indices, kind='stable')
+        counts = np.bincount(indices[(indices >= 0) & (indices < numberofpartitions)],
+                             minlength=numberofpartitions)
+        # Bỏ qua các dòng có index âm (không thuộc phân mảnh nào) ở đầu mảng đã sắp xếp
+        offset = int(np.count_nonzero(indices < 0))
+        groups = []
+        for count in counts:
+            sel = order[offset:offset + count]
+            groups.append((userids[sel], movieids[sel], ratings[sel]))
+            offset += count
+        return groups
+    
+    groups = [([], [], []) for _ in range(numberofpartitions)]
+    for u, m, r, p in zip(userids, movieids, ratings, indices):
+        if 0 <= p < numberofpartitions:
+            groups[p][0].append(u)
+            groups[p][1].append(m)
+            groups[p][2].append(r)
+    return groups
+
+def copy_binary_columns(cur, tablename, userids, movieids, ratings):
+    """
+    Function to binary COPY already parsed (userid, movieid, rating) columns into @tablename.
+    """
+    stream = CopyStream([PGCOPY_HEADER, encode_binary_copy(userids, movieids, ratings), PGCOPY_TRAILER])
+    cur.copy_expert(
+        f"COPY {tablename} ({USER_ID_COLNAME}, {MOVIE_ID_COLNAME}, {RATING_COLNAME}) FROM STDIN WITH (FORMAT binary)",
+        stream, size=COPY_BUFFER_SIZE)
+
+def count_lines(buf, start, end):
+    """
+    Function to count the rating lines in byte range [@start, @end) of @buf (the last line may lack a newline).
+    """
+    lines = 0
+    for chunk_start, chunk_end in iter_line_chunks(buf, start, end):
+        lines += buf[chunk_start:chunk_end].count(b'\n')
+    if end > start and buf[end - 1:end] != b'\n':
+        lines += 1
+    return lines
+
+def rating_key(line):
+    """
+    Function to get the (userid, movieid) sort key of one raw rating line.
+    """
+    fields = line.strip().split(b'::')
+    return int(fields[0]), int(fields[1])
+
+def unsorted_ratings_error():
+    """
+    Function to build the error raised when a round robin direct load meets a file not sorted by (userid, movieid).
+    """
+    return ValueError("Ratings file is not sorted by ({0}, {1}); use loadratings + roundrobinpartition instead"
+                      .format(USER_ID_COLNAME, MOVIE_ID_COLNAME))
+
+def check_sorted_chunk(userids, movieids, previous_key):
+    """
+    Function to check that a parsed chunk is strictly sorted by (userid, movieid) and follows @previous_key.
+    
+    Returns:
+    --------
+    tuple or None
+        Khóa (userid, movieid) của dòng cuối cùng trong khối
+        
+    Raises:
+    -------
+    ValueError
+        Nếu khối không được sắp xếp theo (userid, movieid)
+    """
+    if len(userids) == 0:
+        return previous_key
+    if np is not None:
+        combined = (userids.astype(np.int64) << 32) | movieids.astype(np.int64)
+        in_order = bool(np.all(combined[1:] > combined[:-1]))
+    else:
+        in_order = all(a < b for a, b in zip(zip(userids, movieids), zip(userids[1:], movieids[1:])))
+    first_key = (int(userids[0]), int(movieids[0]))
+    if not in_order or (previous_key is not None and first_key <= previous_key):
+        raise unsorted_ratings_error()
+    return int(userids[-1]), int(movieids[-1])
+
+def shard_ratings_range_worker(dbname, ratingsfilepath, start, end, firstrow, scheme, numberofpartitions,
+                               prefix, ratingstablename, boundaries=None, chunksize=LOAD_CHUNK_SIZE):
+    """
+    Worker function (runs in a separate process) to shard the lines in byte range [@start, @end)
+    of @ratingsfilepath straight into the partition tables @prefix0..@prefixN-1 over its own connection.
+    
+    Parameters:
+    -----------
+    firstrow : int
+        Số thứ tự (bắt đầu từ 0) của dòng đầu tiên trong đoạn, dùng cho round robin
+    scheme : str
+        'range' hoặc 'roundrobin'
+    ratingstablename : str or None
+        Nếu khác None thì đồng thời COPY các dòng vào bảng ratings
+    boundaries : list of float, optional
+        Các mốc của phân mảnh range (chỉ dùng khi scheme là 'range')
+        
+    Returns:
+    --------
+    list of int
+        Số dòng đã ghi vào từng phân mảnh
+    """
+    con = getopenconnection(dbname=dbname)
+    try:
+        cur = con.cursor()
+        counts = [0] * numberofpartitions
+        row = firstrow
+        previous_key = None
+        with open(ratingsfilepath, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                for chunk_start, chunk_end in iter_line_chunks(buf, start, end, chunksize):
+                    userids, movieids, ratings = parse_ratings_chunk(buf[chunk_start:chunk_end])
+                    if scheme == 'range':
+                        indices = range_partition_indices(ratings, boundaries)
+                    else:
+                        # Vị trí round robin = thứ tự dòng theo (userid, movieid), yêu cầu file đã sắp xếp
+                        previous_key = check_sorted_chunk(userids, movieids, previous_key)
+                        if np is not None:
+                            indices = (np.arange(len(userids), dtype=np.int64) + row) % numberofpartitions
+                        else:
+                            indices = [(row + k) % numberofpartitions for k in range(len(userids))]
+                    row += len(userids)
+                    
+                    for i, (u, m, r) in enumerate(partition_rows(userids, movieids, ratings, indices,
+                                                                 numberofpartitions)):
+                        if len(u):
+                            copy_binary_columns(cur, prefix + str(i), u, m, r)
+                            counts[i] += len(u)
+                    if ratingstablename:
+                        copy_binary_columns(cur, ratingstablename, userids, movieids, ratings)
+        con.commit()
+        cur.close()
+        return counts
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+
+@instrumented
+def loadratings_partitioned(ratingstablename, ratingsfilepath, openconnection, scheme, numberofpartitions,
+                            loadratingstable=True, workers=None, chunksize=LOAD_CHUNK_SIZE, indexes=None):
+    """
+    Function to load @ratingsfilepath straight into range or round robin partitions, without a staging pass.
+    
+    Parameters:
+    -----------
+    ratingstablename : str
+        Tên bảng ratings
+    ratingsfilepath : str
+        Đường dẫn file ratings
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database
+    scheme : str
+        'range' (tạo range_part0..N-1) hoặc 'roundrobin' (tạo rrobin_part0..N-1)
+    numberofpartitions : int
+        Số phân mảnh
+    loadratingstable : bool, optional
+        Nếu True thì đồng thời tạo và nạp bảng ratings (kèm primary key)
+    workers : int, optional
+        Số tiến trình song song. Mặc định là số CPU
+    chunksize : int, optional
+        Kích thước (byte) mỗi khối được phân tích một lần
+    indexes : str or list of str, optional
+        Index trên các phân mảnh (xem parse_index_spec), được tạo song song sau khi nạp xong
+        
+    Returns:
+    --------
+    dict
+        Thống kê: rows, bytes, seconds, rows_per_sec, mb_per_sec, partition_rows, indexes
+        (thời gian tạo từng index)
+        
+    Notes:
+    -----
+    - Mỗi tiến trình đọc một đoạn file, tính phân mảnh của từng dòng và COPY thẳng vào
+      bảng phân mảnh tương ứng, nên dữ liệu chỉ đi qua một lần thay vì ba lần
+    - Range: dùng đúng các mốc chia đều của rangepartition (mode='uniform')
+    - Metadata của các phân mảnh được lưu vào partition_catalog như rangepartition/roundrobinpartition
+    - Round robin: dòng thứ k (theo thứ tự userid, movieid) vào phân mảnh k % N, giống
+      roundrobinpartition. Cách này yêu cầu file đã được sắp xếp theo (userid, movieid)
+      như file MovieLens; nếu không sẽ báo lỗi và cần dùng loadratings + roundrobinpartition
+    - Nếu có lỗi, tất cả các bảng đã tạo đều bị xóa
+    """
+    if scheme == 'range':
+        prefix = RANGE_TABLE_PREFIX
+    elif scheme == 'roundrobin':
+        prefix = RROBIN_TABLE_PREFIX
+    else:
+        raise ValueError("Unknown partitioning scheme: {0}".format(scheme))
+    if not isinstance(numberofpartitions, int) or numberofpartitions <= 0:
+        raise ValueError("Number of partitions must be a positive integer")
+    
+    workers = workers or os.cpu_count() or 1
+    indexes = parse_index_spec(indexes)
+    boundaries = uniform_range_boundaries(numberofpartitions) if scheme == 'range' else None
+    created = []
+    try:
+        start_time = time.time()
+        
+        # Tạo bảng ratings (UNLOGGED trong lúc nạp) và các bảng phân mảnh
+        cur = openconnection.cursor()
+        if loadratingstable:
+            cur.execute(f"""
+            CREATE UNLOGGED TABLE {ratingstablename} (
+                {USER_ID_COLNAME} INTEGER,
+                {MOVIE_ID_COLNAME} INTEGER,
+                {RATING_COLNAME} FLOAT
+            )
+            """)
+            created.append(ratingstablename)
+        for i in range(numberofpartitions):
+            create_partition_table(cur, prefix + str(i))
+            created.append(prefix + str(i))
+        openconnection.commit()
+        
+        # Chia file theo ranh giới dòng, tính số thứ tự dòng đầu tiên của mỗi đoạn
+        with open(ratingsfilepath, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            ranges, firstrows = [], []
+            if size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    ranges = split_line_ranges(buf, size, workers)
+                    row = 0
+                    for i, (start, end) in enumerate(ranges):
+                        firstrows.append(row)
+                        if scheme == 'roundrobin':
+                            row += count_lines(buf, start, end)
+                            # Kiểm tra thứ tự tại chỗ nối giữa hai đoạn liên tiếp
+                            if i > 0:
+                                last_line = buf[buf.rfind(b'\n', 0, start - 1) + 1:start]
+                                first_end = buf.find(b'\n', start, end)
+                                first_line = buf[start:end if first_end == -1 else first_end]
+                                if rating_key(first_line) <= rating_key(last_line):
+                                    raise unsorted_ratings_error()
+        
+        dbname = connection_dbname(openconnection)
+        partition_counts = [0] * numberofpartitions
+        if ranges:
+            with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+                futures = [executor.submit(shard_ratings_range_worker, dbname, ratingsfilepath, start, end,
+                                           firstrow, scheme, numberofpartitions, prefix,
+                                           ratingstablename if loadratingstable else None,
+                                           boundaries, chunksize)
+                           for (start, end), firstrow in zip(ranges, firstrows)]
+                for future in futures:
+                    for i, count in enumerate(future.result()):
+                        partition_counts[i] += count
+        
+        # Tạo index sau khi nạp dữ liệu, trước khi ghi metadata: nếu lỗi thì chưa có gì trỏ tới các bảng
+        index_timings = build_partition_indexes(openconnection, [prefix + str(i) for i in range(numberofpartitions)],
+                                                indexes)
+        
+        # Chuyển bảng ratings sang LOGGED và thêm primary key
+        if loadratingstable:
+            cur.execute(f"ALTER TABLE {ratingstablename} SET LOGGED")
+            cur.execute(f"""
+            ALTER TABLE {ratingstablename} 
+            ADD PRIMARY KEY ({USER_ID_COLNAME}, {MOVIE_ID_COLNAME})
+            """)
+        if scheme == 'range':
+            save_partition_metadata(cur, prefix, scheme, numberofpartitions, boundaries, 'uniform', indexes=indexes)
+        else:
+            save_partition_metadata(cur, prefix, scheme, numberofpartitions, nextslot=sum(partition_counts),
+                                    indexes=indexes)
+        
+        # Metadata được commit sau cùng
+        openconnection.commit()
+        cur.close()
+        
+        # Tính và in thời gian thực thi cùng thông lượng
+        execution_time = max(time.time() - start_time, 1e-9)
+        rows = sum(partition_counts)
+        stats = {
+            'rows': rows,
+            'bytes': size,
+            'seconds': execution_time,
+            'rows_per_sec': rows / execution_time,
+            'mb_per_sec': size / execution_time / (1024 * 1024),
+            'partition_rows': partition_counts,
+            'indexes': index_timings,
+        }
+        print(f"Thời gian thực thi hàm loadratings_partitioned: {execution_time:.2f} giây "
+              f"({stats['rows_per_sec']:.0f} dòng/giây, {stats['mb_per_sec']:.2f} MB/giây)")
+        return stats
+        
+    except Exception as e:
+        openconnection.rollback()
+        if created:
+            # Xóa các bảng đã tạo (có thể chứa dữ liệu nạp dở từ các tiến trình khác)
+            cur = openconnection.cursor()
+            for table_name in created:
+                cur.execute(f"DROP TABLE IF EXISTS {table_name}")
+            openconnection.commit()
+            cur.close()
+        invalidate_partition_cache(prefix)
+        print("Error: Could not load ratings into partitions")
+        print(e)
+        raise e
+
+@instrumented
+def loadratings_append(ratingstablename, ratingsfilepath, openconnection, growing=False, batchsize=LOAD_CHUNK_SIZE):
+    """
+    Function to append the unread part of @ratingsfilepath to the existing @ratingstablename table
+    and its existing range/round robin/hash partitions, resuming from the last checkpoint.
+    
+    Parameters:
+    -----------
+    ratingstablename : str
+        Tên bảng ratings đã tồn tại
+    ratingsfilepath : str
+        Đường dẫn file ratings (file mới hoặc file đang được ghi thêm)
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database
+    growing : bool, optional
+        True nếu file vẫn đang được ghi: chỉ đọc đến hết dòng hoàn chỉnh cuối cùng
+    batchsize : int, optional
+        Kích thước (byte) mỗi lô; mỗi lô là một transaction
+        
+    Returns:
+    --------
+    dict
+        Thống kê: rows, bytes, offset (vị trí checkpoint mới), seconds, rows_per_sec
+        
+    Notes:
+    -----
+    - Vị trí byte đã đọc của mỗi file được lưu trong bảng load_checkpoints
+    - Mỗi lô ghi vào ratings, các phân mảnh và cập nhật checkpoint trong cùng một transaction,
+      nên nếu bị dừng giữa chừng thì lần chạy sau tiếp tục đúng từ lô chưa được commit
+    - Range: dùng các mốc đã lưu của những phân mảnh range_part hiện có
+    - Round robin: mỗi lô lấy một dải vị trí liên tiếp từ bộ đếm trong partition_catalog, nên
+      dòng mới nằm ở đúng phân mảnh như khi gọi roundrobininsert lần lượt cho từng dòng
+    - Hash: băm theo khóa đã lưu của những phân mảnh hash_part hiện có
+    """
+    try:
+        start_time = time.time()
+        checkpoint_key = os.path.abspath(ratingsfilepath)
+        
+        with transaction(openconnection) as cur:
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS load_checkpoints (
+                filepath TEXT PRIMARY KEY,
+                byte_offset BIGINT NOT NULL,
+                rows_loaded BIGINT NOT NULL
+            )
+            """)
+            cur.execute("SELECT byte_offset, rows_loaded FROM load_checkpoints WHERE filepath = %s",
+                        (checkpoint_key,))
+            offset, rows_loaded = cur.fetchone() or (0, 0)
+            
+            # Phân mảnh được tạo khi chưa có partition_catalog: dùng mốc chia đều và số dòng hiện có
+            legacy_boundaries = None
+            if get_partition_metadata(RANGE_TABLE_PREFIX, openconnection) is None:
+                legacy_boundaries = get_range_boundaries(openconnection)
+            legacy_rrobin_count = 0
+            if get_partition_metadata(RROBIN_TABLE_PREFIX, openconnection) is None:
+                legacy_rrobin_count = count_partitions(RROBIN_TABLE_PREFIX, openconnection)
+            next_slot = 0
+            if legacy_rrobin_count:
+                cur.execute(f"SELECT COUNT(*) FROM {ratingstablename}")
+                next_slot = cur.fetchone()[0]
+            legacy_hash_count = 0
+            if get_partition_metadata(HASH_TABLE_PREFIX, openconnection) is None:
+                legacy_hash_count = count_partitions(HASH_TABLE_PREFIX, openconnection)
+        
+        rows = 0
+        start_offset = offset
+        with open(ratingsfilepath, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < offset:
+                raise ValueError("File {0} is shorter than its checkpoint ({1} bytes)".format(ratingsfilepath, offset))
+            if size > offset:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    end = size
+                    if growing:
+                        # Bỏ qua dòng cuối chưa ghi xong
+                        newline = buf.rfind(b'\n', offset, size)
+                        end = offset if newline == -1 else newline + 1
+                    
+                    for chunk_start, chunk_end in iter_line_chunks(buf, offset, end, batchsize):
+                        userids, movieids, ratings = parse_ratings_chunk(buf[chunk_start:chunk_end])
+                        with transaction(openconnection) as cur:
+                            if len(userids):
+                                copy_binary_columns(cur, ratingstablename, userids, movieids, ratings)
+                            
+                            # Range: định tuyến theo các mốc hiện tại (khóa metadata trong transaction)
+                            range_metadata = lock_partition_metadata(cur, RANGE_TABLE_PREFIX, openconnection)
+                            if range_metadata is not None:
+                                boundaries, tablenames = range_metadata['boundaries'], range_metadata['tablenames']
+                            else:
+                                boundaries = legacy_boundaries
+                                tablenames = [RANGE_TABLE_PREFIX + str(i)
+                                              for i in range(len(boundaries) - 1)] if boundaries else []
+                            if boundaries:
+                                write_partition_groups(cur, tablenames, userids, movieids, ratings,
+                                                       range_partition_indices(ratings, boundaries),
+                                                       partition_nodes(range_metadata), range_metadata)
+                            
+                            # Round robin: lấy một dải vị trí liên tiếp từ bộ đếm
+                            rrobin_metadata, first_slot = reserve_rrobin_batch(cur, len(userids), openconnection)
+                            if rrobin_metadata is not None:
+                                tablenames = rrobin_metadata['tablenames']
+                            else:
+                                first_slot = next_slot
+                                tablenames = [RROBIN_TABLE_PREFIX + str(i) for i in range(legacy_rrobin_count)]
+                            if tablenames:
+                                write_partition_groups(cur, tablenames, userids, movieids, ratings,
+                                                       rrobin_slot_indices(first_slot, len(userids), len(tablenames)),
+                                                       partition_nodes(rrobin_metadata), rrobin_metadata)
+                            
+                            # Hash: băm theo khóa đã lưu khi phân mảnh
+                            hash_metadata = lock_partition_metadata(cur, HASH_TABLE_PREFIX, openconnection)
+                            if hash_metadata is not None:
+                                tablenames = hash_metadata['tablenames']
+                            else:
+                                tablenames = [HASH_TABLE_PREFIX + str(i) for i in range(legacy_hash_count)]
+                            if tablenames:
+                                write_partition_groups(cur, tablenames, userids, movieids, ratings,
+                                                       hash_partition_indices(userids, movieids, len(tablenames),
+                                                                              hash_key_includes_movieid(hash_metadata)),
+                                                       metadata=hash_metadata)
+                            cur.execute("""
+                            INSERT INTO load_checkpoints (filepath, byte_offset, rows_loaded)
+                            VALUES (%s, %s, %s)
+                            ON CONFLICT (filepath) DO UPDATE
+                            SET byte_offset = EXCLUDED.byte_offset, rows_loaded = EXCLUDED.rows_loaded
+                            """, (checkpoint_key, chunk_end, rows_loaded + len(userids)))
+                        next_slot += len(userids)
+                        rows_loaded += len(userids)
+                        rows += len(userids)
+                        offset = chunk_end
+        
+        # Tính và in thời gian thực thi
+        execution_time = max(time.time() - start_time, 1e-9)
+        stats = {
+            'rows': rows,
+            'bytes': offset - start_offset,
+            'offset': offset,
+            'seconds': execution_time,
+            'rows_per_sec': rows / execution_time,
+        }
+        print(f"Thời gian thực thi hàm loadratings_append: {execution_time:.2f} giây "
+              f"({rows} dòng mới, checkpoint tại byte {offset})")
+        return stats
+        
+    except Exception as e:
+        print("Error: Could not append ratings from file")
+        print(e)
+        raise e
+
+def uniform_range_boundaries(numberofpartitions):
+    """
+    Function to compute the boundaries of @numberofpartitions equal-width range partitions over [0, 5.0].
+    
+    Returns:
+    --------
+    list of float
+        numberofpartitions + 1 mốc b0 <= b1 <= ... <= bN; phân mảnh 0 là [b0, b1],
+        phân mảnh i (i > 0) là (bi, bi+1]
+    """
+    delta = 5.0 / numberofpartitions
+    return [i * delta for i in range(numberofpartitions)] + [5.0]
+
+def equidepth_range_boundaries(histogram, numberofpartitions):
+    """
+    Function to compute range boundaries that balance row counts across partitions (equi-depth).
+    
+    Parameters:
+    -----------
+    histogram : list of (float, int)
+        Các cặp (giá trị rating, số dòng) đã sắp xếp tăng dần theo rating
+    numberofpartitions : int
+        Số phân mảnh
+        
+    Returns:
+    --------
+    list of float
+        numberofpartitions + 1 mốc, cùng quy ước với uniform_range_boundaries
+        
+    Notes:
+    -----
+    - Mốc thứ k được đặt tại giá trị rating có số dòng tích lũy gần với k * tổng / N nhất,
+      vì rating là giá trị rời rạc (nửa sao) nên không thể chia đều tuyệt đối
+    - Hai mốc đầu và cuối luôn bao trọn [0, 5.0] để các rating mới vẫn có phân mảnh
+    - Khi số giá trị khác nhau ít hơn số phân mảnh, một số phân mảnh sẽ rỗng (hai mốc bằng nhau)
+    """
+    values = [value for value, _ in histogram]
+    lower = min([0.0] + values)
+    upper = max([5.0] + values)
+    total = sum(count for _, count in histogram)
+    
+    cumulative = []
+    running = 0
+    for _, count in histogram:
+        running += count
+        cumulative.append(running)
+    
+    boundaries = [lower]
+    j = 0
+    for k in range(1, numberofpartitions):
+        if not histogram:
+            boundaries.append(lower + (upper - lower) * k / numberofpartitions)
+            continue
+        target = total * k / numberofpartitions
+        # Tiến tới giá trị có số dòng tích lũy gần mục tiêu nhất (không lùi lại mốc trước)
+        while j + 1 < len(cumulative) and abs(cumulative[j + 1] - target) <= abs(cumulative[j] - target):
+            j += 1
+        boundaries.append(max(values[j], boundaries[-1]))
+    boundaries.append(upper)
+    return boundaries
+
+def range_partition_indices(ratings, boundaries):
+    """
+    Function to compute the range partition index of each rating, with the same rules as rangepartition.
+    
+    Returns:
+    --------
+    numpy.ndarray or list of int
+        Index phân mảnh của từng rating, -1 nếu rating nằm ngoài [b0, bN]
+    """
+    numberofpartitions = len(boundaries) - 1
+    if np is not None:
+        ratings = np.asarray(ratings, dtype=np.float64)
+        indices = np.searchsorted(np.asarray(boundaries, dtype=np.float64), ratings, side='left') - 1
+        indices = np.maximum(indices, 0)
+        valid = (ratings >= boundaries[0]) & (ratings <= boundaries[-1])
+        return np.where(valid, np.minimum(indices, numberofpartitions - 1), -1)
+    
+    return [range_partition_index(rating, boundaries) for rating in ratings]
+
+def range_partition_index(rating, boundaries):
+    """
+    Function to find the range partition of a single @rating.
+    
+    Returns:
+    --------
+    int
+        Index phân mảnh, -1 nếu rating nằm ngoài [b0, bN]
+    """
+    if rating < boundaries[0] or rating > boundaries[-1]:
+        return -1
+    return min(max(bisect.bisect_left(boundaries, rating) - 1, 0), len(boundaries) - 2)
+
+def range_partition_expression(boundaries):
+    """
+    Function to build the SQL expression computing the range partition of a rating (same result as range_partition_index).
+    """
+    cases = ''.join(f" WHEN rating <= {float(boundary)!r} THEN {i}" for i, boundary in enumerate(boundaries[1:-1]))
+    return f"(CASE{cases} ELSE {len(boundaries) - 2} END)" if cases else "0"
+
+def hash_partition_expression(numberofpartitions, includemovieid=False):
+    """
+    Function to build the SQL expression computing the hash partition of a row (same result as hash_partition_index).
+    
+    Notes:
+    -----
+    - (userid * 2654435761) & 0xFFFFFFFF: nhân trên bigint không bị tràn vì userid là số nguyên 32 bit,
+      và phép & cho cùng kết quả với Python kể cả khi id âm
+    """
+    expression = f"((userid::bigint * {HASH_USER_MULTIPLIER}) & {HASH_MASK})"
+    if includemovieid:
+        expression = f"(({expression} + ((movieid::bigint * {HASH_MOVIE_MULTIPLIER}) & {HASH_MASK})) & {HASH_MASK})"
+    return f"({expression} % {numberofpartitions:d})"
+
+def hash_partition_index(userid, movieid, numberofpartitions, includemovieid=False):
+    """
+    Function to compute the hash partition of one row.
+    """
+    value = (userid * HASH_USER_MULTIPLIER) & HASH_MASK
+    if includemovieid:
+        value = (value + ((movieid * HASH_MOVIE_MULTIPLIER) & HASH_MASK)) & HASH_MASK
+    return value % numberofpartitions
+
+def hash_partition_indices(userids, movieids, numberofpartitions, includemovieid=False):
+    """
+    Function to compute the hash partition of every row of a block (vectorised when numpy is available).
+    """
+    if np is None or not isinstance(userids, np.ndarray):
+        return [hash_partition_index(u, m, numberofpartitions, includemovieid) for u, m in zip(userids, movieids)]
+    values = (userids.astype(np.int64) * HASH_USER_MULTIPLIER) & HASH_MASK
+    if includemovieid:
+        values = (values + ((movieids.astype(np.int64) * HASH_MOVIE_MULTIPLIER) & HASH_MASK)) & HASH_MASK
+    return values % numberofpartitions
+
+def hash_key_includes_movieid(metadata):
+    """
+    Function to tell whether the hash partitions described by @metadata hash on (userid, movieid).
+    """
+    return metadata is not None and metadata['mode'] == HASH_KEY_USER_MOVIE
+
+def ensure_partition_catalog(cur):
+    """
+    Function to create the partition_catalog table, which stores the metadata of each partitioned table set.
+    
+    Notes:
+    -----
+    - prefix: prefix tên bảng phân mảnh (khóa chính)
+    - scheme: 'range', 'roundrobin' hoặc 'hash'; mode: 'uniform'/'equidepth'/'split' với range,
+      khóa băm ('userid' hoặc 'userid,movieid') với hash
+    - boundaries: các mốc của phân mảnh range; tablenames: tên bảng của từng phân mảnh
+    - version: tăng mỗi khi metadata thay đổi, dùng để làm mất hiệu lực cache phía Python
+    - nextslot: với round robin, vị trí (số thứ tự) sẽ cấp cho dòng được insert tiếp theo
+    - migrationcount, migrationboundaries: số phân mảnh và các mốc đích khi đang repartition
+      (NULL nếu không có repartition nào đang chạy)
+    - indexes: index spec của các phân mảnh (xem parse_index_spec), được tạo lại trên các bảng
+      phân mảnh mới của repartition và splitrangepartition
+    - nodes: node chứa từng phân mảnh (tên database hoặc DSN, xem node_dsn); NULL (cả mảng hoặc
+      từng phần tử) là database của partition_catalog
+    - replicas: các node chứa bản sao của các phân mảnh (xem addreplica); NULL nếu không có
+    """
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS partition_catalog (
+        prefix TEXT PRIMARY KEY,
+        scheme TEXT NOT NULL,
+        mode TEXT,
+        numberofpartitions INTEGER NOT NULL,
+        boundaries FLOAT8[],
+        tablenames TEXT[] NOT NULL,
+        version BIGINT NOT NULL,
+        nextslot BIGINT,
+        migrationcount INTEGER,
+        migrationboundaries FLOAT8[],
+        indexes TEXT[],
+        nodes TEXT[],
+        replicas TEXT[]
+    )
+    """)
+    # Catalog tạo bởi phiên bản trước chưa có các cột mới
+    cur.execute("""
+    ALTER TABLE partition_catalog
+        ADD COLUMN IF NOT EXISTS nextslot BIGINT,
+        ADD COLUMN IF NOT EXISTS migrationcount INTEGER,
+        ADD COLUMN IF NOT EXISTS migrationboundaries FLOAT8[],
+        ADD COLUMN IF NOT EXISTS indexes TEXT[],
+        ADD COLUMN IF NOT EXISTS nodes TEXT[],
+        ADD COLUMN IF NOT EXISTS replicas TEXT[]
+    """)
+
+def save_partition_metadata(cur, prefix, scheme, numberofpartitions, boundaries=None, mode=None, nextslot=None,
+                            indexes=None, nodes=None):
+    """
+    Function to record (or replace) the metadata of the partitions with @prefix in partition_catalog.
+    
+    Notes:
+    -----
+    - version mới luôn lớn hơn version cũ và lấy từ txid_current(), nên không bị trùng lại
+      kể cả khi bảng partition_catalog bị xóa rồi tạo lại
+    - Các bản sao của prefix (nếu có) bị hủy đăng ký, cần addreplica lại sau khi phân mảnh lại
+    """
+    ensure_partition_catalog(cur)
+    tablenames = [prefix + str(i) for i in range(numberofpartitions)]
+    cur.execute("""
+    INSERT INTO partition_catalog (prefix, scheme, mode, numberofpartitions, boundaries, tablenames, version,
+                                   nextslot, indexes, nodes)
+    VALUES (%s, %s, %s, %s, %s, %s, txid_current(), %s, %s, %s)
+    ON CONFLICT (prefix) DO UPDATE
+    SET scheme = EXCLUDED.scheme,
+        mode = EXCLUDED.mode,
+        numberofpartitions = EXCLUDED.numberofpartitions,
+        boundaries = EXCLUDED.boundaries,
+        tablenames = EXCLUDED.tablenames,
+        version = GREATEST(EXCLUDED.version, partition_catalog.version + 1),
+        nextslot = EXCLUDED.nextslot,
+        migrationcount = NULL,
+        migrationboundaries = NULL,
+        indexes = EXCLUDED.indexes,
+        nodes = EXCLUDED.nodes,
+        replicas = NULL
+    """, (prefix, scheme, mode, numberofpartitions, boundaries, tablenames, nextslot, indexes or None, nodes))
+    # Các bản sao của phân mảnh cũ không còn dùng được
+    cur.execute("SELECT to_regclass('partition_replicas') IS NOT NULL")
+    if cur.fetchone()[0]:
+        cur.execute("DELETE FROM partition_replicas WHERE prefix = %s", (prefix,))
+        cur.execute("DELETE FROM partition_insert_log WHERE prefix = %s", (prefix,))
+    invalidate_partition_cache(prefix)
+
+def connection_key(openconnection):
+    """
+    Function to identify the database behind @openconnection, used as the key of the metadata cache.
+    """
+    params = openconnection.get_dsn_parameters()
+    return params.get('host'), params.get('port'), params.get('dbname')
+
+def invalidate_partition_cache(prefix=None):
+    """
+    Function to drop cached partition metadata (of one @prefix, or of everything).
+    """
+    for key in list(PARTITION_METADATA_CACHE):
+        if prefix is None or key[-1] == prefix:
+            PARTITION_METADATA_CACHE.pop(key, None)
+
+def get_partition_metadata(prefix, openconnection, refresh=False):
+    """
+    Function to get the catalog entry of the partitions with @prefix, served from an in-process cache.
+    
+    Parameters:
+    -----------
+    prefix : str
+        Prefix tên bảng phân mảnh (RANGE_TABLE_PREFIX, RROBIN_TABLE_PREFIX)
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database
+    refresh : bool, optional
+        True để bỏ qua cache và đọc lại từ partition_catalog
+        
+    Returns:
+    --------
+    dict or None
+        prefix, scheme, mode, numberofpartitions, boundaries, tablenames, version,
+        migrationcount, migrationboundaries, indexes, nodes, replicas; None nếu chưa có metadata
+        
+    Notes:
+    -----
+    - Chỉ đọc database lần đầu (hoặc khi refresh); các lần sau là tra cứu trong bộ nhớ
+    - Các hàm ghi dùng version trong metadata để kiểm tra cache còn đúng ngay trong câu
+      INSERT (xem guarded_partition_insert), nên không tốn thêm round trip nào
+    """
+    key = connection_key(openconnection) + (prefix,)
+    metadata = None if refresh else PARTITION_METADATA_CACHE.get(key)
+    if metadata is None:
+        cur = openconnection.cursor()
+        cur.execute("SELECT to_regclass('partition_catalog') IS NOT NULL")
+        if cur.fetchone()[0]:
+            cur.execute(f"SELECT {', '.join(PARTITION_METADATA_COLUMNS)} FROM partition_catalog WHERE prefix = %s",
+                        (prefix,))
+            row = cur.fetchone()
+            if row:
+                metadata = dict(zip(PARTITION_METADATA_COLUMNS, row))
+                PARTITION_METADATA_CACHE[key] = metadata
+        if metadata is None:
+            PARTITION_METADATA_CACHE.pop(key, None)
+        cur.close()
+    return metadata
+
+def refresh_partition_cache(openconnection):
+    """
+    Function to reload the metadata of every prefix from partition_catalog with one query.
+    
+    Notes:
+    -----
+    - Các hàm đọc (rangequery, pointquery, aggregatequery) gọi hàm này trước khi chọn phân mảnh,
+      nên luôn thấy số phân mảnh mới nhất kể cả khi một tiến trình khác vừa repartition
+    """
+    base = connection_key(openconnection)
+    for key in list(PARTITION_METADATA_CACHE):
+        if key[:-1] == base:
+            PARTITION_METADATA_CACHE.pop(key, None)
+    cur = openconnection.cursor()
+    cur.execute("SELECT to_regclass('partition_catalog') IS NOT NULL")
+    if cur.fetchone()[0]:
+        cur.execute(f"SELECT {', '.join(PARTITION_METADATA_COLUMNS)} FROM partition_catalog")
+        for row in cur.fetchall():
+            metadata = dict(zip(PARTITION_METADATA_COLUMNS, row))
+            PARTITION_METADATA_CACHE[base + (metadata['prefix'],)] = metadata
+    cur.close()
+
+def check_partition_writable(metadata):
+    """
+    Function to reject writes to partitions that are being repartitioned.
+    """
+    if metadata is not None and metadata['migrationcount'] is not None:
+        raise RuntimeError("Partitions {0} are being repartitioned, writes are rejected until it finishes"
+                           .format(metadata['prefix']))
+
+def placement_nodes(nodes, numberofpartitions):
+    """
+    Function to place @numberofpartitions partitions on @nodes: partition i goes to nodes[i % len(nodes)].
+    """
+    if isinstance(nodes, str):
+        nodes = [nodes]
+    nodes = list(nodes)
+    if not nodes:
+        raise ValueError("At least one node is required")
+    return [nodes[i % len(nodes)] for i in range(numberofpartitions)]
+
+def partition_nodes(metadata):
+    """
+    Function to get the node of every partition described by @metadata (None when all of them are local).
+    """
+    if metadata is None or not metadata['nodes']:
+        return None
+    return list(metadata['nodes'])
+
+def partition_placement(openconnection):
+    """
+    Function to map the partition tables placed on other nodes to their node, from the cached metadata.
+    
+    Returns:
+    --------
+    dict
+        Tên bảng phân mảnh -> node; các bảng nằm trên database của @openconnection không có trong dict
+        
+    Notes:
+    -----
+    - Dùng metadata trong cache; các hàm truy vấn gọi refresh_partition_cache trước
+    """
+    base = connection_key(openconnection)
+    placement = {}
+    for key, metadata in list(PARTITION_METADATA_CACHE.items()):
+        if key[:-1] == base and metadata['nodes']:
+            placement.update((tablename, node) for tablename, node in zip(metadata['tablenames'], metadata['nodes'])
+                             if node is not None)
+    return placement
+
+def check_local_partitions(metadata):
+    """
+    Function to reject maintenance operations on partitions placed on other nodes.
+    """
+    if any(partition_nodes(metadata) or ()):
+        raise ValueError("Partitions {0} are placed on other nodes; this operation only supports local partitions"
+                         .format(metadata['prefix']))
+
+def check_unreplicated_partitions(metadata):
+    """
+    Function to reject operations that move rows between partitions while the partitions have replicas.
+    """
+    if metadata is not None and metadata['replicas']:
+        raise ValueError("Partitions {0} have replicas; remove them (removereplica) before this operation"
+                         .format(metadata['prefix']))
+
+def log_partition_rows(cur, metadata, tablename, userids, movieids, ratings):
+    """
+    Function to append the rows written to @tablename to the insert log, if the partitions of @metadata have replicas.
+    
+    Notes:
+    -----
+    - Ghi trong cùng transaction với dòng dữ liệu; cột xid (pg_current_xact_id) cho biết dòng
+      log thuộc transaction nào, dùng để đồng bộ bản sao (xem syncreplicas)
+    """
+    if metadata is None or not metadata['replicas']:
+        return
+    cur.execute("""
+    INSERT INTO partition_insert_log (prefix, tablename, userid, movieid, rating)
+    SELECT %s, %s, u, m, r FROM unnest(%s::INTEGER[], %s::INTEGER[], %s::FLOAT8[]) AS logged (u, m, r)
+    """, (metadata['prefix'], tablename, [int(value) for value in userids], [int(value) for value in movieids],
+          [float(value) for value in ratings]))
+
+def insert_partition_row(cur, node, tablename, userid, itemid, rating):
+    """
+    Function to insert one row into @tablename, on the current transaction or on @node.
+    
+    Notes:
+    -----
+    - Dòng trên node khác được ghi và commit bằng một kết nối của pool của node đó, trước khi
+      transaction hiện tại (trên database của partition_catalog) commit; không có two-phase
+      commit nên nếu commit sau đó lỗi, dòng vẫn nằm trên node
+    """
+    query = f"INSERT INTO {tablename} (userid, movieid, rating) VALUES (%s, %s, %s)"
+    if node is None:
+        cur.execute(query, (userid, itemid, rating))
+        return
+    with get_node_pool(cur.connection, node).connection() as con:
+        nodecur = con.cursor()
+        nodecur.execute(query, (userid, itemid, rating))
+        con.commit()
+        nodecur.close()
+
+def guarded_partition_insert(cur, metadata, tablename, userid, itemid, rating, node=None):
+    """
+    Function to insert one row into @tablename only if the catalog version still equals the cached one.
+    
+    Returns:
+    --------
+    bool
+        False nếu metadata trong cache đã cũ (không có dòng nào được insert)
+        
+    Notes:
+    -----
+    - Dòng metadata được khóa FOR SHARE đến hết transaction: repartition phải chờ các insert
+      đang chạy kết thúc, và insert bắt đầu sau khi metadata thay đổi sẽ thấy version mới
+    - Dòng metadata được khóa trước bảng phân mảnh, cùng thứ tự với các hàm insert theo lô
+      (lock_partition_metadata), repartition và splitrangepartition, để không bị deadlock
+    - Câu khóa và câu INSERT được gửi chung một lần (một round trip); PostgreSQL chỉ khóa bảng
+      khi bắt đầu xử lý câu INSERT, tức là sau khi đã khóa dòng metadata
+    - Phân mảnh trên node khác (@node): kiểm tra và khóa version trước, rồi mới ghi lên node
+    - Phân mảnh có bản sao: dòng được ghi thêm vào insert log (xem log_partition_rows)
+    """
+    if node is not None:
+        cur.execute("SELECT 1 FROM partition_catalog WHERE prefix = %s AND version = %s FOR SHARE",
+                    (metadata['prefix'], metadata['version']))
+        if cur.fetchone() is None:
+            return False
+        insert_partition_row(cur, node, tablename, userid, itemid, rating)
+        return True
+    cur.execute(f"""
+    SELECT 1 FROM partition_catalog WHERE prefix = %s AND version = %s FOR SHARE;
+    INSERT INTO {tablename} (userid, movieid, rating)
+    SELECT %s, %s, %s
+    WHERE EXISTS (SELECT 1 FROM partition_catalog WHERE prefix = %s AND version = %s)
+    """, (metadata['prefix'], metadata['version'], userid, itemid, rating, metadata['prefix'], metadata['version']))
+    current_span().count(statements=1)
+    if cur.rowcount != 1:
+        return False
+    log_partition_rows(cur, metadata, tablename, [userid], [itemid], [rating])
+    return True
+
+def reserve_rrobin_slots(cur, metadata, count):
+    """
+    Function to reserve @count consecutive round robin slots from the counter in partition_catalog.
+    
+    Returns:
+    --------
+    int or None
+        Vị trí đầu tiên được cấp; None nếu metadata trong cache đã cũ
+        
+    Notes:
+    -----
+    - Chỉ cập nhật một dòng theo khóa chính nên tốn thời gian O(1), thay cho COUNT(*) trên ratings
+    - Dòng bộ đếm bị khóa đến khi transaction kết thúc, nên các transaction insert đồng thời
+      nhận các vị trí khác nhau và không có vị trí nào bị bỏ trống khi rollback
+    """
+    cur.execute("""
+    UPDATE partition_catalog SET nextslot = nextslot + %s
+    WHERE prefix = %s AND version = %s
+    RETURNING nextslot - %s
+    """, (count, metadata['prefix'], metadata['version'], count))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def reserve_rrobin_batch(cur, count, openconnection):
+    """
+    Function to reserve @count round robin slots, refreshing the cached metadata when it is stale.
+    
+    Returns:
+    --------
+    tuple
+        (metadata, vị trí đầu tiên); (None, None) nếu chưa có partition_catalog cho round robin
+        
+    Notes:
+    -----
+    - Không khóa FOR SHARE trước (xem lock_partition_metadata): hai transaction cùng giữ khóa
+      share rồi cùng UPDATE dòng bộ đếm sẽ deadlock. Khóa của câu UPDATE cũng đã giữ metadata
+      không bị thay đổi cho đến khi transaction kết thúc
+    """
+    for attempt in range(METADATA_RETRIES):
+        metadata = get_partition_metadata(RROBIN_TABLE_PREFIX, openconnection, refresh=attempt > 0)
+        if metadata is None:
+            return None, None
+        check_partition_writable(metadata)
+        first_slot = reserve_rrobin_slots(cur, metadata, count)
+        if first_slot is not None:
+            return metadata, first_slot
+    raise RuntimeError("Partition metadata for {0} keeps changing".format(RROBIN_TABLE_PREFIX))
+
+def write_partition_groups(cur, tablenames, userids, movieids, ratings, indices, nodes=None, metadata=None):
+    """
+    Function to binary COPY every group of rows into its partition table (rows with index -1 are skipped).
+    
+    Parameters:
+    -----------
+    nodes : list, optional
+        Node của từng phân mảnh (xem partition_nodes); None là tất cả nằm trên database của @cur
+    metadata : dict, optional
+        Metadata của các phân mảnh; nếu chúng có bản sao, các dòng được ghi thêm vào insert log
+        
+    Returns:
+    --------
+    dict
+        Số dòng đã ghi vào từng bảng phân mảnh
+        
+    Notes:
+    -----
+    - Các nhóm của cùng một node khác được ghi trên một kết nối và commit một lần; các node
+      được ghi song song, trước khi transaction của @cur commit (xem insert_partition_row)
+    """
+    counts = {}
+    remote = {}  # node -> các nhóm dòng cần ghi lên node đó
+    for i, (u, m, r) in enumerate(partition_rows(userids, movieids, ratings, indices, len(tablenames))):
+        counts[tablenames[i]] = len(u)
+        if not len(u):
+            continue
+        if nodes is None or nodes[i] is None:
+            copy_binary_columns(cur, tablenames[i], u, m, r)
+            log_partition_rows(cur, metadata, tablenames[i], u, m, r)
+        else:
+            remote.setdefault(nodes[i], []).append((tablenames[i], u, m, r))
+    
+    def write_node(node, groups):
+        with get_node_pool(cur.connection, node).connection() as con:
+            nodecur = con.cursor()
+            for tablename, u, m, r in groups:
+                copy_binary_columns(nodecur, tablename, u, m, r)
+            con.commit()
+            nodecur.close()
+    
+    if len(remote) == 1:
+        write_node(*next(iter(remote.items())))
+    elif remote:
+        with ThreadPoolExecutor(max_workers=len(remote)) as executor:
+            for future in [executor.submit(write_node, node, groups) for node, groups in remote.items()]:
+                future.result()
+    return counts
+
+def rrobin_slot_indices(first_slot, count, numberofpartitions):
+    """
+    Function to compute the round robin partition of @count rows holding slots first_slot, first_slot + 1, ...
+    """
+    if np is not None:
+        return (np.arange(count, dtype=np.int64) + first_slot) % numberofpartitions
+    return [(first_slot + k) % numberofpartitions for k in range(count)]
+
+def get_range_boundaries(openconnection):
+    """
+    Function to get the persisted boundaries of the range partitions.
+    
+    Returns:
+    --------
+    list of float or None
+        Các mốc đã lưu trong partition_catalog; nếu chưa có thì tính mốc chia đều theo
+        số bảng range_part hiện có (None nếu không có phân mảnh nào)
+    """
+    metadata = get_partition_metadata(RANGE_TABLE_PREFIX, openconnection)
+    if metadata is not None:
+        return metadata['boundaries']
+    numberofpartitions = count_partitions(RANGE_TABLE_PREFIX, openconnection)
+    return uniform_range_boundaries(numberofpartitions) if numberofpartitions else None
+
+def range_rating_histogram(cur, ratingstablename, sample_percent=None):
+    """
+    Function to get the (rating, count) histogram of @ratingstablename, optionally from a TABLESAMPLE.
+    """
+    sample = f" TABLESAMPLE SYSTEM ({float(sample_percent)})" if sample_percent else ""
+    cur.execute(f"""
+        SELECT {RATING_COLNAME}, COUNT(*)
+        FROM {ratingstablename}{sample}
+        GROUP BY {RATING_COLNAME}
+        ORDER BY {RATING_COLNAME}
+    """)
+    return cur.fetchall()
+
+def create_partition_table(cur, table_name, indexes=None):
+    """
+    Function to create one empty partition table with the (userid, movieid, rating) layout (and the @indexes spec).
+    """
+    cur.execute(f"""
+        CREATE TABLE {table_name} (
+            userid INTEGER,
+            movieid INTEGER,
+            rating FLOAT
+        )
+    """)
+    for spec in indexes or ():
+        cur.execute(partition_index_definition(table_name, spec)[1])
+
+def parse_index_spec(indexes):
+    """
+    Function to validate an index spec and normalise it to a list of strings such as 'btree(userid,movieid)'.
+    
+    Parameters:
+    -----------
+    indexes : str or list of str or None
+        Một hoặc nhiều index dạng 'phương_thức(cột, ...)', ví dụ
+        ['btree(userid, movieid)', 'brin(rating)', 'unique(userid, movieid)']
+        
+    Returns:
+    --------
+    list of str
+        Các index đã chuẩn hóa (chữ thường, không có khoảng trắng); [] nếu indexes là None
+        
+    Notes:
+    -----
+    - Phương thức: btree, brin, hash (chỉ một cột) hoặc unique (btree kèm ràng buộc duy nhất)
+    - Cột: userid, movieid, rating
+    """
+    if indexes is None:
+        return []
+    if isinstance(indexes, str):
+        indexes = [indexes]
+    normalised = []
+    for spec in indexes:
+        match = re.fullmatch(r"\s*(\w+)\s*\(([^()]*)\)\s*", spec)
+        if match is None:
+            raise ValueError("Invalid index spec: {0!r}".format(spec))
+        method = match.group(1).lower()
+        columns = [column.strip().lower() for column in match.group(2).split(',')]
+        if method not in PARTITION_INDEX_METHODS:
+            raise ValueError("Unknown index method in {0!r}, expected one of {1}".format(spec, PARTITION_INDEX_METHODS))
+        if any(column not in PARTITION_INDEX_COLUMNS for column in columns) or len(set(columns)) != len(columns):
+            raise ValueError("Invalid index columns in {0!r}, expected distinct columns of {1}".format(
+                spec, PARTITION_INDEX_COLUMNS))
+        if method == 'hash' and len(columns) != 1:
+            raise ValueError("Hash indexes support a single column: {0!r}".format(spec))
+        normalised.append(f"{method}({','.join(columns)})")
+    if len(set(normalised)) != len(normalised):
+        raise ValueError("Duplicate index in spec: {0!r}".format(indexes))
+    return normalised
+
+def partition_index_definition(table_name, spec):
+    """
+    Function to get the (index name, CREATE INDEX statement) of a normalised index @spec on @table_name.
+    """
+    method, columns = spec[:-1].split('(')
+    columns = columns.split(',')
+    name = f"{table_name}_{'_'.join(columns)}_{'key' if method == 'unique' else method}"
+    if method == 'unique':
+        return name, f"CREATE UNIQUE INDEX {name} ON {table_name} ({', '.join(columns)})"
+    return name, f"CREATE INDEX {name} ON {table_name} USING {method} ({', '.join(columns)})"
+
+def rename_partition_table(cur, old_name, new_name):
+    """
+    Function to rename a partition table together with its indexes (whose names start with the table name).
+    """
+    cur.execute("SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = %s::regclass", (old_name,))
+    indexnames = [row[0] for row in cur.fetchall()]
+    cur.execute(f"ALTER TABLE {old_name} RENAME TO {new_name}")
+    for indexname in indexnames:
+        if indexname.startswith(old_name + '_'):
+            cur.execute(f"ALTER INDEX {indexname} RENAME TO {new_name}{indexname[len(old_name):]}")
+
+@instrumented
+def build_partition_indexes(openconnection, tablenames, indexes, nodes=None):
+    """
+    Function to build the @indexes spec on the (already filled and committed) @tablenames, concurrently.
+    
+    Parameters:
+    -----------
+    openconnection : psycopg2.extensions.connection
+        Kết nối gốc (dùng để lấy tên database và dọn dẹp khi lỗi)
+    tablenames : list of str
+        Các bảng phân mảnh
+    indexes : list of str
+        Index spec đã chuẩn hóa (parse_index_spec)
+    nodes : list, optional
+        Node chứa từng bảng trong @tablenames (xem partition_nodes); None là database của @openconnection
+        
+    Returns:
+    --------
+    list of dict
+        Với mỗi index: table, index, spec, seconds (thời gian tạo)
+        
+    Notes:
+    -----
+    - Index được tạo sau khi nạp dữ liệu (nhanh hơn nhiều so với cập nhật index trong lúc nạp)
+    - Mỗi index là một việc riêng; các việc chạy song song trên các kết nối của pool, nên các
+      phân mảnh khác nhau được tạo index cùng lúc
+    - Nếu một index lỗi (ví dụ dữ liệu trùng với unique), các index đã tạo ở bước này bị xóa
+    """
+    tasks = [(tablename, spec) for spec in indexes for tablename in tablenames]
+    if not tasks:
+        return []
+    pool = get_connection_pool(connection_dbname(openconnection))
+    tablenodes = dict(zip(tablenames, nodes or [None] * len(tablenames)))
+    created = []
+    created_lock = threading.Lock()
+    parent = current_span()
+    
+    def build(tablename, spec):
+        name, statement = partition_index_definition(tablename, spec)
+        with span('index', parent, table=tablename, index=name), \
+                get_node_pool(openconnection, tablenodes[tablename]).connection() as con:
+            cur = con.cursor()
+            start_time = time.time()
+            cur.execute(statement)
+            con.commit()
+            execution_time = time.time() - start_time
+            cur.close()
+        with created_lock:
+            created.append((tablenodes[tablename], name))
+        print(f"Thời gian tạo index {name}: {execution_time:.2f} giây")
+        return {'table': tablename, 'index': name, 'spec': spec, 'seconds': execution_time}
+    
+    with ThreadPoolExecutor(max_workers=min(len(tasks), pool.maxconn)) as executor:
+        futures = [executor.submit(build, tablename, spec) for tablename, spec in tasks]
+        try:
+            return [future.result() for future in futures]
+        except Exception:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+            for node, name in created:
+                with get_node_pool(openconnection, node).connection() as con:
+                    cur = con.cursor()
+                    cur.execute(f"DROP INDEX IF EXISTS {name}")
+                    con.commit()
+                    cur.close()
+            raise
+
+def fill_range_partition(cur, ratingstablename, i, min_range, max_range):
+    """
+    Function to copy the rows of @ratingstablename whose rating falls in partition @i into range_part@i.
+    Returns the number of rows copied.
+    """
+    table_name = RANGE_TABLE_PREFIX + str(i)
+    if i == 0:
+        # Phân mảnh đầu tiên: [min_range, max_range]
+        plan = execute_heavy(cur, f"""
+            INSERT INTO {table_name} (userid, movieid, rating)
+            SELECT userid, movieid, rating
+            FROM {ratingstablename}
+            WHERE rating >= {min_range} AND rating <= {max_range}
+        """)
+    else:
+        # Các phân mảnh còn lại: (min_range, max_range]
+        plan = execute_heavy(cur, f"""
+            INSERT INTO {table_name} (userid, movieid, rating)
+            SELECT userid, movieid, rating
+            FROM {ratingstablename}
+            WHERE rating > {min_range} AND rating <= {max_range}
+        """)
+    return cur.rowcount if plan is None else plan_inserted_rows(plan)
+
+def rrobin_numbered_table(ratingstablename):
+    """
+    Function to get the name of the table holding the rows of @ratingstablename numbered for round robin partitioning.
+    """
+    return ratingstablename + '_rrobin_numbered'
+
+def number_rrobin_rows(cur, ratingstablename, numberofpartitions):
+    """
+    Function to number the rows of @ratingstablename once (ordered by userid, movieid) into an UNLOGGED table
+    that stores the round robin partition of each row.
+    
+    Returns:
+    --------
+    int
+        Số dòng đã đánh số
+        
+    Notes:
+    -----
+    - Chỉ sắp xếp ratings một lần; các kết nối song song đọc phần của mình từ bảng này
+      (fill_rrobin_partition) thay vì mỗi kết nối tự đánh số lại toàn bộ bảng
+    - Người gọi phải commit để các kết nối khác nhìn thấy bảng và xóa bảng khi xong
+    """
+    numbered = rrobin_numbered_table(ratingstablename)
+    cur.execute(f"DROP TABLE IF EXISTS {numbered}")
+    plan = execute_heavy(cur, f"""
+        CREATE UNLOGGED TABLE {numbered} AS
+        SELECT userid, movieid, rating,
+               (ROW_NUMBER() OVER (ORDER BY userid, movieid) - 1) % {numberofpartitions} AS partition_index
+        FROM {ratingstablename}
+    """)
+    if plan is not None:
+        return plan['Plan']['Actual Rows']
+    return cur.rowcount
+
+def fill_rrobin_partition(cur, ratingstablename, i):
+    """
+    Function to copy the rows numbered into partition @i (see number_rrobin_rows) into rrobin_part@i.
+    """
+    execute_heavy(cur, f"""
+        INSERT INTO {RROBIN_TABLE_PREFIX}{i} (userid, movieid, rating)
+        SELECT userid, movieid, rating
+        FROM {rrobin_numbered_table(ratingstablename)}
+        WHERE partition_index = {i}
+    """)
+
+def fill_partitions(cur, ratingstablename, prefix, numberofpartitions, partitionindex):
+    """
+    Function to fill every @prefix partition table with one set-based statement.
+    
+    Parameters:
+    -----------
+    partitionindex : str
+        Biểu thức SQL tính phân mảnh (0..numberofpartitions-1) của mỗi dòng trong bảng ratings
+        
+    Returns:
+    --------
+    int
+        Tổng số dòng đã phân phối
+        
+    Notes:
+    -----
+    - CTE numbered tính phân mảnh của các dòng một lần duy nhất; vì được tham chiếu nhiều
+      lần nên PostgreSQL chỉ tính nó một lần
+    - Mỗi phân mảnh là một INSERT ... SELECT (data-modifying CTE) trên kết quả đã tính,
+      cùng nằm trong một câu lệnh
+    """
+    plan = execute_heavy(cur, f"""
+        WITH numbered AS (
+            SELECT userid, movieid, rating, {partitionindex} AS partition_index
+            FROM {ratingstablename}
+        ){partition_insert_ctes(prefix, numberofpartitions, 'numbered')}
+        SELECT COUNT(*) FROM numbered
+    """)
+    return cur.fetchone()[0] if plan is None else plan_inserted_rows(plan)
+
+def partition_insert_ctes(prefix, numberofpartitions, source):
+    """
+    Function to build the data-modifying CTEs that insert the rows of CTE @source into @prefix0..N-1
+    according to their partition_index column.
+    """
+    return ''.join(f""",
+        insert_{i} AS (
+            INSERT INTO {prefix}{i} (userid, movieid, rating)
+            SELECT userid, movieid, rating FROM {source} WHERE partition_index = {i}
+        )""" for i in range(numberofpartitions))
+
+def fill_rrobin_partitions(cur, ratingstablename, numberofpartitions):
+    """
+    Function to fill every rrobin_part table with one set-based statement.
+    
+    Notes:
+    -----
+    - Các dòng được đánh số theo (userid, movieid); dòng thứ k vào phân mảnh k % N
+    
+    Returns:
+    --------
+    int
+        Tổng số dòng đã phân phối
+    """
+    return fill_partitions(cur, ratingstablename, RROBIN_TABLE_PREFIX, numberofpartitions,
+                           f"(ROW_NUMBER() OVER (ORDER BY userid, movieid) - 1) % {numberofpartitions}")
+
+def build_partitions_parallel(openconnection, prefix, numberofpartitions, workers, buildpartition):
+    """
+    Function to build partitions @prefix0..@prefixN-1 concurrently, all or nothing.
+    
+    Parameters:
+    -----------
+    openconnection : psycopg2.extensions.connection
+        Kết nối gốc (dùng để lấy tên database và dọn dẹp khi lỗi)
+    prefix : str
+        Prefix tên bảng phân mảnh
+    numberofpartitions : int
+        Số phân mảnh
+    workers : int
+        Số kết nối chạy song song; phân mảnh i được giao cho kết nối i % workers
+    buildpartition : callable
+        Hàm buildpartition(cur, i) tạo và nạp dữ liệu cho phân mảnh i
+        
+    Notes:
+    -----
+    - Mỗi kết nối làm việc trong transaction riêng và chỉ commit khi tất cả đều thành công
+    - Nếu một kết nối lỗi, các truy vấn đang chạy trên kết nối khác bị hủy và tất cả bị rollback
+    - Nếu lỗi xảy ra trong lúc commit, các bảng đã commit sẽ bị xóa
+    - Các kết nối được lấy từ pool dùng chung của database (get_connection_pool), nên số kết
+      nối song song không vượt quá kích thước tối đa của pool
+    """
+    pool = get_connection_pool(connection_dbname(openconnection))
+    workers = min(workers, numberofpartitions, pool.maxconn)
+    groups = [list(range(g, numberofpartitions, workers)) for g in range(workers)]
+    connections = []
+    parent = current_span()
+    
+    def run(con, group):
+        with span('build', parent, partitions=group):
+            cur = con.cursor()
+            for i in group:
+                buildpartition(cur, i)
+            cur.close()
+    
+    try:
+        for _ in groups:
+            connections.append(pool.getconn())
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            futures = [executor.submit(run, con, group) for con, group in zip(connections, groups)]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except Exception:
+                # Hủy các truy vấn còn đang chạy để kết thúc sớm
+                for con in connections:
+                    con.cancel()
+                raise
+        
+        committed = []
+        try:
+            for con, group in zip(connections, groups):
+                con.commit()
+                committed.extend(group)
+        except Exception:
+            cur = openconnection.cursor()
+            for i in committed:
+                cur.execute(f"DROP TABLE IF EXISTS {prefix}{i}")
+            openconnection.commit()
+            cur.close()
+            raise
+    except Exception:
+        for con in connections:
+            if not con.closed:
+                con.rollback()
+        raise
+    finally:
+        for con in connections:
+            pool.putconn(con)
+
+def copy_query_to_table(source, query, cur, tablename):
+    """
+    Function to stream the rows of @query on connection @source into @tablename through @cur (another
+    connection, possibly on another node) with binary COPY.
+    
+    Notes:
+    -----
+    - COPY TO STDOUT (trên @source) và COPY FROM STDIN (trên @cur) chạy đồng thời, nối với nhau
+      bằng một pipe, nên dữ liệu không bị giữ toàn bộ trong bộ nhớ hay ghi ra file tạm
+    """
+    read_fd, write_fd = os.pipe()
+    errors = []
+    
+    def produce():
+        try:
+            with os.fdopen(write_fd, 'wb') as writer:
+                source_cur = source.cursor()
+                source_cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", writer)
+                source_cur.close()
+        except Exception as e:
+            errors.append(e)
+    
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        with os.fdopen(read_fd, 'rb') as reader:
+            cur.copy_expert(f"COPY {tablename} (userid, movieid, rating) FROM STDIN WITH (FORMAT binary)", reader)
+    finally:
+        # Đóng đầu đọc (ở trên) làm producer dừng với BrokenPipeError nếu COPY FROM lỗi giữa chừng
+        producer.join()
+    if errors:
+        raise errors[0]
+
+def build_partitions_on_nodes(openconnection, prefix, numberofpartitions, nodes, partitionquery):
+    """
+    Function to create partitions @prefix0..@prefixN-1 on their nodes and fill them from the coordinator, all or nothing.
+    
+    Parameters:
+    -----------
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database chứa bảng ratings (coordinator)
+    prefix : str
+        Prefix tên bảng phân mảnh
+    numberofpartitions : int
+        Số phân mảnh
+    nodes : list
+        Node của từng phân mảnh (xem placement_nodes); None là database của @openconnection
+    partitionquery : callable
+        Hàm partitionquery(i) trả về câu SELECT userid, movieid, rating của các dòng thuộc phân mảnh i
+        
+    Notes:
+    -----
+    - Mỗi node dùng một kết nối riêng và tạo, nạp các phân mảnh của mình; các node chạy song song
+    - Dữ liệu đi thẳng từ coordinator sang node bằng binary COPY (xem copy_query_to_table)
+    - Các node chỉ commit khi tất cả đều thành công; nếu lỗi trong lúc commit, các bảng đã
+      commit trên các node khác bị xóa
+    - Coordinator đọc bảng ratings bằng các kết nối của pool, nên chỉ thấy dữ liệu đã commit
+    """
+    pool = get_connection_pool(connection_dbname(openconnection))
+    groups = {}
+    for i in range(numberofpartitions):
+        groups.setdefault(nodes[i], []).append(i)
+    connections = []  # (pool của node, kết nối, node, các phân mảnh) chưa commit
+    lock = threading.Lock()
+    
+    def run(node, group):
+        nodepool = get_node_pool(openconnection, node)
+        con = nodepool.getconn()
+        with lock:
+            connections.append((nodepool, con, node, group))
+        cur = con.cursor()
+        with pool.connection() as source:
+            for i in group:
+                create_partition_table(cur, prefix + str(i))
+                copy_query_to_table(source, partitionquery(i), cur, prefix + str(i))
+        cur.close()
+    
+    try:
+        # Mỗi luồng giữ một kết nối đọc của coordinator và (có thể) một kết nối ghi cùng pool
+        with ThreadPoolExecutor(max_workers=max(1, min(len(groups), pool.maxconn // 2))) as executor:
+            futures = [executor.submit(run, node, group) for node, group in groups.items()]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except Exception:
+                # Hủy các lệnh COPY còn đang chạy để kết thúc sớm
+                with lock:
+                    for _, con, _, _ in connections:
+                        con.cancel()
+                raise
+        
+        committed = []
+        try:
+            for _, con, node, group in connections:
+                con.commit()
+                committed.append((node, group))
+        except Exception:
+            for node, group in committed:
+                with get_node_pool(openconnection, node).connection() as con:
+                    cur = con.cursor()
+                    for i in group:
+                        cur.execute(f"DROP TABLE IF EXISTS {prefix}{i}")
+                    con.commit()
+                    cur.close()
+            raise
+    except Exception:
+        for _, con, _, _ in connections:
+            if not con.closed:
+                con.rollback()
+        raise
+    finally:
+        for nodepool, con, _, _ in connections:
+            nodepool.putconn(con)
+
+def discard_built_partitions(openconnection, prefix, numberofpartitions, nodes=None):
+    """
+    Function to undo a partitioning that failed after its tables were committed: drop @prefix0..@prefixN-1
+    on their nodes and the catalog entry of @prefix.
+    
+    Parameters:
+    -----------
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database chứa partition_catalog
+    prefix : str
+        Prefix tên bảng phân mảnh
+    numberofpartitions : int
+        Số phân mảnh đã tạo
+    nodes : list, optional
+        Node của từng phân mảnh (xem placement_nodes); None là database của @openconnection
+        
+    Notes:
+    -----
+    - Dùng khi lỗi xảy ra sau khi các bảng đã được commit (build song song, trên nhiều node,
+      hoặc lúc tạo index), để rangepartition/roundrobinpartition/hashpartition là all or nothing
+    - Chỉ gọi cho các bảng do chính lần phân mảnh này tạo ra
+    """
+    openconnection.rollback()
+    groups = {}
+    for i in range(numberofpartitions):
+        groups.setdefault(nodes[i] if nodes else None, []).append(i)
+    for node, group in groups.items():
+        with get_node_pool(openconnection, node).connection() as con:
+            cur = con.cursor()
+            for i in group:
+                cur.execute(f"DROP TABLE IF EXISTS {prefix}{i}")
+            con.commit()
+            cur.close()
+    cur = openconnection.cursor()
+    cur.execute("SELECT to_regclass('partition_catalog') IS NOT NULL")
+    if cur.fetchone()[0]:
+        cur.execute("DELETE FROM partition_catalog WHERE prefix = %s", (prefix,))
+    openconnection.commit()
+    cur.close()
+    invalidate_partition_cache(prefix)
+
+@instrumented
+def rangepartition(ratingstablename, numberofpartitions, openconnection, workers=1, mode='uniform',
+                   sample_percent=None, indexes=None, nodes=None):
+    """
+    Function to create partitions of main table based on range of ratings.
+    Sử dụng truy vấn SQL để phân mảnh dựa trên khoảng giá trị của rating
+    
+    Thuật toán phân vùng theo khoảng giá trị:
+    1. Tính toán khoảng giá trị cho mỗi phân vùng:
+       - Khoảng giá trị rating là từ 0 đến 5.0
+       - Chia đều khoảng này thành numberofpartitions phần
+       - Delta = 5.0/numberofpartitions là độ rộng của mỗi khoảng
+    
+    2. Tạo các bảng con:
+       - Mỗi bảng con có prefix 'range_part'
+       - Cấu trúc bảng: userid, movieid, rating
+       - Tên bảng: range_part0, range_part1, ...
+    
+    3. Phân phối dữ liệu:
+       - Phân vùng 0: [0, delta] - chứa các rating từ 0 đến delta
+       - Phân vùng 1: (delta, 2*delta] - chứa các rating từ delta đến 2*delta
+       - Phân vùng 2: (2*delta, 3*delta] - chứa các rating từ 2*delta đến 3*delta
+       - ...
+       - Phân vùng cuối: ((n-1)*delta, 5.0] - chứa các rating từ (n-1)*delta đến 5.0
+    
+    4. Ưu điểm:
+       - Phân phối dữ liệu đều theo giá trị rating
+       - Dễ dàng tìm kiếm theo khoảng giá trị
+       - Hiệu quả cho các truy vấn có điều kiện trên rating
+    
+    5. Nhược điểm:
+       - Có thể dẫn đến phân phối không đều nếu dữ liệu tập trung ở một khoảng
+       - Cần tính toán lại khi thêm/xóa phân vùng
+    
+    6. Chế độ song song (workers > 1):
+       - Các phân mảnh được tạo và nạp đồng thời trên @workers kết nối riêng
+       - Tất cả cùng commit hoặc cùng rollback (xem build_partitions_parallel)
+    
+    7. Chế độ equi-depth (mode='equidepth'):
+       - Lấy histogram của cột rating (toàn bộ bảng, hoặc mẫu sample_percent % bằng TABLESAMPLE)
+       - Chọn các mốc sao cho số dòng giữa các phân mảnh cân bằng nhất có thể
+       - Các mốc (của cả hai chế độ) được lưu vào partition_catalog để rangeinsert dùng lại
+    
+    8. Index trên các phân mảnh (indexes):
+       - Ví dụ ['btree(userid, movieid)', 'brin(rating)'] (xem parse_index_spec)
+       - Được tạo sau khi nạp xong, song song trên các phân mảnh, và in thời gian tạo từng index
+         (xem build_partition_indexes)
+       - Nếu tạo index lỗi, các bảng phân mảnh và metadata đã commit bị xóa (discard_built_partitions)
+    
+    9. Đặt phân mảnh lên nhiều node (nodes):
+       - Danh sách tên database hoặc DSN (xem node_dsn), ví dụ ['csdlpt_node1', 'port=5433 dbname=csdlpt'];
+         phân mảnh i nằm trên nodes[i % len(nodes)], None là database hiện tại
+       - Bảng ratings và partition_catalog vẫn nằm trên database hiện tại (coordinator)
+       - Các node được tạo và nạp song song (xem build_partitions_on_nodes); workers không được dùng
+       - rangeinsert, rangeinsert_many và các hàm truy vấn tự định tuyến đến node chứa phân mảnh
+    """
+    built = False
+    try:
+        start_time = time.time()
+        
+        con = openconnection
+        cur = con.cursor()
+        indexes = parse_index_spec(indexes)
+        
+        # Tính các mốc giá trị cho mỗi phân mảnh
+        operation = current_span()
+        operation.set(partitions=numberofpartitions, mode=mode, workers=workers)
+        with span('boundaries'):
+            if mode == 'uniform':
+                boundaries = uniform_range_boundaries(numberofpartitions)
+            elif mode == 'equidepth':
+                boundaries = equidepth_range_boundaries(
+                    range_rating_histogram(cur, ratingstablename, sample_percent), numberofpartitions)
+            else:
+                raise ValueError("Unknown range partitioning mode: {0}".format(mode))
+        
+        if nodes is not None:
+            # Tạo và nạp các phân mảnh trên các node
+            nodes = placement_nodes(nodes, numberofpartitions)
+            
+            def partitionquery(i):
+                low = ">=" if i == 0 else ">"
+                return (f"SELECT userid, movieid, rating FROM {ratingstablename} "
+                        f"WHERE rating {low} {float(boundaries[i])!r} AND rating <= {float(boundaries[i + 1])!r}")
+            
+            build_partitions_on_nodes(openconnection, RANGE_TABLE_PREFIX, numberofpartitions, nodes, partitionquery)
+        elif workers > 1:
+            # Tạo và nạp các phân mảnh song song trên nhiều kết nối
+            def buildpartition(worker_cur, i):
+                create_partition_table(worker_cur, RANGE_TABLE_PREFIX + str(i))
+                operation.add_rows(fill_range_partition(worker_cur, ratingstablename, i, boundaries[i],
+                                                        boundaries[i + 1]))
+            
+            build_partitions_parallel(openconnection, RANGE_TABLE_PREFIX, numberofpartitions, workers,
+                                      buildpartition)
+        else:
+            # Tạo các bảng phân mảnh và chèn dữ liệu dựa trên khoảng giá trị
+            with span('create'):
+                for i in range(numberofpartitions):
+                    create_partition_table(cur, RANGE_TABLE_PREFIX + str(i))
+            with span('fill') as phase:
+                for i in range(numberofpartitions):
+                    phase.add_rows(fill_range_partition(cur, ratingstablename, i, boundaries[i], boundaries[i + 1]))
+            operation.add_rows(phase.rows or 0)
+        built = True
+        
+        # Lưu các mốc để rangeinsert định tuyến theo đúng các mốc này
+        with span('metadata'):
+            save_partition_metadata(cur, RANGE_TABLE_PREFIX, 'range', numberofpartitions, boundaries, mode,
+                                    indexes=indexes, nodes=nodes)
+        
+        # Commit và đóng cursor
+        with span('commit'):
+            count_transaction_end(openconnection)
+            openconnection.commit()
+        cur.close()
+        
+        # Tạo index sau khi nạp dữ liệu
+        build_partition_indexes(openconnection, [RANGE_TABLE_PREFIX + str(i) for i in range(numberofpartitions)],
+                                indexes, nodes)
+        
+        # Tính và in thời gian thực thi
+        end_time = time.time()
+        execution_time = end_time - start_time
+        print(f"Thời gian thực thi hàm rangepartition: {execution_time:.2f} giây")
+        
+    except Exception as e:
+        openconnection.rollback()
+        if built:
+            # Các bảng (và metadata) có thể đã được commit: xóa để không để lại phân mảnh dở dang
+            discard_built_partitions(openconnection, RANGE_TABLE_PREFIX, numberofpartitions, nodes)
+        print("Error: Could not create range partitions")
+        print(e)
+        raise e
+
+@instrumented
+def roundrobinpartition(ratingstablename, numberofpartitions, openconnection, workers=1, method='setbased',
+                        indexes=None, nodes=None):
+    """
+    Function to create partitions of main table using round robin approach.
+    Sử dụng truy vấn SQL để phân mảnh dữ liệu theo round robin
+    
+    Thuật toán phân vùng theo round-robin:
+    1. Nguyên lý hoạt động:
+       - Phân phối dữ liệu luân phiên vào các bảng con
+       - Mỗi bản ghi được gán một số thứ tự (row_num)
+       - Bảng con được chọn dựa trên phép chia lấy dư: row_num % numberofpartitions
+    
+    2. Tạo các bảng con:
+       - Mỗi bảng con có prefix 'rrobin_part'
+       - Cấu trúc bảng: userid, movieid, rating
+       - Tên bảng: rrobin_part0, rrobin_part1, ...
+    
+    3. Phân phối dữ liệu:
+       - Bản ghi 0 -> rrobin_part0
+       - Bản ghi 1 -> rrobin_part1
+       - Bản ghi 2 -> rrobin_part2
+       - ...
+       - Bản ghi n -> rrobin_part(n % numberofpartitions)
+    
+    4. Ưu điểm:
+       - Phân phối dữ liệu đều giữa các bảng con
+       - Không phụ thuộc vào giá trị của dữ liệu
+       - Dễ dàng thêm/xóa phân vùng
+       - Hiệu quả cho các truy vấn song song
+    
+    5. Nhược điểm:
+       - Không tối ưu cho các truy vấn có điều kiện trên rating
+       - Cần quét tất cả các bảng con khi tìm kiếm theo giá trị
+       - Khó khăn trong việc tìm kiếm theo khoảng giá trị
+    
+    6. Chế độ song song (workers > 1):
+       - Các dòng được đánh số một lần vào một bảng UNLOGGED dùng chung (number_rrobin_rows)
+       - Mỗi kết nối tạo và nạp một nhóm phân mảnh, mỗi phân mảnh bằng một câu
+         INSERT ... SELECT lọc theo phân mảnh đã tính trong bảng đó
+       - Tất cả cùng commit hoặc cùng rollback (xem build_partitions_parallel)
+    
+    7. Cách nạp dữ liệu khi chạy tuần tự (method):
+       - 'setbased' (mặc định): một câu lệnh duy nhất, quét và đánh số ratings một lần rồi
+         INSERT hàng loạt vào tất cả các bảng con (xem fill_rrobin_partitions)
+       - 'loop': cách cũ, vòng lặp PL/pgSQL chạy EXECUTE cho từng dòng; chỉ giữ lại để so sánh hiệu năng
+       - Cả hai cách cho ra cùng một cách phân bố dữ liệu
+    
+    8. Index trên các phân mảnh (indexes): như rangepartition, được tạo song song sau khi nạp xong
+    
+    9. Đặt phân mảnh lên nhiều node (nodes): như rangepartition; mỗi phân mảnh được nạp bằng câu
+       SELECT lọc theo row_num % numberofpartitions, roundrobininsert tự định tuyến đến node
+    """
+    built = False
+    try:
+        start_time = time.time()
+        
+        con = openconnection
+        cur = con.cursor()
+        indexes = parse_index_spec(indexes)
+        
+        if nodes is not None:
+            # Tạo và nạp các phân mảnh trên các node
+            nodes = placement_nodes(nodes, numberofpartitions)
+            
+            def partitionquery(i):
+                return f"""
+                SELECT userid, movieid, rating
+                FROM (
+                    SELECT userid, movieid, rating,
+                           ROW_NUMBER() OVER (ORDER BY userid, movieid) - 1 AS row_num
+                    FROM {ratingstablename}
+                ) AS numbered
+                WHERE row_num % {numberofpartitions} = {i}
+                """
+            
+            build_partitions_on_nodes(openconnection, RROBIN_TABLE_PREFIX, numberofpartitions, nodes, partitionquery)
+        elif workers > 1:
+            # Đánh số các dòng một lần, commit để các kết nối song song nhìn thấy bảng đánh số
+            with span('number') as phase:
+                phase.add_rows(number_rrobin_rows(cur, ratingstablename, numberofpartitions))
+            openconnection.commit()
+            
+            # Tạo và nạp các phân mảnh song song trên nhiều kết nối
+            def buildpartition(worker_cur, i):
+                create_partition_table(worker_cur, RROBIN_TABLE_PREFIX + str(i))
+                fill_rrobin_partition(worker_cur, ratingstablename, i)
+            
+            try:
+                build_partitions_parallel(openconnection, RROBIN_TABLE_PREFIX, numberofpartitions, workers,
+                                          buildpartition)
+            finally:
+                # Xóa bảng đánh số, kể cả khi lỗi
+                openconnection.rollback()
+                cur.execute(f"DROP TABLE IF EXISTS {rrobin_numbered_table(ratingstablename)}")
+                openconnection.commit()
+        elif method == 'setbased':
+            # Tạo các bảng phân mảnh và phân phối dữ liệu bằng một câu lệnh
+            with span('create'):
+                for i in range(numberofpartitions):
+                    create_partition_table(cur, RROBIN_TABLE_PREFIX + str(i))
+            with span('fill') as phase:
+                total_rows = fill_rrobin_partitions(cur, ratingstablename, numberofpartitions)
+                phase.add_rows(total_rows)
+        elif method == 'loop':
+            # Tạo các bảng phân mảnh
+            with span('create'):
+                for i in range(numberofpartitions):
+                    create_partition_table(cur, RROBIN_TABLE_PREFIX + str(i))
+            
+            # Phân phối dữ liệu theo round robin
+            query = f"""
+            DO $$
+            DECLARE
+                target_partition text;
+                row_data record;
+            BEGIN
+                FOR row_data IN 
+                    SELECT 
+                        userid,
+                        movieid,
+                        rating,
+                        ROW_NUMBER() OVER (ORDER BY userid, movieid) - 1 as row_num
+                    FROM {ratingstablename}
+                LOOP
+                    -- Tính toán tên bảng phân mảnh
+                    target_partition := '{RROBIN_TABLE_PREFIX}' || (row_data.row_num % {numberofpartitions})::text;
+                
+                    -- Insert dữ liệu vào phân mảnh tương ứng
+                    EXECUTE format('INSERT INTO %I (userid, movieid, rating) VALUES ($1, $2, $3)', target_partition)
+                    USING row_data.userid, row_data.movieid, row_data.rating;
+                END LOOP;
+            END $$;
+            """
+        
+            with span('fill'):
+                cur.execute(query)
+        else:
+            raise ValueError("Unknown round robin partitioning method: {0}".format(method))
+        built = True
+        
+        if method != 'setbased' or workers > 1 or nodes is not None:
+            cur.execute(f"SELECT COUNT(*) FROM {ratingstablename}")
+            total_rows = cur.fetchone()[0]
+        current_span().set(partitions=numberofpartitions, method=method, workers=workers)
+        current_span().add_rows(total_rows)
+        
+        # Lưu metadata của các phân mảnh, bộ đếm round robin bắt đầu từ số dòng đã phân phối
+        with span('metadata'):
+            save_partition_metadata(cur, RROBIN_TABLE_PREFIX, 'roundrobin', numberofpartitions, nextslot=total_rows,
+                                    indexes=indexes, nodes=nodes)
+        
+        # Commit và đóng cursor
+        with span('commit'):
+            count_transaction_end(openconnection)
+            openconnection.commit()
+        cur.close()
+        
+        # Tạo index sau khi nạp dữ liệu
+        build_partition_indexes(openconnection, [RROBIN_TABLE_PREFIX + str(i) for i in range(numberofpartitions)],
+                                indexes, nodes)
+        
+        # Tính và in thời gian thực thi
+        end_time = time.time()
+        execution_time = end_time - start_time
+        print(f"Thời gian thực thi hàm roundrobinpartition: {execution_time:.2f} giây")
+        
+    except Exception as e:
+        openconnection.rollback()
+        if built:
+            # Các bảng (và metadata) có thể đã được commit: xóa để không để lại phân mảnh dở dang
+            discard_built_partitions(openconnection, RROBIN_TABLE_PREFIX, numberofpartitions, nodes)
+        print("Error: Could not create round robin partitions")
+        print(e)
+        raise e
+
+@instrumented
+def roundrobininsert(ratingstablename, userid, itemid, rating, openconnection):
+    """
+    Function to insert a new row into the main table and specific partition based on round robin
+    approach.
+    
+    Parameters:
+    -----------
+    ratingstablename : str
+        Tên bảng ratings
+    userid : int
+        ID của user
+    itemid : int
+        ID của movie
+    rating : float
+        Giá trị rating
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database
+        
+    Notes:
+    -----
+    - Insert bản ghi vào bảng chính
+    - Lấy vị trí round robin tiếp theo từ bộ đếm nextslot trong partition_catalog (O(1), không
+      COUNT(*) trên ratings), bộ đếm được khởi tạo bởi roundrobinpartition
+    - Xác định bảng con bằng vị trí % số phân mảnh trong metadata đã cache
+    - Insert vào bảng con tương ứng, trên node chứa phân mảnh đó (xem insert_partition_row)
+    """
+    con = openconnection
+    cur = con.cursor()
+    
+    current_span().add_rows(1)
+    try:
+        # Insert vào bảng ratings trước
+        cur.execute(f"INSERT INTO {ratingstablename} (userid, movieid, rating) VALUES (%s, %s, %s)",
+                   (userid, itemid, rating))
+        
+        # Lấy vị trí round robin từ bộ đếm
+        metadata, slot = reserve_rrobin_batch(cur, 1, openconnection)
+        nodes = partition_nodes(metadata)
+        if metadata is not None:
+            tablenames = metadata['tablenames']
+        else:
+            # Phân mảnh được tạo khi chưa có partition_catalog: vị trí là số dòng trong ratings
+            cur.execute(f"SELECT COUNT(*) FROM {ratingstablename}")
+            slot = cur.fetchone()[0] - 1
+            tablenames = [RROBIN_TABLE_PREFIX + str(i)
+                          for i in range(count_partitions(RROBIN_TABLE_PREFIX, openconnection))]
+        
+        # Tính toán index của phân mảnh cần insert
+        partition_index = slot % len(tablenames)
+        insert_partition_row(cur, nodes[partition_index] if nodes else None, tablenames[partition_index],
+                             userid, itemid, rating)
+        log_partition_rows(cur, metadata, tablenames[partition_index], [userid], [itemid], [rating])
+        
+        count_transaction_end(con)
+        con.commit()
+        
+    except Exception as e:
+        con.rollback()
+        # Metadata có thể đã bị xóa/tạo lại: lần gọi sau sẽ đọc lại từ database
+        invalidate_partition_cache(RROBIN_TABLE_PREFIX)
+        raise e
+    finally:
+        cur.close()
+
+@instrumented
+def rangeinsert(ratingstablename, userid, itemid, rating, openconnection):
+    """
+    Function to insert a new row into the main table and specific partition based on range rating.
+    
+    Parameters:
+    -----------
+    ratingstablename : str
+        Tên bảng ratings
+    userid : int
+        ID của user
+    itemid : int
+        ID của movie
+    rating : float
+        Giá trị rating
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database
+        
+    Notes:
+    -----
+    - Xác định bảng con bằng cách tìm nhị phân trên các mốc trong metadata đã cache
+      (chia đều hoặc equi-depth), không cần truy vấn thêm
+    - Insert vào bảng con tương ứng, kèm điều kiện version của metadata; nếu metadata đã
+      thay đổi thì đọc lại và thử lại
+    - Phân mảnh nằm trên node khác được ghi trên node đó (xem guarded_partition_insert)
+    """
+    con = openconnection
+    cur = con.cursor()
+    
+    current_span().add_rows(1)
+    try:
+        for attempt in range(METADATA_RETRIES):
+            metadata = get_partition_metadata(RANGE_TABLE_PREFIX, openconnection, refresh=attempt > 0)
+            if metadata is None:
+                # Phân mảnh được tạo khi chưa có partition_catalog: dùng mốc chia đều
+                boundaries = get_range_boundaries(openconnection)
+                partition_index = range_partition_index(rating, boundaries) if boundaries else -1
+                if partition_index < 0:
+                    raise ValueError("No range partition for rating {0}".format(rating))
+                cur.execute(f"INSERT INTO {RANGE_TABLE_PREFIX}{partition_index} (userid, movieid, rating) "
+                            f"VALUES (%s, %s, %s)", (userid, itemid, rating))
+                break
+            
+            # Xác định phân mảnh theo các mốc đã lưu khi phân mảnh
+            check_partition_writable(metadata)
+            partition_index = range_partition_index(rating, metadata['boundaries'])
+            if partition_index < 0:
+                raise ValueError("No range partition for rating {0}".format(rating))
+            nodes = partition_nodes(metadata)
+            if guarded_partition_insert(cur, metadata, metadata['tablenames'][partition_index],
+                                        userid, itemid, rating, nodes[partition_index] if nodes else None):
+                break
+        else:
+            raise RuntimeError("Partition metadata for {0} keeps changing".format(RANGE_TABLE_PREFIX))
+        count_transaction_end(con)
+        con.commit()
+    except Exception as e:
+        con.rollback()
+        # Metadata có thể đã bị xóa/tạo lại: lần gọi sau sẽ đọc lại từ database
+        invalidate_partition_cache(RANGE_TABLE_PREFIX)
+        raise e
+    finally:
+        cur.close()
+
+@instrumented
+def hashpartition(ratingstablename, numberofpartitions, openconnection, includemovieid=False, indexes=None):
+    """
+    Function to create partitions of main table based on a hash of userid (and optionally movieid).
+    Sử dụng một câu lệnh SQL để phân phối dữ liệu vào các bảng hash_part0, hash_part1, ...
+    
+    Parameters:
+    -----------
+    ratingstablename : str
+        Tên bảng ratings
+    numberofpartitions : int
+        Số phân mảnh cần tạo
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database
+    includemovieid : bool, optional
+        True để băm theo cả (userid, movieid) thay vì chỉ userid
+    indexes : str or list of str, optional
+        Index trên các phân mảnh (xem parse_index_spec), được tạo song song sau khi nạp xong
+        
+    Notes:
+    -----
+    - Dòng được đưa vào phân mảnh ((userid * 2654435761) & 0xFFFFFFFF) % N (xem
+      hash_partition_expression), công thức ổn định, tính được cả trong SQL và Python
+    - Băm theo userid: mọi rating của một user nằm trong đúng một phân mảnh, nên truy vấn
+      theo user chỉ cần đọc một phân mảnh (xem pointquery)
+    - Băm theo (userid, movieid): phân phối đều hơn khi có user rất nhiều rating, nhưng không
+      còn loại bỏ được phân mảnh theo user
+    - Khóa băm được lưu vào partition_catalog để hashinsert dùng lại
+    """
+    built = False
+    try:
+        start_time = time.time()
+        
+        con = openconnection
+        cur = con.cursor()
+        indexes = parse_index_spec(indexes)
+        
+        # Tạo các bảng phân mảnh và phân phối dữ liệu bằng một câu lệnh
+        with span('create'):
+            for i in range(numberofpartitions):
+                create_partition_table(cur, HASH_TABLE_PREFIX + str(i))
+        with span('fill') as phase:
+            phase.add_rows(fill_partitions(cur, ratingstablename, HASH_TABLE_PREFIX, numberofpartitions,
+                                           hash_partition_expression(numberofpartitions, includemovieid)))
+        current_span().set(partitions=numberofpartitions, includemovieid=includemovieid)
+        current_span().add_rows(phase.rows or 0)
+        built = True
+        
+        # Lưu khóa băm để hashinsert định tuyến theo đúng công thức này
+        with span('metadata'):
+            save_partition_metadata(cur, HASH_TABLE_PREFIX, 'hash', numberofpartitions,
+                                    mode=HASH_KEY_USER_MOVIE if includemovieid else HASH_KEY_USER, indexes=indexes)
+        
+        # Commit và đóng cursor
+        with span('commit'):
+            count_transaction_end(openconnection)
+            openconnection.commit()
+        cur.close()
+        
+        # Tạo index sau khi nạp dữ liệu
+        build_partition_indexes(openconnection, [HASH_TABLE_PREFIX + str(i) for i in range(numberofpartitions)],
+                                indexes)
+        
+        # Tính và in thời gian thực thi
+        end_time = time.time()
+        execution_time = end_time - start_time
+        print(f"Thời gian thực thi hàm hashpartition: {execution_time:.2f} giây")
+        
+    except Exception as e:
+        openconnection.rollback()
+        if built:
+            # Metadata có thể đã được commit trước khi tạo index lỗi
+            discard_built_partitions(openconnection, HASH_TABLE_PREFIX, numberofpartitions)
+        print("Error: Could not create hash partitions")
+        print(e)
+        raise e
+
+@instrumented
+def hashinsert(ratingstablename, userid, itemid, rating, openconnection):
+    """
+    Function to insert a new row into the main table and the hash partition of its userid.
+    
+    Parameters:
+    -----------
+    ratingstablename : str
+        Tên bảng ratings
+    userid : int
+        ID của user
+    itemid : int
+        ID của movie
+    rating : float
+        Giá trị rating
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database
+        
+    Notes:
+    -----
+    - Giống roundrobininsert: ghi vào bảng ratings và bảng phân mảnh trong cùng một transaction
+    - Phân mảnh được tính bằng hash_partition_index với số phân mảnh và khóa băm trong metadata
+      đã cache; insert kèm điều kiện version của metadata, nếu metadata đã thay đổi thì đọc lại
+    """
+    con = openconnection
+    cur = con.cursor()
+    
+    current_span().add_rows(1)
+    try:
+        # Insert vào bảng ratings trước
+        cur.execute(f"INSERT INTO {ratingstablename} (userid, movieid, rating) VALUES (%s, %s, %s)",
+                    (userid, itemid, rating))
+        
+        for attempt in range(METADATA_RETRIES):
+            metadata = get_partition_metadata(HASH_TABLE_PREFIX, openconnection, refresh=attempt > 0)
+            if metadata is None:
+                # Phân mảnh được tạo khi chưa có partition_catalog: băm theo userid
+                numberofpartitions = count_partitions(HASH_TABLE_PREFIX, openconnection)
+                if not numberofpartitions:
+                    raise ValueError("No hash partitions found")
+                partition_index = hash_partition_index(userid, itemid, numberofpartitions)
+                cur.execute(f"INSERT INTO {HASH_TABLE_PREFIX}{partition_index} (userid, movieid, rating) "
+                            f"VALUES (%s, %s, %s)", (userid, itemid, rating))
+                break
+            
+            check_partition_writable(metadata)
+            partition_index = hash_partition_index(userid, itemid, metadata['numberofpartitions'],
+                                                   hash_key_includes_movieid(metadata))
+            if guarded_partition_insert(cur, metadata, metadata['tablenames'][partition_index],
+                                        userid, itemid, rating):
+                break
+        else:
+            raise RuntimeError("Partition metadata for {0} keeps changing".format(HASH_TABLE_PREFIX))
+        count_transaction_end(con)
+        con.commit()
+    except Exception as e:
+        con.rollback()
+        # Metadata có thể đã bị xóa/tạo lại: lần gọi sau sẽ đọc lại từ database
+        invalidate_partition_cache(HASH_TABLE_PREFIX)
+        raise e
+    finally:
+        cur.close()
+
+def ratings_columns(rows):
+    """
+    Function to turn an iterable of (userid, movieid, rating) tuples into three columns.
+    
+    Returns:
+    --------
+    tuple
+        (userids, movieids, ratings) dạng mảng numpy nếu có numpy, ngược lại là list
+    """
+    rows = list(rows)
+    userids = [row[0] for row in rows]
+    movieids = [row[1] for row in rows]
+    ratings = [float(row[2]) for row in rows]
+    if np is not None:
+        return (np.array(userids, dtype=np.int32), np.array(movieids, dtype=np.int32),
+                np.array(ratings, dtype=np.float64))
+    return userids, movieids, ratings
+
+def lock_partition_metadata(cur, prefix, openconnection):
+    """
+    Function to get the metadata of @prefix and lock its catalog row (FOR SHARE) for the current transaction.
+    
+    Returns:
+    --------
+    dict or None
+        Metadata đã được xác nhận là mới nhất; None nếu chưa có partition_catalog cho prefix này
+        
+    Notes:
+    -----
+    - Khóa FOR SHARE giữ cho metadata không bị thay đổi cho đến khi transaction kết thúc,
+      nên cả lô dữ liệu được định tuyến theo cùng một phiên bản
+    - Chỉ tốn một round trip; nếu version trong cache đã cũ thì đọc lại rồi kiểm tra lại
+    """
+    for attempt in range(METADATA_RETRIES):
+        metadata = get_partition_metadata(prefix, openconnection, refresh=attempt > 0)
+        if metadata is None:
+            return None
+        cur.execute("SELECT version FROM partition_catalog WHERE prefix = %s FOR SHARE", (prefix,))
+        row = cur.fetchone()
+        if row is not None and row[0] == metadata['version']:
+            check_partition_writable(metadata)
+            return metadata
+    raise RuntimeError("Partition metadata for {0} keeps changing".format(prefix))
+
+@instrumented
+def rangeinsert_many(ratingstablename, rows, openconnection):
+    """
+    Function to insert a batch of rows into the range partitions, grouped by partition on the client.
+    
+    Parameters:
+    -----------
+    ratingstablename : str
+        Tên bảng ratings
+    rows : iterable of (int, int, float)
+        Các bộ (userid, movieid, rating) cần insert
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database
+        
+    Returns:
+    --------
+    dict
+        Số dòng đã ghi vào từng bảng phân mảnh, ví dụ {'range_part0': 10, 'range_part1': 0, ...}
+        
+    Notes:
+    -----
+    - Giống rangeinsert: chỉ ghi vào các bảng phân mảnh
+    - Các dòng được chia nhóm theo phân mảnh bằng các mốc trong metadata đã cache,
+      mỗi nhóm được ghi bằng một lệnh binary COPY
+    - Cả lô nằm trong một transaction: hoặc tất cả được ghi, hoặc không dòng nào
+    """
+    userids, movieids, ratings = ratings_columns(rows)
+    current_span().add_rows(len(userids))
+    try:
+        with transaction(openconnection) as cur:
+            metadata = lock_partition_metadata(cur, RANGE_TABLE_PREFIX, openconnection)
+            if metadata is not None:
+                boundaries, tablenames = metadata['boundaries'], metadata['tablenames']
+            else:
+                # Phân mảnh được tạo khi chưa có partition_catalog: dùng mốc chia đều
+                boundaries = get_range_boundaries(openconnection)
+                if not boundaries:
+                    raise ValueError("No range partitions found")
+                tablenames = [RANGE_TABLE_PREFIX + str(i) for i in range(len(boundaries) - 1)]
+            
+            # Chia nhóm theo phân mảnh trên client
+            indices = range_partition_indices(ratings, boundaries)
+            for rating, index in zip(ratings, indices):
+                if index < 0:
+                    raise ValueError("No range partition for rating {0}".format(rating))
+            
+            counts = write_partition_groups(cur, tablenames, userids, movieids, ratings, indices,
+                                            partition_nodes(metadata), metadata)
+        return counts
+    except Exception as e:
+        invalidate_partition_cache(RANGE_TABLE_PREFIX)
+        raise e
+
+@instrumented
+def roundrobininsert_many(ratingstablename, rows, openconnection):
+    """
+    Function to insert a batch of rows into the ratings table and the round robin partitions in one transaction.
+    
+    Parameters:
+    -----------
+    ratingstablename : str
+        Tên bảng ratings
+    rows : iterable of (int, int, float)
+        Các bộ (userid, movieid, rating) cần insert, theo thứ tự
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database
+        
+    Returns:
+    --------
+    dict
+        Số dòng đã ghi vào từng bảng phân mảnh, ví dụ {'rrobin_part0': 2, 'rrobin_part1': 2, ...}
+        
+    Notes:
+    -----
+    - Giống roundrobininsert: ghi vào bảng ratings và bảng phân mảnh
+    - Lấy một dải vị trí liên tiếp từ bộ đếm trong partition_catalog bằng một câu lệnh, dòng thứ k
+      của lô nhận vị trí đầu + k, nên kết quả giống hệt gọi roundrobininsert lần lượt cho từng dòng
+    - Bảng ratings và mỗi phân mảnh được ghi bằng một lệnh binary COPY
+    - Cả lô nằm trong một transaction: hoặc tất cả được ghi, hoặc không dòng nào
+    """
+    userids, movieids, ratings = ratings_columns(rows)
+    current_span().add_rows(len(userids))
+    try:
+        with transaction(openconnection) as cur:
+            if len(userids):
+                copy_binary_columns(cur, ratingstablename, userids, movieids, ratings)
+            
+            metadata, first_slot = reserve_rrobin_batch(cur, len(userids), openconnection)
+            if metadata is not None:
+                tablenames = metadata['tablenames']
+            else:
+                # Phân mảnh được tạo khi chưa có partition_catalog: vị trí là số dòng đã có trong ratings
+                tablenames = [RROBIN_TABLE_PREFIX + str(i)
+                              for i in range(count_partitions(RROBIN_TABLE_PREFIX, openconnection))]
+                if not tablenames:
+                    raise ValueError("No round robin partitions found")
+                cur.execute(f"SELECT COUNT(*) FROM {ratingstablename}")
+                first_slot = cur.fetchone()[0] - len(userids)
+            
+            indices = rrobin_slot_indices(first_slot, len(userids), len(tablenames))
+            counts = write_partition_groups(cur, tablenames, userids, movieids, ratings, indices,
+                                            partition_nodes(metadata), metadata)
+        return counts
+    except Exception as e:
+        invalidate_partition_cache(RROBIN_TABLE_PREFIX)
+        raise e
+
+class InsertService(object):
+    """
+    Asyncio front end that groups single-row inserts into batched writes committed together (group commit).
+    Nhiều coroutine gọi insert(); các dòng được gom trong một hàng đợi có giới hạn và ghi theo lô
+    bằng rangeinsert_many/roundrobininsert_many, mỗi lô là một transaction.
+    
+    Parameters:
+    -----------
+    ratingstablename : str
+        Tên bảng ratings
+    openconnection : psycopg2.extensions.connection
+        Kết nối dành riêng cho service (không dùng chung với code khác trong lúc service chạy)
+    scheme : str, optional
+        'roundrobin' (mặc định) hoặc 'range'
+    batchsize : int, optional
+        Số dòng tối đa của một lô
+    flushinterval : float, optional
+        Thời gian chờ tối đa (giây) tính từ dòng đầu tiên của lô trước khi ghi
+    queuesize : int, optional
+        Số dòng tối đa đang chờ; insert() sẽ chờ khi hàng đợi đầy
+        
+    Notes:
+    -----
+    - await insert(...) chỉ trả về sau khi transaction chứa dòng đó đã commit
+    - Nếu cả lô bị lỗi (ví dụ một dòng trùng khóa), các dòng được ghi lại từng dòng một để
+      lỗi chỉ trả về cho đúng coroutine gửi dòng đó
+    - Lệnh ghi chạy trong thread pool mặc định của event loop nên không chặn event loop;
+      trong lúc một lô đang ghi, các dòng mới tiếp tục được gom cho lô sau
+    - stats() trả về độ sâu hàng đợi, kích thước lô và độ trễ ghi để tinh chỉnh các tham số
+    - Sau khi stop() bắt đầu, insert() mới bị từ chối; các dòng đã được nhận (kể cả các dòng
+      đang chờ hàng đợi đầy) vẫn được ghi trước khi stop() trả về
+    """
+    
+    def __init__(self, ratingstablename, openconnection, scheme='roundrobin', batchsize=INSERT_BATCH_SIZE,
+                 flushinterval=INSERT_FLUSH_INTERVAL, queuesize=INSERT_QUEUE_SIZE):
+        if scheme == 'range':
+            self.insertmany = rangeinsert_many
+        elif scheme == 'roundrobin':
+            self.insertmany = roundrobininsert_many
+        else:
+            raise ValueError("Unknown partitioning scheme: {0}".format(scheme))
+        self.ratingstablename = ratingstablename
+        self.openconnection = openconnection
+        self.batchsize = batchsize
+        self.flushinterval = flushinterval
+        self.queuesize = queuesize
+        self.queue = None
+        self.worker = None
+        self.stopping = False
+        self.putting = 0  # Số insert() đang chờ đặt dòng vào hàng đợi
+        self.counters = {'submitted': 0, 'committed': 0, 'failed': 0, 'batches': 0,
+                         'max_batch_size': 0, 'flush_seconds': 0.0, 'max_flush_seconds': 0.0,
+                         'last_flush_seconds': 0.0}
+        
+    async def start(self):
+        if self.worker is not None:
+            raise RuntimeError("InsertService is already running")
+        self.queue = asyncio.Queue(self.queuesize)
+        self.stopping = False
+        self.worker = asyncio.ensure_future(self.run())
+        
+    async def stop(self):
+        # Không nhận dòng mới, ghi nốt các dòng còn trong hàng đợi rồi dừng
+        if self.worker is None:
+            return
+        self.stopping = True
+        await self.queue.put(None)
+        worker, self.worker = self.worker, None
+        try:
+            await worker
+        finally:
+            # Các insert() đang chờ hàng đợi đầy có thể đặt dòng sau None: ghi nốt các dòng đó
+            while self.putting or not self.queue.empty():
+                batch = []
+                while len(batch) < self.batchsize and not self.queue.empty():
+                    item = self.queue.get_nowait()
+                    if item is not None:
+                        batch.append(item)
+                if batch:
+                    await self.flush(batch)
+                else:
+                    # Nhường event loop để các insert() đang chờ đặt được dòng vào hàng đợi
+                    await asyncio.sleep(0)
+        
+    async def __aenter__(self):
+        await self.start()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+        
+    async def insert(self, userid, itemid, rating):
+        if self.worker is None or self.stopping:
+            raise RuntimeError("InsertService is not running")
+        future = asyncio.get_running_loop().create_future()
+        self.putting += 1
+        try:
+            await self.queue.put(((userid, itemid, rating), future))
+        finally:
+            self.putting -= 1
+        self.counters['submitted'] += 1
+        await future
+        
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                break
+            
+            # Gom lô cho đến khi đủ batchsize hoặc hết flushinterval
+            batch = [item]
+            deadline = loop.time() + self.flushinterval
+            while len(batch) < self.batchsize:
+                try:
+                    item = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            await self.flush(batch)
+            
+    async def flush(self, batch):
+        loop = asyncio.get_running_loop()
+        rows = [row for row, _ in batch]
+        start_time = time.time()
+        try:
+            await loop.run_in_executor(None, self.insertmany, self.ratingstablename, rows, self.openconnection)
+            results = [None] * len(batch)
+        except Exception:
+            # Ghi lại từng dòng để tách dòng lỗi khỏi các dòng hợp lệ
+            results = []
+            for row in rows:
+                try:
+                    await loop.run_in_executor(None, self.insertmany, self.ratingstablename, [row],
+                                               self.openconnection)
+                    results.append(None)
+                except Exception as e:
+                    results.append(e)
+        elapsed = time.time() - start_time
+        
+        counters = self.counters
+        counters['batches'] += 1
+        counters['max_batch_size'] = max(counters['max_batch_size'], len(batch))
+        counters['flush_seconds'] += elapsed
+        counters['max_flush_seconds'] = max(counters['max_flush_seconds'], elapsed)
+        counters['last_flush_seconds'] = elapsed
+        for (_, future), error in zip(batch, results):
+            if error is None:
+                counters['committed'] += 1
+                if not future.done():
+                    future.set_result(None)
+            else:
+                counters['failed'] += 1
+                if not future.done():
+                    future.set_exception(error)
+                    
+    def stats(self):
+        """
+        Returns the service counters: queue depth, rows submitted/committed/failed, batch sizes and flush latency (giây).
+        """
+        stats = dict(self.counters)
+        stats['queue_depth'] = self.queue.qsize() if self.queue is not None else 0
+        stats['avg_batch_size'] = (stats['committed'] + stats['failed']) / stats['batches'] if stats['batches'] else 0.0
+        stats['avg_flush_seconds'] = stats['flush_seconds'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
+
+def overlapping_range_partitions(boundaries, ratingMin, ratingMax):
+    """
+    Function to get the indices of the range partitions that can hold a rating in [ratingMin, ratingMax].
+    
+    Notes:
+    -----
+    - Phân mảnh 0 chứa [b0, b1], phân mảnh i > 0 chứa (bi, bi+1]
+    """
+    indices = []
+    for i in range(len(boundaries) - 1):
+        low, high = boundaries[i], boundaries[i + 1]
+        if high >= ratingMin and (low < ratingMax or (i == 0 and low <= ratingMax)):
+            indices.append(i)
+    return indices
+
+def query_partition_tables(openconnection, ratingMin=None, ratingMax=None, userid=None):
+    """
+    Function to list the partition tables a predicate has to read: the overlapping range
+    partitions, every round robin partition and the hash partitions that can hold @userid.
+    
+    Returns:
+    --------
+    list of str
+        Tên các bảng phân mảnh cần đọc
+        
+    Notes:
+    -----
+    - Phân mảnh range được loại bỏ theo các mốc trong partition_catalog (hoặc mốc chia đều với
+      phân mảnh cũ); phân mảnh round robin không có thông tin về rating nên luôn phải đọc
+    - ratingMin/ratingMax là None thì không loại bỏ phân mảnh range nào
+    - Phân mảnh hash (băm theo userid) được loại bỏ theo userid: chỉ đọc đúng một phân mảnh;
+      userid là None hoặc băm theo (userid, movieid) thì đọc tất cả
+    - Metadata được đọc lại từ partition_catalog; khi đang repartition, mọi bảng cũ và mới đều
+      được đọc (không loại bỏ phân mảnh) vì các dòng có thể nằm ở cả hai nơi
+    """
+    refresh_partition_cache(openconnection)
+    tablenames = []
+    metadata = get_partition_metadata(RANGE_TABLE_PREFIX, openconnection)
+    if metadata is not None and metadata['migrationcount'] is not None:
+        boundaries, rangetables = None, metadata['tablenames']
+    elif metadata is not None:
+        boundaries, rangetables = metadata['boundaries'], metadata['tablenames']
+    else:
+        boundaries = get_range_boundaries(openconnection)
+        rangetables = [RANGE_TABLE_PREFIX + str(i) for i in range(len(boundaries) - 1)] if boundaries else []
+    if rangetables:
+        if ratingMin is None or ratingMax is None or boundaries is None:
+            tablenames.extend(rangetables)
+        else:
+            tablenames.extend(rangetables[i] for i in overlapping_range_partitions(boundaries, ratingMin, ratingMax))
+    
+    tablenames.extend(partition_tablenames(RROBIN_TABLE_PREFIX, openconnection))
+    
+    hashtables = partition_tablenames(HASH_TABLE_PREFIX, openconnection)
+    metadata = get_partition_metadata(HASH_TABLE_PREFIX, openconnection)
+    migrating = metadata is not None and metadata['migrationcount'] is not None
+    if hashtables and userid is not None and not hash_key_includes_movieid(metadata) and not migrating:
+        tablenames.append(hashtables[hash_partition_index(userid, None, len(hashtables))])
+    else:
+        tablenames.extend(hashtables)
+    return tablenames
+
+def stream_query(openconnection, query, params, batchsize=QUERY_BATCH_SIZE):
+    """
+    Generator that runs @query on a server-side (named) cursor and yields its rows, fetching @batchsize rows at a time.
+    
+    Notes:
+    -----
+    - Bộ nhớ phía client chỉ giữ một lô batchsize dòng, dù truy vấn trả về hàng triệu dòng
+    - Cursor chạy trong một transaction (BEGIN riêng nếu kết nối ở chế độ autocommit); transaction
+      kết thúc khi đọc hết, khi có lỗi hoặc khi generator bị đóng sớm
+    - Không dùng kết nối cho việc khác khi generator chưa kết thúc
+    """
+    with transaction(openconnection):
+        # Kết nối autocommit chỉ cho phép named cursor WITH HOLD; cursor được đóng trước COMMIT
+        # nên kết quả không bị lưu lại trên server
+        cur = openconnection.cursor(name="query_{0}".format(next(QUERY_CURSOR_IDS)),
+                                    withhold=openconnection.autocommit)
+        try:
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(batchsize)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        except GeneratorExit:
+            # Người dùng dừng đọc sớm: đóng cursor và kết thúc transaction bình thường
+            pass
+        finally:
+            cur.close()
+
+@instrumented
+def rangequery(ratingMin, ratingMax, openconnection, batchsize=QUERY_BATCH_SIZE, maxstaleness=REPLICA_MAX_STALENESS):
+    """
+    Function to stream every rating in [ratingMin, ratingMax] from the range and round robin partitions.
+    
+    Parameters:
+    -----------
+    ratingMin, ratingMax : float
+        Khoảng giá trị rating cần tìm (bao gồm cả hai đầu)
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database
+    batchsize : int, optional
+        Số dòng lấy từ server mỗi lần
+    maxstaleness : float, optional
+        Độ trễ tối đa (giây) của bản sao được dùng để đọc; None để chỉ đọc bản chính
+        
+    Returns:
+    --------
+    generator of (str, int, int, float)
+        Các bộ (tên phân mảnh, userid, movieid, rating)
+        
+    Notes:
+    -----
+    - Chỉ đọc các phân mảnh range có khoảng giao với [ratingMin, ratingMax], cộng với tất cả
+      phân mảnh round robin và hash (xem query_partition_tables)
+    - Các phân mảnh được gộp bằng UNION ALL và đọc qua một server-side cursor (xem stream_query)
+    - Mỗi rating có mặt ở mọi cách phân mảnh đã tạo nên xuất hiện một lần cho mỗi cách
+    - Phân mảnh nằm trên node khác: các phân mảnh của mỗi node được gộp và đọc trên một kết nối
+      của node đó, lần lượt từng node
+    - Phân mảnh có bản sao được đọc trên một bản sao đủ mới (xem replica_read_placement)
+    """
+    if ratingMin > ratingMax:
+        return
+    tablenames = query_partition_tables(openconnection, ratingMin, ratingMax)
+    if not tablenames:
+        return
+    placement = replica_read_placement(openconnection, tablenames, maxstaleness)
+    groups = {}
+    for tablename in tablenames:
+        groups.setdefault(placement.get(tablename), []).append(tablename)
+    
+    for node, tablenames in groups.items():
+        query = " UNION ALL ".join(
+            f"SELECT %s, userid, movieid, rating FROM {tablename} WHERE rating >= %s AND rating <= %s"
+            for tablename in tablenames)
+        params = []
+        for tablename in tablenames:
+            params.extend((tablename, ratingMin, ratingMax))
+        if node is None:
+            yield from stream_query(openconnection, query, params, batchsize)
+        else:
+            with get_node_pool(openconnection, node).connection() as con:
+                yield from stream_query(con, query, params, batchsize)
+
+@instrumented
+def pointquery(ratingValue, openconnection, userid=None, limit=None, workers=QUERY_WORKERS,
+               maxstaleness=REPLICA_MAX_STALENESS):
+    """
+    Function to find the ratings equal to @ratingValue (and/or of @userid) by scanning the partitions concurrently.
+    
+    Parameters:
+    -----------
+    ratingValue : float or None
+        Giá trị rating cần tìm; None để không lọc theo rating
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database (dùng để đọc metadata và xác định database)
+    userid : int, optional
+        Chỉ lấy các rating của user này
+    limit : int, optional
+        Số dòng tối đa cần lấy; khi đủ, các phân mảnh đang đọc bị hủy
+    workers : int, optional
+        Số phân mảnh được đọc song song, mỗi luồng dùng một kết nối riêng lấy từ pool
+    maxstaleness : float, optional
+        Độ trễ tối đa (giây) của bản sao được dùng để đọc; None để chỉ đọc bản chính
+        
+    Returns:
+    --------
+    generator of (str, int, int, float)
+        Các bộ (tên phân mảnh, userid, movieid, rating), theo thứ tự các phân mảnh đọc xong
+        
+    Notes:
+    -----
+    - Lọc theo rating: chỉ đọc đúng một phân mảnh range chứa giá trị đó; lọc theo userid: chỉ
+      đọc đúng một phân mảnh hash của user đó; phân mảnh round robin luôn phải đọc hết
+    - Kết quả của mỗi phân mảnh được trả ngay khi phân mảnh đó đọc xong
+    - Khi đủ limit dòng hoặc generator bị đóng sớm: các phân mảnh chưa đọc bị bỏ qua, truy vấn
+      đang chạy bị hủy bằng connection.cancel()
+    - Mọi phân mảnh được đọc qua cùng một snapshot (partition_snapshot), nên dòng đang được
+      repartition không bị trả về hai lần hay bị bỏ sót
+    """
+    if ratingValue is None and userid is None:
+        raise ValueError("pointquery needs a ratingValue or a userid")
+    if limit == 0:
+        return
+    
+    conditions, params = [], []
+    if ratingValue is not None:
+        conditions.append("rating = %s")
+        params.append(ratingValue)
+    if userid is not None:
+        conditions.append("userid = %s")
+        params.append(userid)
+    where = " AND ".join(conditions)
+    if limit is not None:
+        # Mỗi phân mảnh không cần trả về quá limit dòng
+        where += " LIMIT {0:d}".format(limit)
+    
+    query = "SELECT userid, movieid, rating FROM {tablename} WHERE " + where
+    count = 0
+    for attempt in range(METADATA_RETRIES):
+        tablenames = query_partition_tables(openconnection, ratingValue, ratingValue, userid)
+        if not tablenames:
+            return
+        placement = replica_read_placement(openconnection, tablenames, maxstaleness)
+        with partition_snapshot(openconnection, tablenames, placement) as snapshot:
+            if snapshot is False:
+                continue
+            try:
+                with closing(scatter_query(openconnection, tablenames, query, params, workers, placement,
+                                           snapshot)) as results:
+                    for tablename, rows in results:
+                        for row in rows:
+                            yield (tablename,) + row
+                            count += 1
+                            if limit is not None and count >= limit:
+                                return
+            except psycopg2.errors.UndefinedTable:
+                # Repartition vừa xóa bớt phân mảnh; chỉ đọc lại khi chưa trả về dòng nào
+                if count:
+                    raise
+                continue
+        return
+    raise RuntimeError("Partition metadata keeps changing")
+
+@contextmanager
+def partition_snapshot(openconnection, tablenames, placement):
+    """
+    Context manager that yields a snapshot id every connection can read the local tables of @tablenames
+    through, checked against the cached partition metadata.
+    
+    Parameters:
+    -----------
+    openconnection : psycopg2.extensions.connection
+        Kết nối gốc (dùng để xác định database và metadata trong cache)
+    tablenames : list of str
+        Các bảng phân mảnh sẽ được đọc
+    placement : dict
+        Tên bảng -> node đọc bảng đó (xem replica_read_placement)
+        
+    Returns:
+    --------
+    str, None or False
+        Snapshot id (pg_export_snapshot); None nếu có ít hơn hai bảng trên database hiện tại
+        (không cần dùng chung); False nếu metadata trong cache đã cũ so với snapshot (đọc lại
+        metadata rồi thử lại)
+        
+    Notes:
+    -----
+    - Snapshot được export từ một transaction REPEATABLE READ trên một kết nối của pool, giữ
+      cho đến hết khối with; version của các prefix trong partition_catalog được đọc trong cùng
+      snapshot và cùng round trip, nên danh sách bảng và dữ liệu đọc được luôn khớp nhau
+    - Không LOCK các bảng trong transaction này: LOCK TABLE của splitrangepartition xếp hàng
+      sau nó sẽ chặn các kết nối đọc, mà transaction chỉ kết thúc khi các kết nối đó đọc xong
+    """
+    local = [tablename for tablename in tablenames if placement.get(tablename) is None]
+    if len(local) < 2:
+        yield None
+        return
+    base = connection_key(openconnection)
+    versions = {metadata['prefix']: metadata['version'] for key, metadata in list(PARTITION_METADATA_CACHE.items())
+                if key[:-1] == base and set(local).intersection(metadata['tablenames'])}
+    with get_connection_pool(connection_dbname(openconnection)).connection() as con:
+        cur = con.cursor()
+        if versions:
+            cur.execute("""
+                SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;
+                SELECT pg_export_snapshot(),
+                       (SELECT json_object_agg(prefix, version) FROM partition_catalog WHERE prefix = ANY(%s))
+            """, (list(versions),))
+            snapshot, current = cur.fetchone()
+            if current != versions:
+                snapshot = False
+        else:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ; SELECT pg_export_snapshot()")
+            snapshot = cur.fetchone()[0]
+        cur.close()
+        yield snapshot
+
+def scatter_query(openconnection, tablenames, query, params=(), workers=QUERY_WORKERS, placement=None,
+                  snapshot=None):
+    """
+    Generator that runs @query on every table in @tablenames concurrently and yields (tablename, rows)
+    as each table finishes.
+    
+    Parameters:
+    -----------
+    openconnection : psycopg2.extensions.connection
+        Kết nối gốc (dùng để xác định database)
+    tablenames : list of str
+        Các bảng phân mảnh cần đọc
+    query : str
+        Câu truy vấn với chỗ trống {tablename}, ví dụ "SELECT COUNT(*) FROM {tablename}"
+    params : sequence, optional
+        Tham số của câu truy vấn (giống nhau cho mọi bảng)
+    workers : int, optional
+        Số bảng được đọc song song; mỗi luồng dùng một kết nối riêng lấy từ pool
+    placement : dict, optional
+        Tên bảng -> node đọc bảng đó; mặc định là partition_placement (đọc bản chính)
+    snapshot : str, optional
+        Snapshot id (xem partition_snapshot) mà các bảng trên database hiện tại được đọc qua
+        
+    Notes:
+    -----
+    - Khi generator bị đóng sớm hoặc một bảng bị lỗi: các bảng chưa đọc bị bỏ qua, truy vấn
+      đang chạy bị hủy bằng connection.cancel()
+    - Bảng nằm trên node khác (theo metadata trong cache, xem partition_placement) được đọc
+      bằng kết nối của pool của node đó
+    - Có snapshot: các bảng trên database hiện tại được đọc trên nhiều kết nối nhưng như một câu
+      UNION ALL, nên dòng đang được chuyển giữa các phân mảnh (repartition) không bị đếm hai lần
+      hay bị bỏ sót. Bảng trên node khác hoặc bản sao được đọc bằng snapshot riêng
+    """
+    pool = get_connection_pool(connection_dbname(openconnection))
+    if placement is None:
+        placement = partition_placement(openconnection)
+    active = {}  # tên bảng -> kết nối đang chạy truy vấn
+    lock = threading.Lock()
+    stopped = threading.Event()
+    parent = current_span()
+    
+    def scan(tablename):
+        if stopped.is_set():
+            return []
+        tablepool = get_node_pool(openconnection, placement.get(tablename))
+        con = tablepool.getconn()
+        try:
+            with lock:
+                active[tablename] = con
+            if stopped.is_set():
+                return []
+            with span('scan', parent, table=tablename, node=placement.get(tablename)) as phase:
+                cur = con.cursor()
+                if snapshot is not None and placement.get(tablename) is None:
+                    # Dùng chung snapshot, gửi cùng round trip với câu truy vấn
+                    cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ; SET TRANSACTION SNAPSHOT %s; "
+                                + query.format(tablename=tablename), (snapshot,) + tuple(params))
+                else:
+                    cur.execute(query.format(tablename=tablename), params)
+                rows = cur.fetchall()
+                cur.close()
+                phase.add_rows(len(rows))
+            return rows
+        except psycopg2.errors.QueryCanceled:
+            if stopped.is_set():
+                return []
+            raise
+        finally:
+            with lock:
+                active.pop(tablename, None)
+            tablepool.putconn(con)
+    
+    # Transaction giữ snapshot dùng chung chiếm một kết nối của pool
+    executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(tablenames), pool.maxconn - bool(snapshot))))
+    futures = {}
+    try:
+        futures = {executor.submit(scan, tablename): tablename for tablename in tablenames}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        # Dừng các bảng chưa đọc và hủy các truy vấn đang chạy
+        stopped.set()
+        for future in futures:
+            future.cancel()
+        with lock:
+            for con in active.values():
+                con.cancel()
+        executor.shutdown(wait=True)
+
+def partition_tablenames(prefix, openconnection):
+    """
+    Function to get the partition tables of @prefix from partition_catalog, or from the existing
+    tables for partitions created before the catalog.
+    """
+    metadata = get_partition_metadata(prefix, openconnection)
+    if metadata is not None:
+        return list(metadata['tablenames'])
+    return [prefix + str(i) for i in range(count_partitions(prefix, openconnection))]
+
+@instrumented
+def aggregatequery(openconnection, groupby=None, scheme='range', workers=QUERY_WORKERS,
+                   maxstaleness=REPLICA_MAX_STALENESS):
+    """
+    Function to compute count/sum/min/max/avg of rating from partial aggregates computed on each partition in parallel.
+    
+    Parameters:
+    -----------
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database
+    groupby : str, optional
+        None (toàn bộ bảng), 'movieid', 'userid' hoặc 'rating' (histogram theo giá trị rating)
+    scheme : str, optional
+        Đọc các phân mảnh 'range' (mặc định), 'roundrobin' hoặc 'hash'; mỗi rating có mặt ở mọi
+        cách phân mảnh nên chỉ đọc một cách để không bị đếm nhiều lần
+    workers : int, optional
+        Số phân mảnh được tính song song
+    maxstaleness : float, optional
+        Độ trễ tối đa (giây) của bản sao được dùng để đọc; None để chỉ đọc bản chính
+        
+    Returns:
+    --------
+    dict
+        groupby là None: {'count', 'sum', 'min', 'max', 'avg'};
+        ngược lại: {giá trị nhóm: {'count', 'sum', 'min', 'max', 'avg'}}
+        
+    Notes:
+    -----
+    - Mỗi phân mảnh trả về COUNT/SUM/MIN/MAX của từng nhóm; client gộp lại (cộng count và sum,
+      lấy min/max) nên kết quả giống hệt khi tính trên toàn bộ bảng
+    - avg được tính từ sum/count đã gộp
+    - Rating là bội số của 0.5 nên tổng dạng float8 cộng theo thứ tự nào cũng cho cùng kết quả
+    - Mọi phân mảnh được đọc qua cùng một snapshot (partition_snapshot); khi metadata đổi giữa
+      chừng (repartition bắt đầu/kết thúc) thì đọc lại metadata và tính lại từ đầu
+    """
+    if groupby not in (None, USER_ID_COLNAME, MOVIE_ID_COLNAME, RATING_COLNAME):
+        raise ValueError("Unknown groupby column: {0}".format(groupby))
+    if scheme == 'range':
+        prefix = RANGE_TABLE_PREFIX
+    elif scheme == 'roundrobin':
+        prefix = RROBIN_TABLE_PREFIX
+    elif scheme == 'hash':
+        prefix = HASH_TABLE_PREFIX
+    else:
+        raise ValueError("Unknown partitioning scheme: {0}".format(scheme))
+    
+    if groupby is None:
+        query = "SELECT NULL, COUNT(rating), SUM(rating), MIN(rating), MAX(rating) FROM {tablename}"
+    else:
+        query = (f"SELECT {groupby}, COUNT(rating), SUM(rating), MIN(rating), MAX(rating) "
+                 f"FROM {{tablename}} GROUP BY {groupby}")
+    
+    for attempt in range(METADATA_RETRIES):
+        refresh_partition_cache(openconnection)
+        tablenames = partition_tablenames(prefix, openconnection)
+        if not tablenames:
+            raise ValueError("No {0} partitions found".format(scheme))
+        placement = replica_read_placement(openconnection, tablenames, maxstaleness)
+        with partition_snapshot(openconnection, tablenames, placement) as snapshot:
+            if snapshot is False:
+                continue
+            # Gộp các kết quả từng phần theo nhóm
+            groups = {}
+            try:
+                for _, rows in scatter_query(openconnection, tablenames, query, workers=workers,
+                                             placement=placement, snapshot=snapshot):
+                    for key, count, total, low, high in rows:
+                        if not count:
+                            continue
+                        group = groups.get(key)
+                        if group is None:
+                            groups[key] = [count, total, low, high]
+                        else:
+                            group[0] += count
+                            group[1] += total
+                            group[2] = min(group[2], low)
+                            group[3] = max(group[3], high)
+            except psycopg2.errors.UndefinedTable:
+                # Repartition vừa kết thúc và xóa bớt phân mảnh sau khi metadata được đọc
+                continue
+        break
+    else:
+        raise RuntimeError("Partition metadata for {0} keeps changing".format(prefix))
+    
+    current_span().add_rows(sum(group[0] for group in groups.values()))
+    results = {key: {'count': count, 'sum': total, 'min': low, 'max': high, 'avg': total / count}
+               for key, (count, total, low, high) in groups.items()}
+    if groupby is None:
+        return results.get(None, {'count': 0, 'sum': None, 'min': None, 'max': None, 'avg': None})
+    return results
+
+def repartition_moves_table(prefix):
+    """
+    Function to get the name of the table that holds the pending row moves of a repartition of @prefix.
+    """
+    return 'repartition_moves_' + prefix
+
+def plan_repartition_moves(cur, metadata, numberofpartitions, boundaries):
+    """
+    Function to record, in one statement, every row whose partition changes when @metadata is repartitioned
+    into @numberofpartitions partitions.
+    
+    Notes:
+    -----
+    - Bảng repartition_moves_<prefix> chỉ lưu (id, phân mảnh nguồn, ctid, phân mảnh đích) của các
+      dòng phải chuyển; các dòng giữ nguyên phân mảnh không bị đụng tới
+    - Range: phân mảnh đích tính theo các mốc mới (range_partition_expression)
+    - Hash: phân mảnh đích là hash theo số phân mảnh mới (hash_partition_expression)
+    - Round robin: dòng thứ p (theo userid, movieid) của phân mảnh i được gán vị trí i + p * N;
+      phân mảnh đích là vị trí % số phân mảnh mới. Mỗi phân mảnh giữ đúng tập vị trí của nó nên
+      số dòng của các phân mảnh mới đúng như khi phân mảnh lại từ đầu. Vị trí thật của từng dòng
+      không được lưu: sau roundrobininsert (dòng mới nằm sau, theo thứ tự đến) các dòng có thể
+      vào phân mảnh khác so với roundrobinpartition chạy lại từ đầu, chỉ số dòng là giống nhau
+    - Được sắp theo (nguồn, ctid) nên mỗi lô chỉ đụng tới ít phân mảnh nguồn
+    """
+    prefix = metadata['prefix']
+    oldcount = metadata['numberofpartitions']
+    candidates = []
+    for i in range(oldcount):
+        if metadata['scheme'] == 'range':
+            target = range_partition_expression(boundaries)
+        elif metadata['scheme'] == 'hash':
+            target = hash_partition_expression(numberofpartitions, hash_key_includes_movieid(metadata))
+        else:
+            target = f"({i} + {oldcount} * (ROW_NUMBER() OVER (ORDER BY userid, movieid) - 1)) % {numberofpartitions}"
+        candidates.append(f"SELECT {i} AS source, ctid AS rowid, {target} AS target FROM {prefix}{i}")
+    moves = repartition_moves_table(prefix)
+    execute_heavy(cur, f"""
+    CREATE TABLE {moves} AS
+    SELECT ROW_NUMBER() OVER (ORDER BY source, rowid) AS id, source, rowid, target
+    FROM ({' UNION ALL '.join(candidates)}) AS candidates
+    WHERE target <> source
+    """)
+    cur.execute(f"ALTER TABLE {moves} ADD PRIMARY KEY (id)")
+
+def move_repartition_batch(cur, prefix, numberofpartitions, first_id, last_id):
+    """
+    Function to move the planned rows with first_id < id <= last_id to their new partitions.
+    
+    Returns:
+    --------
+    int
+        Số dòng đã chuyển
+        
+    Notes:
+    -----
+    - Với mỗi phân mảnh nguồn: một câu lệnh DELETE ... RETURNING rồi INSERT vào các phân mảnh đích
+      (data-modifying CTE), nên dữ liệu không đi qua client
+    - Xóa và insert cùng một transaction: các truy vấn đọc luôn thấy mỗi dòng đúng một lần
+    """
+    moves = repartition_moves_table(prefix)
+    cur.execute(f"SELECT DISTINCT source FROM {moves} WHERE id > %s AND id <= %s", (first_id, last_id))
+    moved = 0
+    for (source,) in cur.fetchall():
+        plan = execute_heavy(cur, f"""
+        WITH moved AS (
+            DELETE FROM {prefix}{source} AS t USING {moves} AS m
+            WHERE m.id > %s AND m.id <= %s AND m.source = %s AND t.ctid = m.rowid
+            RETURNING t.userid, t.movieid, t.rating, m.target AS partition_index
+        ){partition_insert_ctes(prefix, numberofpartitions, 'moved')}
+        SELECT COUNT(*) FROM moved
+        """, (first_id, last_id, source))
+        moved += cur.fetchone()[0] if plan is None else plan_inserted_rows(plan)
+    cur.execute(f"DELETE FROM {moves} WHERE id > %s AND id <= %s", (first_id, last_id))
+    return moved
+
+@instrumented
+def repartition(prefix, newcount, openconnection, batchsize=REPARTITION_BATCH_SIZE):
+    """
+    Function to change the number of partitions of @prefix in place, moving only the rows whose partition changes.
+    
+    Parameters:
+    -----------
+    prefix : str
+        RANGE_TABLE_PREFIX, RROBIN_TABLE_PREFIX hoặc HASH_TABLE_PREFIX
+    newcount : int
+        Số phân mảnh mới
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database
+    batchsize : int, optional
+        Số dòng tối đa được chuyển trong mỗi transaction
+        
+    Returns:
+    --------
+    dict
+        Thống kê: moved (số dòng đã chuyển), batches, seconds
+        
+    Notes:
+    -----
+    - Không đọc lại bảng ratings: dữ liệu được chuyển trực tiếp giữa các bảng phân mảnh
+    - Range: các mốc mới được tính theo mode đã lưu (chia đều, hoặc equi-depth từ histogram của
+      chính các phân mảnh với equidepth và các phân mảnh đã bị tách); hash: băm lại theo số
+      phân mảnh mới; round robin: theo vị trí (xem plan_repartition_moves)
+    - Các bước:
+        1. Khóa dòng metadata (chờ các insert đang chạy), tạo các bảng mới, ghi số phân mảnh đích
+           vào partition_catalog và tăng version: từ đây mọi lệnh ghi vào prefix bị từ chối
+        2. Lập danh sách các dòng cần chuyển (repartition_moves_<prefix>)
+        3. Chuyển từng lô batchsize dòng, mỗi lô một transaction
+        4. Chuyển đổi metadata trong một transaction: xóa các bảng thừa (đã rỗng), ghi số phân
+           mảnh và mốc mới, tăng version
+    - Trong lúc chạy, các truy vấn đọc vẫn hoạt động: đọc tất cả các bảng cũ và mới trong cùng một
+      snapshot (xem partition_snapshot), nên mỗi dòng được thấy đúng một lần
+    - Nếu bị dừng giữa chừng, gọi lại repartition với cùng newcount để tiếp tục từ lô chưa commit
+    - Chỉ hỗ trợ các phân mảnh nằm trên database hiện tại (không đặt trên node khác) và chưa có bản sao
+    """
+    if not isinstance(newcount, int) or newcount <= 0:
+        raise ValueError("Number of partitions must be a positive integer: {0}".format(newcount))
+    try:
+        start_time = time.time()
+        moves = repartition_moves_table(prefix)
+        
+        # Bước 1: đánh dấu đang repartition
+        with span('prepare', newcount=newcount), transaction(openconnection) as cur:
+            ensure_partition_catalog(cur)
+            cur.execute(f"SELECT {', '.join(PARTITION_METADATA_COLUMNS)} FROM partition_catalog "
+                        f"WHERE prefix = %s FOR UPDATE", (prefix,))
+            row = cur.fetchone()
+            if row is None:
+                raise ValueError("No partition metadata for {0}".format(prefix))
+            metadata = dict(zip(PARTITION_METADATA_COLUMNS, row))
+            check_local_partitions(metadata)
+            check_unreplicated_partitions(metadata)
+            
+            if metadata['migrationcount'] is None:
+                boundaries = None
+                if metadata['scheme'] == 'range':
+                    if metadata['mode'] not in (None, 'uniform'):
+                        partitions = ' UNION ALL '.join(f"SELECT rating FROM {tablename}"
+                                                        for tablename in metadata['tablenames'])
+                        boundaries = equidepth_range_boundaries(
+                            range_rating_histogram(cur, f"({partitions}) AS partitions"), newcount)
+                    else:
+                        boundaries = uniform_range_boundaries(newcount)
+                for i in range(metadata['numberofpartitions'], newcount):
+                    create_partition_table(cur, prefix + str(i), metadata['indexes'])
+                tablenames = [prefix + str(i) for i in range(max(metadata['numberofpartitions'], newcount))]
+                cur.execute("""
+                UPDATE partition_catalog
+                SET migrationcount = %s, migrationboundaries = %s, tablenames = %s, version = version + 1
+                WHERE prefix = %s
+                """, (newcount, boundaries, tablenames, prefix))
+                metadata['migrationboundaries'] = boundaries
+            elif metadata['migrationcount'] != newcount:
+                raise ValueError("Partitions {0} are already being repartitioned into {1} partitions"
+                                 .format(prefix, metadata['migrationcount']))
+        invalidate_partition_cache(prefix)
+        
+        # Bước 2: lập danh sách các dòng cần chuyển (bỏ qua nếu đang tiếp tục lần chạy trước)
+        with span('plan'), transaction(openconnection) as cur:
+            cur.execute("SELECT to_regclass(%s) IS NULL", (moves,))
+            if cur.fetchone()[0]:
+                plan_repartition_moves(cur, metadata, newcount, metadata['migrationboundaries'])
+            cur.execute(f"SELECT COALESCE(MIN(id), 1) - 1, COALESCE(MAX(id), 0) FROM {moves}")
+            first_id, last_id = cur.fetchone()
+        
+        # Bước 3: chuyển từng lô
+        moved = 0
+        batches = 0
+        with span('move', batchsize=batchsize) as phase:
+            while first_id < last_id:
+                with transaction(openconnection) as cur:
+                    moved += move_repartition_batch(cur, prefix, newcount, first_id, first_id + batchsize)
+                first_id += batchsize
+                batches += 1
+            phase.add_rows(moved)
+            phase.set(batches=batches)
+        current_span().add_rows(moved)
+        
+        # Bước 4: chuyển đổi metadata
+        with span('finish'), transaction(openconnection) as cur:
+            cur.execute("SELECT numberofpartitions FROM partition_catalog WHERE prefix = %s FOR UPDATE", (prefix,))
+            oldcount = cur.fetchone()[0]
+            cur.execute(f"SELECT COUNT(*) FROM {moves}")
+            if cur.fetchone()[0]:
+                raise RuntimeError("Repartition of {0} still has rows to move".format(prefix))
+            for i in range(newcount, oldcount):
+                cur.execute(f"SELECT EXISTS (SELECT 1 FROM {prefix}{i})")
+                if cur.fetchone()[0]:
+                    raise RuntimeError("Partition {0}{1} is not empty after repartition".format(prefix, i))
+                cur.execute(f"DROP TABLE {prefix}{i}")
+            cur.execute(f"DROP TABLE {moves}")
+            cur.execute("""
+            UPDATE partition_catalog
+            SET numberofpartitions = migrationcount, boundaries = migrationboundaries, tablenames = %s,
+                migrationcount = NULL, migrationboundaries = NULL, version = version + 1
+            WHERE prefix = %s
+            """, ([prefix + str(i) for i in range(newcount)], prefix))
+        invalidate_partition_cache(prefix)
+        
+        # Tính và in thời gian thực thi
+        execution_time = time.time() - start_time
+        print(f"Thời gian thực thi hàm repartition: {execution_time:.2f} giây ({moved} dòng được chuyển)")
+        return {'moved': moved, 'batches': batches, 'seconds': execution_time}
+        
+    except Exception as e:
+        invalidate_partition_cache(prefix)
+        print("Error: Could not repartition {0}".format(prefix))
+        print(e)
+        raise e
+
+def split_point(histogram):
+    """
+    Function to choose the rating at which a range partition is split into two halves of similar size.
+    
+    Parameters:
+    -----------
+    histogram : list of (float, int)
+        Các cặp (giá trị rating, số dòng) của phân mảnh, sắp xếp tăng dần theo rating
+        
+    Returns:
+    --------
+    float or None
+        Mốc m: nửa trái chứa các rating <= m, nửa phải chứa các rating > m;
+        None nếu phân mảnh có ít hơn hai giá trị rating khác nhau (không thể tách)
+    """
+    if len(histogram) < 2:
+        return None
+    total = sum(count for _, count in histogram)
+    running = 0
+    best, best_distance = None, None
+    # Không chọn giá trị lớn nhất để nửa phải không bị rỗng
+    for value, count in histogram[:-1]:
+        running += count
+        distance = abs(running - total / 2.0)
+        if best_distance is None or distance < best_distance:
+            best, best_distance = value, distance
+    return best
+
+@instrumented
+def splitrangepartition(index, openconnection):
+    """
+    Function to split range partition @index into two partitions at the median of its ratings.
+    
+    Parameters:
+    -----------
+    index : int
+        Số thứ tự phân mảnh range cần tách
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database
+        
+    Returns:
+    --------
+    dict or None
+        split (mốc tách), left, right (số dòng của hai nửa); None nếu phân mảnh chỉ có một giá trị rating
+        
+    Notes:
+    -----
+    - Phân mảnh index (lo, hi] được thay bằng (lo, m] và (m, hi]; các bảng phía sau được đổi tên
+      lùi một số (range_part{index+1} thành range_part{index+2}, ...) để tên bảng vẫn liên tục
+    - Toàn bộ việc tách nằm trong một transaction giữ khóa FOR UPDATE trên dòng metadata rồi khóa
+      các bảng bị thay đổi: các insert đang chạy được chờ kết thúc trước, các insert sau
+      đó thấy version mới và định tuyến lại theo mốc mới, nên không có dòng nào được ghi vào
+      bảng đang bị thay thế
+    - Chỉ hỗ trợ các phân mảnh nằm trên database hiện tại (không đặt trên node khác) và chưa có bản sao
+    """
+    try:
+        start_time = time.time()
+        
+        while True:
+            metadata = get_partition_metadata(RANGE_TABLE_PREFIX, openconnection, refresh=True)
+            if metadata is None:
+                raise ValueError("No partition metadata for {0}".format(RANGE_TABLE_PREFIX))
+            check_partition_writable(metadata)
+            check_local_partitions(metadata)
+            check_unreplicated_partitions(metadata)
+            numberofpartitions = metadata['numberofpartitions']
+            if not 0 <= index < numberofpartitions:
+                raise ValueError("No range partition with index {0}".format(index))
+            
+            with transaction(openconnection) as cur:
+                # Khóa dòng metadata trước các bảng, cùng thứ tự với mọi hàm insert (khóa metadata
+                # FOR SHARE rồi mới ghi vào bảng), để hai bên không chờ nhau (deadlock)
+                cur.execute("SELECT version FROM partition_catalog WHERE prefix = %s FOR UPDATE",
+                            (RANGE_TABLE_PREFIX,))
+                row = cur.fetchone()
+                if row is None or row[0] != metadata['version']:
+                    # Các phân mảnh đã thay đổi trong lúc chờ khóa: đọc lại metadata
+                    continue
+                cur.execute(f"LOCK TABLE {', '.join(metadata['tablenames'][index:])} IN ACCESS EXCLUSIVE MODE")
+            
+                # Chọn mốc tách từ dữ liệu của phân mảnh
+                split = split_point(range_rating_histogram(cur, RANGE_TABLE_PREFIX + str(index)))
+                if split is None:
+                    invalidate_partition_cache(RANGE_TABLE_PREFIX)
+                    return None
+            
+                # Dời tên các bảng phía sau, tạo bảng cho nửa phải và chuyển các dòng rating > mốc
+                for i in range(numberofpartitions - 1, index, -1):
+                    rename_partition_table(cur, RANGE_TABLE_PREFIX + str(i), RANGE_TABLE_PREFIX + str(i + 1))
+                create_partition_table(cur, RANGE_TABLE_PREFIX + str(index + 1), metadata['indexes'])
+                cur.execute(f"""
+                WITH moved AS (
+                    DELETE FROM {RANGE_TABLE_PREFIX}{index} WHERE rating > %s
+                    RETURNING userid, movieid, rating
+                )
+                INSERT INTO {RANGE_TABLE_PREFIX}{index + 1} (userid, movieid, rating)
+                SELECT userid, movieid, rating FROM moved
+                """, (split,))
+                right = cur.rowcount
+                cur.execute(f"SELECT COUNT(*) FROM {RANGE_TABLE_PREFIX}{index}")
+                left = cur.fetchone()[0]
+            
+                boundaries = list(metadata['boundaries'])
+                boundaries.insert(index + 1, split)
+                cur.execute("""
+                UPDATE partition_catalog
+                SET numberofpartitions = %s, boundaries = %s, tablenames = %s, mode = 'split', version = version + 1
+                WHERE prefix = %s
+                """, (numberofpartitions + 1, boundaries,
+                      [RANGE_TABLE_PREFIX + str(i) for i in range(numberofpartitions + 1)], RANGE_TABLE_PREFIX))
+            break
+        invalidate_partition_cache(RANGE_TABLE_PREFIX)
+        
+        # Tính và in thời gian thực thi
+        execution_time = time.time() - start_time
+        print(f"Thời gian thực thi hàm splitrangepartition: {execution_time:.2f} giây ({right} dòng được chuyển)")
+        return {'index': index, 'split': split, 'left': left, 'right': right}
+        
+    except Exception as e:
+        invalidate_partition_cache(RANGE_TABLE_PREFIX)
+        print("Error: Could not split range partition {0}".format(index))
+        print(e)
+        raise e
+
+class MaintenanceTask(object):
+    """
+    Base class of the background maintenance tasks: runs check() every @interval seconds in its own thread.
+    
+    Notes:
+    -----
+    - Lớp con cài đặt check(); lỗi của lần kiểm tra gần nhất được lưu trong lasterror và lần
+      kiểm tra sau vẫn chạy bình thường
+    - Dùng start()/stop() hoặc with: with HotPartitionSplitter(con, maxskew=2.0): ...
+    """
+    
+    def __init__(self, openconnection, interval):
+        self.dbname = connection_dbname(openconnection)
+        self.interval = interval
+        self.lasterror = None
+        self.stopped = threading.Event()
+        self.thread = None
+        
+    def check(self):
+        raise NotImplementedError
+    
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.check()
+                self.lasterror = None
+            except Exception as e:
+                # Lỗi tạm thời (ví dụ đang repartition): thử lại ở chu kỳ sau
+                self.lasterror = e
+            self.stopped.wait(self.interval)
+            
+    def start(self):
+        if self.thread is not None:
+            raise RuntimeError("{0} is already running".format(type(self).__name__))
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name=type(self).__name__, daemon=True)
+        self.thread.start()
+        
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+        
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+class HotPartitionSplitter(MaintenanceTask):
+    """
+    Background maintenance task that watches the row counts of the range partitions and splits the ones
+    that grow too large (splitrangepartition).
+    Chạy trong một thread riêng, dùng kết nối lấy từ pool của database (không dùng chung kết nối của người gọi).
+    
+    Parameters:
+    -----------
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database (chỉ dùng để xác định database)
+    maxrows : int, optional
+        Tách phân mảnh có nhiều hơn maxrows dòng
+    maxskew : float, optional
+        Tách phân mảnh có số dòng lớn hơn maxskew lần số dòng trung bình của các phân mảnh
+    minrows : int, optional
+        Không tách phân mảnh có ít hơn minrows dòng
+    interval : float, optional
+        Chu kỳ kiểm tra (giây)
+        
+    Notes:
+    -----
+    - Số dòng của các phân mảnh được đếm song song (scatter_query)
+    - Mỗi lần kiểm tra tách phân mảnh vượt ngưỡng lớn nhất rồi đếm lại, cho đến khi không còn
+      phân mảnh nào vượt ngưỡng
+    - Phân mảnh chỉ có một giá trị rating không thể tách và được bỏ qua
+    - splits chứa kết quả các lần tách; lỗi của lần kiểm tra gần nhất được lưu trong lasterror
+    """
+    
+    def __init__(self, openconnection, maxrows=None, maxskew=None, minrows=SPLIT_MIN_ROWS,
+                 interval=SPLIT_CHECK_INTERVAL):
+        if maxrows is None and maxskew is None:
+            raise ValueError("HotPartitionSplitter needs maxrows or maxskew")
+        MaintenanceTask.__init__(self, openconnection, interval)
+        self.maxrows = maxrows
+        self.maxskew = maxskew
+        self.minrows = minrows
+        self.splits = []
+        
+    def partition_counts(self, con):
+        tablenames = partition_tablenames(RANGE_TABLE_PREFIX, con)
+        counts = dict(scatter_query(con, tablenames, "SELECT COUNT(*) FROM {tablename}"))
+        return [counts[tablename][0][0] for tablename in tablenames]
+    
+    def hot_partitions(self, counts):
+        # Các phân mảnh vượt ngưỡng, lớn nhất trước
+        mean = sum(counts) / float(len(counts)) if counts else 0.0
+        hot = [i for i, count in enumerate(counts)
+               if count >= self.minrows
+               and ((self.maxrows is not None and count > self.maxrows)
+                    or (self.maxskew is not None and count > self.maxskew * mean))]
+        return sorted(hot, key=lambda i: -counts[i])
+    
+    def check(self):
+        """
+        Function to run one pass: split hot partitions until none is left. Returns the splits made in this pass.
+        """
+        splits = []
+        skipped = set()  # (cận dưới, cận trên) của các phân mảnh không thể tách
+        with get_connection_pool(self.dbname).connection() as con:
+            while not self.stopped.is_set():
+                refresh_partition_cache(con)
+                metadata = get_partition_metadata(RANGE_TABLE_PREFIX, con)
+                if metadata is None or metadata['migrationcount'] is not None:
+                    break
+                boundaries = metadata['boundaries']
+                hot = [i for i in self.hot_partitions(self.partition_counts(con))
+                       if (boundaries[i], boundaries[i + 1]) not in skipped]
+                if not hot:
+                    break
+                result = splitrangepartition(hot[0], con)
+                if result is None:
+                    skipped.add((boundaries[hot[0]], boundaries[hot[0] + 1]))
+                    continue
+                splits.append(result)
+        self.splits.extend(splits)
+        return splits
+
+def ensure_replica_tables(cur):
+    """
+    Function to create the insert log and the replica state table on the coordinator.
+    
+    Notes:
+    -----
+    - partition_insert_log: các dòng đã ghi vào phân mảnh có bản sao, kèm xid của transaction
+      đã ghi chúng; các dòng đã được mọi bản sao áp dụng bị xóa khi đồng bộ (syncreplicas)
+    - partition_replicas: snapshot (pg_snapshot) đã áp dụng lên mỗi bản sao, chép lại từ bản sao
+      sau mỗi lần đồng bộ; dùng để tính độ trễ (replicalag) và dọn insert log.
+      syncedat là NULL khi bản sao chưa được sao chép xong (addreplica)
+    """
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS partition_insert_log (
+        id BIGSERIAL PRIMARY KEY,
+        prefix TEXT NOT NULL,
+        tablename TEXT NOT NULL,
+        userid INTEGER,
+        movieid INTEGER,
+        rating FLOAT,
+        xid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+        loggedat TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS partition_insert_log_prefix_xid ON partition_insert_log (prefix, xid)")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS partition_replicas (
+        prefix TEXT,
+        replica TEXT,
+        snapshot TEXT NOT NULL,
+        syncedat TIMESTAMPTZ,
+        PRIMARY KEY (prefix, replica)
+    )
+    """)
+
+def ensure_replica_state(cur):
+    """
+    Function to create, on a replica node, the table holding the snapshot of the coordinator applied to each prefix.
+    """
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS partition_replica_state (
+        prefix TEXT PRIMARY KEY,
+        snapshot TEXT NOT NULL,
+        syncedat TIMESTAMPTZ NOT NULL
+    )
+    """)
+
+@instrumented
+def addreplica(prefix, replica, openconnection):
+    """
+    Function to add a replica of every partition of @prefix on node @replica.
+    
+    Parameters:
+    -----------
+    prefix : str
+        Prefix tên bảng phân mảnh (RANGE_TABLE_PREFIX, RROBIN_TABLE_PREFIX, HASH_TABLE_PREFIX)
+    replica : str
+        Node chứa bản sao: tên database hoặc DSN (xem node_dsn), khác database hiện tại
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database chứa các phân mảnh và partition_catalog
+        
+    Notes:
+    -----
+    - Bước 1: đăng ký bản sao trong partition_catalog và tăng version; từ đây mọi lệnh ghi vào
+      prefix ghi thêm vào insert log (các lệnh ghi đang chạy được chờ kết thúc trước)
+    - Bước 2: sao chép toàn bộ các phân mảnh (kèm index) sang @replica theo một snapshot
+      REPEATABLE READ của coordinator; snapshot này được lưu làm điểm bắt đầu đồng bộ, nên các
+      dòng ghi sau đó được syncreplicas áp dụng đúng một lần
+    - Các bảng cùng tên đã có trên @replica bị thay thế
+    - Chỉ hỗ trợ các phân mảnh nằm trên database hiện tại (không đặt trên node khác)
+    """
+    try:
+        start_time = time.time()
+        if replica is None:
+            raise ValueError("A replica node is required")
+        
+        # Bước 1: đăng ký bản sao
+        with transaction(openconnection) as cur:
+            ensure_partition_catalog(cur)
+            ensure_replica_tables(cur)
+            cur.execute(f"SELECT {', '.join(PARTITION_METADATA_COLUMNS)} FROM partition_catalog "
+                        f"WHERE prefix = %s FOR UPDATE", (prefix,))
+            row = cur.fetchone()
+            if row is None:
+                raise ValueError("No partition metadata for {0}".format(prefix))
+            metadata = dict(zip(PARTITION_METADATA_COLUMNS, row))
+            check_partition_writable(metadata)
+            check_local_partitions(metadata)
+            if replica in (metadata['replicas'] or ()):
+                raise ValueError("{0} is already a replica of {1}".format(replica, prefix))
+            cur.execute("""
+            UPDATE partition_catalog SET replicas = array_append(COALESCE(replicas, '{}'), %s), version = version + 1
+            WHERE prefix = %s
+            """, (replica, prefix))
+            # Snapshot tạm (sớm hơn bản sao) để insert log chưa bị dọn trong lúc sao chép
+            cur.execute("""
+            INSERT INTO partition_replicas (prefix, replica, snapshot, syncedat)
+            VALUES (%s, %s, pg_current_snapshot()::TEXT, NULL)
+            ON CONFLICT (prefix, replica) DO UPDATE SET snapshot = EXCLUDED.snapshot, syncedat = NULL
+            """, (prefix, replica))
+        invalidate_partition_cache(prefix)
+        
+        try:
+            # Bước 2: sao chép các phân mảnh theo một snapshot của coordinator
+            with get_node_pool(openconnection, None).connection() as source, \
+                    get_node_pool(openconnection, replica).connection() as target:
+                source_cur = source.cursor()
+                source_cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                source_cur.execute("SELECT pg_current_snapshot()::TEXT, clock_timestamp()")
+                snapshot, syncedat = source_cur.fetchone()
+                
+                cur = target.cursor()
+                ensure_replica_state(cur)
+                for tablename in metadata['tablenames']:
+                    cur.execute(f"DROP TABLE IF EXISTS {tablename}")
+                    create_partition_table(cur, tablename)
+                    copy_query_to_table(source, f"SELECT userid, movieid, rating FROM {tablename}", cur, tablename)
+                    for spec in metadata['indexes'] or ():
+                        cur.execute(partition_index_definition(tablename, spec)[1])
+                cur.execute("""
+                INSERT INTO partition_replica_state (prefix, snapshot, syncedat) VALUES (%s, %s, %s)
+                ON CONFLICT (prefix) DO UPDATE SET snapshot = EXCLUDED.snapshot, syncedat = EXCLUDED.syncedat
+                """, (prefix, snapshot, syncedat))
+                target.commit()
+                cur.close()
+                
+                source.rollback()
+                source_cur.execute("UPDATE partition_replicas SET snapshot = %s, syncedat = %s "
+                                   "WHERE prefix = %s AND replica = %s", (snapshot, syncedat, prefix, replica))
+                source.commit()
+                source_cur.close()
+        except Exception:
+            # Hủy đăng ký để các lệnh ghi không tiếp tục ghi insert log cho bản sao này
+            with transaction(openconnection) as cur:
+                cur.execute("""
+                UPDATE partition_catalog SET replicas = NULLIF(array_remove(replicas, %s), '{}'), version = version + 1
+                WHERE prefix = %s
+                """, (replica, prefix))
+                cur.execute("DELETE FROM partition_replicas WHERE prefix = %s AND replica = %s", (prefix, replica))
+            raise
+        invalidate_partition_cache(prefix)
+        
+        # Tính và in thời gian thực thi
+        execution_time = time.time() - start_time
+        print(f"Thời gian thực thi hàm addreplica: {execution_time:.2f} giây")
+        
+    except Exception as e:
+        invalidate_partition_cache(prefix)
+        print("Error: Could not add replica {0} of {1}".format(replica, prefix))
+        print(e)
+        raise e
+
+@instrumented
+def removereplica(prefix, replica, openconnection):
+    """
+    Function to stop replicating @prefix to @replica and drop the replica tables there.
+    """
+    try:
+        with transaction(openconnection) as cur:
+            cur.execute(f"SELECT {', '.join(PARTITION_METADATA_COLUMNS)} FROM partition_catalog "
+                        f"WHERE prefix = %s FOR UPDATE", (prefix,))
+            row = cur.fetchone()
+            metadata = dict(zip(PARTITION_METADATA_COLUMNS, row)) if row else None
+            if metadata is None or replica not in (metadata['replicas'] or ()):
+                raise ValueError("{0} is not a replica of {1}".format(replica, prefix))
+            cur.execute("""
+            UPDATE partition_catalog SET replicas = NULLIF(array_remove(replicas, %s), '{}'), version = version + 1
+            WHERE prefix = %s
+            """, (replica, prefix))
+            cur.execute("DELETE FROM partition_replicas WHERE prefix = %s AND replica = %s", (prefix, replica))
+            if len(metadata['replicas']) == 1:
+                cur.execute("DELETE FROM partition_insert_log WHERE prefix = %s", (prefix,))
+        invalidate_partition_cache(prefix)
+        
+        with get_node_pool(openconnection, replica).connection() as con:
+            cur = con.cursor()
+            cur.execute(f"DROP TABLE IF EXISTS {', '.join(metadata['tablenames'])}")
+            cur.execute("SELECT to_regclass('partition_replica_state') IS NOT NULL")
+            if cur.fetchone()[0]:
+                cur.execute("DELETE FROM partition_replica_state WHERE prefix = %s", (prefix,))
+            con.commit()
+            cur.close()
+        
+    except Exception as e:
+        invalidate_partition_cache(prefix)
+        print("Error: Could not remove replica {0} of {1}".format(replica, prefix))
+        print(e)
+        raise e
+
+@instrumented
+def syncreplica(prefix, replica, openconnection, batchsize=QUERY_BATCH_SIZE):
+    """
+    Function to apply to @replica the rows logged for @prefix since its last synchronisation.
+    
+    Returns:
+    --------
+    int or None
+        Số dòng đã áp dụng; None nếu bản sao chưa được sao chép xong (addreplica đang chạy)
+        
+    Notes:
+    -----
+    - Bản sao lưu snapshot S của coordinator mà nó đã áp dụng (partition_replica_state); mỗi lần
+      đồng bộ lấy snapshot mới S' và áp dụng các dòng log của các transaction thấy được trong S'
+      nhưng không thấy trong S. Mỗi transaction đã commit thấy được trong đúng một khoảng như vậy,
+      nên mỗi dòng được áp dụng đúng một lần, kể cả khi các transaction commit khác thứ tự id
+    - Dữ liệu và snapshot mới được ghi trong cùng một transaction trên bản sao; khóa FOR UPDATE trên
+      dòng trạng thái ngăn hai lần đồng bộ chạy đồng thời
+    """
+    with get_node_pool(openconnection, replica).connection() as target, \
+            get_node_pool(openconnection, None).connection() as source:
+        cur = target.cursor()
+        cur.execute("SELECT to_regclass('partition_replica_state') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return None
+        cur.execute("SELECT snapshot FROM partition_replica_state WHERE prefix = %s FOR UPDATE", (prefix,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        previous = row[0]
+        
+        source_cur = source.cursor()
+        source_cur.execute("SELECT pg_current_snapshot()::TEXT, clock_timestamp()")
+        snapshot, syncedat = source_cur.fetchone()
+        log = source.cursor(name="replica_{0}".format(next(QUERY_CURSOR_IDS)))
+        log.execute("""
+        SELECT tablename, userid, movieid, rating FROM partition_insert_log
+        WHERE prefix = %s AND xid >= pg_snapshot_xmin(%s::pg_snapshot)
+          AND pg_visible_in_snapshot(xid, %s::pg_snapshot) AND NOT pg_visible_in_snapshot(xid, %s::pg_snapshot)
+        """, (prefix, previous, snapshot, previous))
+        applied = 0
+        while True:
+            rows = log.fetchmany(batchsize)
+            if not rows:
+                break
+            groups = {}
+            for tablename, userid, movieid, rating in rows:
+                group = groups.setdefault(tablename, ([], [], []))
+                group[0].append(userid)
+                group[1].append(movieid)
+                group[2].append(rating)
+            for tablename, (userids, movieids, ratings) in groups.items():
+                copy_binary_columns(cur, tablename, userids, movieids, ratings)
+            applied += len(rows)
+        log.close()
+        
+        cur.execute("UPDATE partition_replica_state SET snapshot = %s, syncedat = %s WHERE prefix = %s",
+                    (snapshot, syncedat, prefix))
+        target.commit()
+        cur.close()
+        
+        # Chép trạng thái về coordinator (không tạo lại nếu bản sao vừa bị removereplica)
+        source_cur.execute("UPDATE partition_replicas SET snapshot = %s, syncedat = %s "
+                           "WHERE prefix = %s AND replica = %s", (snapshot, syncedat, prefix, replica))
+        source.commit()
+        source_cur.close()
+    return applied
+
+@instrumented
+def syncreplicas(prefix, openconnection, batchsize=QUERY_BATCH_SIZE):
+    """
+    Function to synchronise every replica of @prefix from the insert log, then trim the log.
+    
+    Returns:
+    --------
+    dict
+        Bản sao -> số dòng đã áp dụng (None nếu bản sao chưa sao chép xong)
+        
+    Notes:
+    -----
+    - Các dòng log của transaction có xid nhỏ hơn xmin của snapshot của mọi bản sao đã được áp
+      dụng ở tất cả các bản sao và bị xóa
+    """
+    metadata = get_partition_metadata(prefix, openconnection, refresh=True)
+    if metadata is None or not metadata['replicas']:
+        return {}
+    applied = {replica: syncreplica(prefix, replica, openconnection, batchsize) for replica in metadata['replicas']}
+    
+    with transaction(openconnection) as cur:
+        cur.execute("""
+        DELETE FROM partition_insert_log
+        WHERE prefix = %s AND xid < (SELECT MIN(pg_snapshot_xmin(snapshot::pg_snapshot))
+                                     FROM partition_replicas WHERE prefix = %s)
+        """, (prefix, prefix))
+    return applied
+
+def replicalag(prefix, openconnection):
+    """
+    Function to report how far behind each replica of @prefix is.
+    
+    Returns:
+    --------
+    list of dict
+        Với mỗi bản sao: replica, syncedat (thời điểm của snapshot đã áp dụng), pendingrows (số
+        dòng đã commit nhưng chưa áp dụng), lagseconds (tuổi của dòng chưa áp dụng lâu nhất, 0 nếu
+        không còn dòng nào; None nếu bản sao chưa sao chép xong)
+        
+    Notes:
+    -----
+    - Tính trên coordinator bằng một câu truy vấn, không cần kết nối đến các bản sao
+    """
+    cur = openconnection.cursor()
+    cur.execute("SELECT to_regclass('partition_replicas') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        cur.close()
+        return []
+    cur.execute("""
+    SELECT r.replica, r.syncedat, pending.rows, EXTRACT(EPOCH FROM clock_timestamp() - pending.oldest)
+    FROM partition_replicas r
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS rows, MIN(l.loggedat) AS oldest
+        FROM partition_insert_log l
+        WHERE l.prefix = r.prefix AND l.xid >= pg_snapshot_xmin(r.snapshot::pg_snapshot)
+          AND NOT pg_visible_in_snapshot(l.xid, r.snapshot::pg_snapshot)
+    ) AS pending
+    WHERE r.prefix = %s
+    ORDER BY r.replica
+    """, (prefix,))
+    lags = []
+    for replica, syncedat, pendingrows, oldest in cur.fetchall():
+        if syncedat is None:
+            lagseconds = None
+        else:
+            lagseconds = max(float(oldest), 0.0) if pendingrows else 0.0
+        lags.append({'replica': replica, 'syncedat': syncedat, 'pendingrows': pendingrows,
+                     'lagseconds': lagseconds})
     cur.close()
-    con.commit()
+    return lags
+
+def replica_read_placement(openconnection, tablenames, maxstaleness=REPLICA_MAX_STALENESS):
+    """
+    Function to choose the node each of @tablenames is read from: one of the replicas that are at most
+    @maxstaleness seconds behind (spread evenly), or the primary when there is none.
+    
+    Returns:
+    --------
+    dict
+        Tên bảng -> node (như partition_placement); bảng không có trong dict được đọc trên database hiện tại
+        
+    Notes:
+    -----
+    - maxstaleness là None: luôn đọc bản chính (đọc được ngay các dòng vừa ghi)
+    - Dùng metadata trong cache; các hàm truy vấn gọi refresh_partition_cache trước
+    """
+    placement = partition_placement(openconnection)
+    if maxstaleness is None:
+        return placement
+    wanted = set(tablenames)
+    base = connection_key(openconnection)
+    for key, metadata in list(PARTITION_METADATA_CACHE.items()):
+        if key[:-1] != base or not metadata['replicas'] or metadata['migrationcount'] is not None:
+            continue
+        tables = [tablename for tablename in metadata['tablenames'] if tablename in wanted]
+        if not tables:
+            continue
+        replicas = [lag['replica'] for lag in replicalag(metadata['prefix'], openconnection)
+                    if lag['lagseconds'] is not None and lag['lagseconds'] <= maxstaleness
+                    and lag['replica'] in metadata['replicas']]
+        for tablename in tables if replicas else ():
+            placement[tablename] = replicas[next(REPLICA_READ_COUNTER) % len(replicas)]
+    return placement
+
+class ReplicaSyncer(MaintenanceTask):
+    """
+    Background task that keeps the replicas of every replicated prefix in sync with the insert log (syncreplicas).
+    Chạy trong một thread riêng, dùng kết nối lấy từ pool của database.
+    
+    Parameters:
+    -----------
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database (chỉ dùng để xác định database)
+    prefixes : list of str, optional
+        Các prefix cần đồng bộ; mặc định là mọi prefix có bản sao
+    interval : float, optional
+        Chu kỳ đồng bộ (giây); độ trễ của bản sao vào khoảng interval cộng thời gian đồng bộ
+        
+    Notes:
+    -----
+    - applied: tổng số dòng đã áp dụng lên mỗi (prefix, bản sao)
+    """
+    
+    def __init__(self, openconnection, prefixes=None, interval=REPLICA_SYNC_INTERVAL):
+        MaintenanceTask.__init__(self, openconnection, interval)
+        self.prefixes = prefixes
+        self.applied = {}
+        
+    def check(self):
+        """
+        Function to run one pass: synchronise the replicas of every prefix. Returns the rows applied per replica.
+        """
+        applied = {}
+        with get_connection_pool(self.dbname).connection() as con:
+            refresh_partition_cache(con)
+            base = connection_key(con)
+            prefixes = self.prefixes
+            if prefixes is None:
+                prefixes = [key[-1] for key, metadata in list(PARTITION_METADATA_CACHE.items())
+                            if key[:-1] == base and metadata['replicas']]
+            for prefix in prefixes:
+                for replica, rows in syncreplicas(prefix, con).items():
+                    applied[(prefix, replica)] = rows
+                    self.applied[(prefix, replica)] = self.applied.get((prefix, replica), 0) + (rows or 0)
+        return applied
+
+@instrumented
+def droppartitions(prefix, openconnection):
+    """
+    Function to drop the partition tables of @prefix (on whichever node holds them) and their catalog entry.
+    
+    Parameters:
+    -----------
+    prefix : str
+        Prefix tên bảng phân mảnh (RANGE_TABLE_PREFIX, RROBIN_TABLE_PREFIX, HASH_TABLE_PREFIX)
+    openconnection : psycopg2.extensions.connection
+        Kết nối đến database chứa partition_catalog
+        
+    Notes:
+    -----
+    - Các bản sao (removereplica) và các bảng trên node khác được xóa trước, mỗi node bằng một
+      transaction; sau đó các bảng trên database hiện tại và dòng metadata được xóa trong cùng
+      một transaction
+    """
+    try:
+        # Catalog tạo bởi phiên bản trước có thể chưa có các cột mới (replicas, nodes, ...)
+        with transaction(openconnection) as cur:
+            ensure_partition_catalog(cur)
+        metadata = get_partition_metadata(prefix, openconnection, refresh=True)
+        tablenames = partition_tablenames(prefix, openconnection)
+        if metadata is not None and metadata['migrationcount'] is not None:
+            tablenames = [prefix + str(i) for i in range(max(metadata['numberofpartitions'],
+                                                             metadata['migrationcount']))]
+        nodes = partition_nodes(metadata) or [None] * len(tablenames)
+        
+        # Xóa các bản sao
+        for replica in (metadata['replicas'] or ()) if metadata is not None else ():
+            removereplica(prefix, replica, openconnection)
+        
+        # Xóa các bảng trên các node khác
+        remote = {}
+        for tablename, node in zip(tablenames, nodes):
+            if node is not None:
+                remote.setdefault(node, []).append(tablename)
+        for node, names in remote.items():
+            with get_node_pool(openconnection, node).connection() as con:
+                cur = con.cursor()
+                cur.execute(f"DROP TABLE IF EXISTS {', '.join(names)}")
+                con.commit()
+                cur.close()
+        
+        # Xóa các bảng cục bộ và metadata
+        with transaction(openconnection) as cur:
+            local = [tablename for tablename, node in zip(tablenames, nodes) if node is None]
+            if local:
+                cur.execute(f"DROP TABLE IF EXISTS {', '.join(local)}")
+            if metadata is not None:
+                cur.execute("DELETE FROM partition_catalog WHERE prefix = %s", (prefix,))
+                cur.execute(f"DROP TABLE IF EXISTS {repartition_moves_table(prefix)}")
+        invalidate_partition_cache(prefix)
+        
+    except Exception as e:
+        invalidate_partition_cache(prefix)
+        print("Error: Could not drop partitions {0}".format(prefix))
+        print(e)
+        raise e
 
 def create_db(dbname):
     """
@@ -475,12 +5217,17 @@ def count_partitions(prefix, openconnection):
         
     Notes:
     -----
-    - Truy vấn pg_stat_user_tables để đếm số bảng
-    - Chỉ đếm các bảng có tên bắt đầu bằng prefix
+    - Truy vấn pg_class để đếm số bảng trong schema hiện tại
+    - Chỉ đếm các bảng có tên đúng dạng prefix + số (range_part0, range_part1, ...), không
+      phụ thuộc vào bộ thu thập thống kê và không đếm nhầm các bảng khác cùng prefix
+    - Khi đã có partition_catalog, nên dùng get_partition_metadata thay cho hàm này
     """
     con = openconnection
     cur = con.cursor()
-    cur.execute("select count(*) from pg_stat_user_tables where relname like " + "'" + prefix + "%';")
+    cur.execute("""
+    SELECT COUNT(*) FROM pg_class
+    WHERE relkind = 'r' AND relnamespace = current_schema()::regnamespace AND relname ~ %s
+    """, ('^' + prefix + '[0-9]+$',))
     count = cur.fetchone()[0]
     cur.close()
     
@@ -0,0 +1,534 @@
+#
+# Benchmark suite for the assignement
+#
+# Ví dụ:
+#   python benchmark.py generate ratings_1m.dat --rows 1000000 --seed 42 --skew 1.0
+#   python benchmark.py run ratings_1m.dat --partitions 1 4 16 --output base.json
+#   python benchmark.py compare base.json new.json --threshold 0.10
+#
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+import Interface
+
+# Các giá trị rating của MovieLens và tỉ lệ xuất hiện của chúng trong bộ MovieLens 10M
+RATING_VALUES = (0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0)
+MOVIELENS_RATING_WEIGHTS = (0.0095, 0.0384, 0.0119, 0.0790, 0.0371, 0.2356, 0.0879, 0.2875, 0.0585, 0.1546)
+MOVIELENS_TIMESTAMPS = (789652009, 1231131736)  # Khoảng timestamp của bộ MovieLens 10M
+
+# Các tham số mặc định của bộ sinh dữ liệu
+GENERATOR_SEED = 42
+GENERATOR_MOVIES = 10681  # Số movie của bộ MovieLens 10M
+GENERATOR_MIN_RATINGS = 20  # Mỗi user của MovieLens có ít nhất 20 rating
+GENERATOR_MEAN_RATINGS = 140  # Số rating trung bình của mỗi user (10M rating / 71567 user)
+GENERATOR_WRITE_ROWS = 100000  # Số dòng được ghi ra file mỗi lần
+
+# Ma trận mặc định của benchmark
+BENCHMARK_DBNAME = 'csdlpt_benchmark'
+BENCHMARK_RATINGS_TABLE = 'ratings'
+BENCHMARK_PARTITIONS = (1, 4, 16)
+BENCHMARK_MODES = ('range:uniform', 'range:equidepth', 'roundrobin:setbased', 'hash:userid')
+BENCHMARK_INSERT_ROWS = 1000  # Số dòng của mỗi phép đo insert
+BENCHMARK_FORMAT_VERSION = 1  # Tăng khi cấu trúc file JSON kết quả thay đổi
+COMPARE_THRESHOLD = 0.10  # Chậm hơn 10% (theo median) được coi là regression
+
+# Các mode hợp lệ của từng cách phân mảnh
+PARTITION_MODES = {
+    'range': ('uniform', 'equidepth'),
+    'roundrobin': ('setbased', 'loop'),
+    'hash': (Interface.HASH_KEY_USER, Interface.HASH_KEY_USER_MOVIE),
+}
+SCHEME_PREFIXES = {
+    'range': Interface.RANGE_TABLE_PREFIX,
+    'roundrobin': Interface.RROBIN_TABLE_PREFIX,
+    'hash': Interface.HASH_TABLE_PREFIX,
+}
+
+def rating_weights(skew):
+    """
+    Function to get the probability of each value in RATING_VALUES for a given @skew.
+    
+    Parameters:
+    -----------
+    skew : float
+        0: mọi giá trị rating có cùng xác suất; 1: phân bố của MovieLens 10M;
+        lớn hơn 1: dồn về các giá trị phổ biến (3, 4, 5) nhiều hơn MovieLens
+    
+    Returns:
+    --------
+    list of float
+        Xác suất của từng giá trị (tổng bằng 1)
+    """
+    if skew < 0:
+        raise ValueError("skew must not be negative")
+    weights = [weight ** skew for weight in MOVIELENS_RATING_WEIGHTS]
+    total = sum(weights)
+    return [weight / total for weight in weights]
+
+def format_rating(rating):
+    """
+    Function to format a rating the way MovieLens does: 5 and 4.5, not 5.0.
+    """
+    return str(int(rating)) if rating == int(rating) else str(rating)
+
+def generate_ratings(ratingsfilepath, rows, seed=GENERATOR_SEED, skew=1.0, movies=GENERATOR_MOVIES,
+                     minratings=GENERATOR_MIN_RATINGS, meanratings=GENERATOR_MEAN_RATINGS):
+    """
+    Function to write a synthetic MovieLens-shaped ratings file (userid::movieid::rating::timestamp).
+    
+    Parameters:
+    -----------
+    ratingsfilepath : str
+        Đường dẫn file cần ghi (bị ghi đè nếu đã tồn tại)
+    rows : int
+        Số dòng cần sinh (ví dụ từ 100K đến 100M)
+    seed : int, optional
+        Seed của bộ sinh số ngẫu nhiên; cùng tham số cho ra cùng một file trên mọi máy
+    skew : float, optional
+        Độ lệch của phân bố rating (xem rating_weights)
+    movies : int, optional
+        Số movie; movieid nằm trong [1, movies]
+    minratings, meanratings : int, optional
+        Số rating tối thiểu và trung bình của mỗi user
+    
+    Returns:
+    --------
+    dict
+        Thống kê: path, rows, users, movies, seed, skew, bytes, seconds
+    
+    Notes:
+    -----
+    - Giống file MovieLens: các dòng được sắp xếp theo (userid, movieid), mỗi user đánh giá mỗi
+      movie tối đa một lần, userid liên tục từ 1, nên file dùng được với mọi hàm nạp dữ liệu
+      (kể cả loadratings_partitioned với round robin)
+    - Số rating của mỗi user theo phân bố mũ (đuôi dài như MovieLens), tối đa là @movies
+    - Chỉ dùng random.Random, không phụ thuộc numpy, nên file sinh ra không đổi giữa các môi trường
+    """
+    if rows < 0:
+        raise ValueError("rows must not be negative")
+    if not 1 <= minratings <= meanratings:
+        raise ValueError("Expected 1 <= minratings <= meanratings")
+    start_time = time.time()
+    rng = random.Random(seed)
+    
+    # Bảng tra cứu để chọn rating bằng một lần gọi rng.choices cho mỗi user
+    cum_weights = list(itertools.accumulate(rating_weights(skew)))
+    labels = [format_rating(rating) for rating in RATING_VALUES]
+    low, high = MOVIELENS_TIMESTAMPS
+    span = high - low
+    movieids = range(1, movies + 1)
+    
+    written = 0
+    userid = 0
+    size = 0
+    lines = []
+    with open(ratingsfilepath, 'w', newline='\n') as f:
+        while written < rows:
+            userid += 1
+            count = minratings + int(rng.expovariate(1.0 / (meanratings - minratings + 1)))
+            count = min(count, movies, rows - written)
+            chosen = sorted(rng.sample(movieids, count))
+            ratings = rng.choices(labels, cum_weights=cum_weights, k=count)
+            prefix = str(userid) + '::'
+            for movieid, rating in zip(chosen, ratings):
+                lines.append(f"{prefix}{movieid}::{rating}::{low + int(rng.random() * span)}\n")
+            written += count
+            if len(lines) >= GENERATOR_WRITE_ROWS:
+                chunk = ''.join(lines)
+                f.write(chunk)
+                size += len(chunk)
+                lines = []
+        chunk = ''.join(lines)
+        f.write(chunk)
+        size += len(chunk)
+    
+    execution_time = time.time() - start_time
+    print(f"Thời gian thực thi hàm generate_ratings: {execution_time:.2f} giây")
+    return {'path': ratingsfilepath, 'rows': written, 'users': userid, 'movies': movies, 'seed': seed,
+            'skew': skew, 'bytes': size, 'seconds': execution_time}
+
+def count_file_rows(ratingsfilepath):
+    """
+    Function to count the lines of @ratingsfilepath without loading it into memory.
+    """
+    count = 0
+    with open(ratingsfilepath, 'rb') as f:
+        for block in iter(lambda: f.read(Interface.LOAD_CHUNK_SIZE), b''):
+            count += block.count(b'\n')
+    return count
+
+def parse_modes(modes):
+    """
+    Function to parse 'scheme:mode' strings (for example 'range:equidepth') into (scheme, mode) pairs.
+    
+    Raises:
+    -------
+    ValueError
+        Nếu cách phân mảnh hoặc mode không hợp lệ (xem PARTITION_MODES)
+    """
+    parsed = []
+    for text in modes:
+        scheme, _, mode = text.partition(':')
+        if scheme not in PARTITION_MODES:
+            raise ValueError("Unknown partitioning scheme: {0}".format(scheme))
+        mode = mode or PARTITION_MODES[scheme][0]
+        if mode not in PARTITION_MODES[scheme]:
+            raise ValueError("Unknown {0} mode: {1}".format(scheme, mode))
+        parsed.append((scheme, mode))
+    return parsed
+
+def benchmark_insert_rows(count, firstuserid, seed=GENERATOR_SEED, movies=GENERATOR_MOVIES):
+    """
+    Function to build the rows inserted by the insert benchmarks: new users starting at @firstuserid,
+    so they never collide with the primary key of ratings.
+    """
+    rng = random.Random(seed)
+    return [(firstuserid + i, rng.randint(1, movies), rng.choice(RATING_VALUES)) for i in range(count)]
+
+class BenchmarkRecorder(object):
+    """
+    Collects the timings of the benchmark, keyed by (operation, scheme, mode, partitions).
+    
+    Notes:
+    -----
+    - Mỗi lần lặp (repeat) thêm một mẫu vào cùng khóa; results() tính min/median/max
+    - Khi verbose là False, các dòng print của Interface trong lúc đo bị ẩn
+    """
+    
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.samples = {}
+        self.order = []
+    
+    def measure(self, key, rows, function, *args, **kwargs):
+        """
+        Function to run function(*args, **kwargs) once and record its wall-clock time.
+        
+        Parameters:
+        -----------
+        key : tuple
+            (operation, scheme, mode, partitions); scheme, mode, partitions là None với các hàm nạp dữ liệu
+        rows : int or callable
+            Số dòng được xử lý, dùng để tính rows/s; có thể là hàm nhận kết quả của function
+        
+        Returns:
+        --------
+        Kết quả của function
+        """
+        output = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            start_time = time.perf_counter()
+            result = function(*args, **kwargs)
+            seconds = time.perf_counter() - start_time
+        if callable(rows):
+            rows = rows(result)
+        if key not in self.samples:
+            self.samples[key] = []
+            self.order.append(key)
+        self.samples[key].append((seconds, rows))
+        operation, scheme, mode, partitions = key
+        print(f"{operation:<28} {scheme or '-':<11} {mode or '-':<15} {partitions or '-':>4} "
+              f"{seconds:10.4f} giây {rows:>12} dòng")
+        return result
+    
+    def results(self):
+        """
+        Function to summarise the recorded samples, in the order the operations first ran.
+        """
+        results = []
+        for key in self.order:
+            operation, scheme, mode, partitions = key
+            seconds = [sample[0] for sample in self.samples[key]]
+            rows = self.samples[key][-1][1]
+            median = statistics.median(seconds)
+            results.append({
+                'operation': operation, 'scheme': scheme, 'mode': mode, 'partitions': partitions,
+                'rows': rows, 'seconds': seconds, 'min': min(seconds), 'median': median, 'max': max(seconds),
+                'rowspersecond': rows / median if median > 0 else None,
+            })
+        return results
+
+def reset_database(openconnection):
+    """
+    Function to drop every table of the public schema of the benchmark database.
+    """
+    cur = openconnection.cursor()
+    cur.execute("SELECT tablename FROM pg_tables WHERE schemaname = 'public'")
+    for (tablename,) in cur.fetchall():
+        cur.execute(f"DROP TABLE IF EXISTS {tablename} CASCADE")
+    cur.close()
+    Interface.invalidate_partition_cache()
+
+def drop_table(openconnection, tablename):
+    """
+    Function to drop @tablename if it exists.
+    """
+    cur = openconnection.cursor()
+    cur.execute(f"DROP TABLE IF EXISTS {tablename}")
+    cur.close()
+
+def benchmark_loads(recorder, ratingsfilepath, rows, openconnection):
+    """
+    Function to time the loaders that create the ratings table from the file. The last one leaves ratings loaded.
+    """
+    table = BENCHMARK_RATINGS_TABLE
+    for name, loader in (('loadratings', Interface.loadratings),
+                         ('loadratings_parallel', Interface.loadratings_parallel),
+                         ('loadratings_binary', Interface.loadratings_binary)):
+        drop_table(openconnection, table)
+        recorder.measure((name, None, None, None), rows, loader, table, ratingsfilepath, openconnection)
+
+def benchmark_partitioning(recorder, ratingsfilepath, rows, scheme, mode, partitions, insertrows, openconnection):
+    """
+    Function to time every operation on one cell of the matrix: build the partitions of @scheme/@mode,
+    insert, query, repartition to @partitions + 1, then drop them.
+    
+    Notes:
+    -----
+    - Các dòng được insert thuộc về các user mới và bị xóa khỏi ratings ở cuối, nên mọi ô của ma
+      trận bắt đầu từ cùng một bảng ratings
+    - rows của các truy vấn là số dòng trả về; của aggregatequery là số dòng được tổng hợp
+    """
+    table = BENCHMARK_RATINGS_TABLE
+    prefix = SCHEME_PREFIXES[scheme]
+    
+    def cell(operation):
+        return operation, scheme, mode, partitions
+    
+    cur = openconnection.cursor()
+    cur.execute(f"SELECT COALESCE(MAX(userid), 0) + 1 FROM {table}")
+    firstuserid = cur.fetchone()[0]
+    inserts = benchmark_insert_rows(insertrows, firstuserid)
+    batch = benchmark_insert_rows(insertrows, firstuserid + insertrows, seed=GENERATOR_SEED + 1)
+    
+    try:
+        # Nạp thẳng từ file vào các phân mảnh (chỉ có với range chia đều và round robin)
+        if (scheme, mode) in (('range', 'uniform'), ('roundrobin', 'setbased')):
+            recorder.measure(cell('loadratings_partitioned'), rows, Interface.loadratings_partitioned, table,
+                             ratingsfilepath, openconnection, scheme, partitions, loadratingstable=False)
+            Interface.droppartitions(prefix, openconnection)
+        
+        # Tạo phân mảnh và insert
+        if scheme == 'range':
+            recorder.measure(cell('rangepartition'), rows, Interface.rangepartition, table, partitions, openconnection,
+                             mode=mode)
+            insert, insert_many = Interface.rangeinsert, Interface.rangeinsert_many
+        elif scheme == 'roundrobin':
+            recorder.measure(cell('roundrobinpartition'), rows, Interface.roundrobinpartition, table, partitions,
+                             openconnection, method=mode)
+            insert, insert_many = Interface.roundrobininsert, Interface.roundrobininsert_many
+        else:
+            recorder.measure(cell('hashpartition'), rows, Interface.hashpartition, table, partitions, openconnection,
+                             includemovieid=(mode == Interface.HASH_KEY_USER_MOVIE))
+            insert, insert_many = Interface.hashinsert, None
+        
+        def insert_rows():
+            for userid, movieid, rating in inserts:
+                insert(table, userid, movieid, rating, openconnection)
+        
+        recorder.measure(cell(insert.__name__), insertrows, insert_rows)
+        if insert_many is not None:
+            recorder.measure(cell(insert_many.__name__), insertrows, insert_many, table, batch, openconnection)
+        
+        # Truy vấn
+        recorder.measure(cell('rangequery'), lambda result: result, lambda: sum(
+            1 for _ in Interface.rangequery(2.5, 4.0, openconnection)))
+        recorder.measure(cell('pointquery'), lambda result: result, lambda: sum(
+            1 for _ in Interface.pointquery(4.0, openconnection)))
+        recorder.measure(cell('pointquery_userid'), lambda result: result, lambda: sum(
+            1 for _ in Interface.pointquery(None, openconnection, userid=1)))
+        recorder.measure(cell('aggregatequery'), lambda result: result['count'], Interface.aggregatequery,
+                         openconnection, scheme=scheme)
+        recorder.measure(cell('aggregatequery_movieid'), lambda result: sum(group['count'] for group in result.values()),
+                         Interface.aggregatequery, openconnection, groupby=Interface.MOVIE_ID_COLNAME,
+                         scheme=scheme)
+        
+        # Thay đổi số phân mảnh
+        recorder.measure(cell('repartition'), rows, Interface.repartition, prefix, partitions + 1, openconnection)
+    finally:
+        Interface.droppartitions(prefix, openconnection)
+        cur.execute(f"DELETE FROM {table} WHERE userid >= %s", (firstuserid,))
+        cur.close()
+
+def server_version(openconnection):
+    """
+    Function to get the version of the PostgreSQL server behind @openconnection.
+    """
+    cur = openconnection.cursor()
+    cur.execute("SHOW server_version")
+    version = cur.fetchone()[0]
+    cur.close()
+    return version
+
+def run_benchmark(ratingsfilepath, dbname=BENCHMARK_DBNAME, partitions=BENCHMARK_PARTITIONS, modes=BENCHMARK_MODES,
+                  repeat=1, insertrows=BENCHMARK_INSERT_ROWS, verbose=False):
+    """
+    Function to time every Interface operation on @ratingsfilepath across a matrix of partition counts and modes.
+    
+    Parameters:
+    -----------
+    ratingsfilepath : str
+        File ratings (ví dụ sinh bởi generate_ratings)
+    dbname : str, optional
+        Database dùng để đo; được tạo nếu chưa có. MỌI BẢNG trong schema public bị xóa
+    partitions : list of int, optional
+        Các số phân mảnh cần đo
+    modes : list of str, optional
+        Các ô 'scheme:mode', ví dụ 'range:uniform', 'range:equidepth', 'roundrobin:setbased',
+        'roundrobin:loop', 'hash:userid', 'hash:userid,movieid'
+    repeat : int, optional
+        Số lần chạy toàn bộ ma trận; kết quả lấy median của các lần
+    insertrows : int, optional
+        Số dòng của mỗi phép đo insert
+    verbose : bool, optional
+        True để giữ lại các dòng print của Interface
+    
+    Returns:
+    --------
+    dict
+        version, config, environment, dataset, results (mỗi phần tử: operation, scheme, mode,
+        partitions, rows, seconds (mọi lần đo), min, median, max, rowspersecond)
+    
+    Notes:
+    -----
+    - Mỗi lần lặp: đo các hàm nạp dữ liệu (bảng ratings), rồi với mỗi (mode, số phân mảnh) đo
+      tạo phân mảnh, insert, truy vấn và repartition (xem benchmark_partitioning)
+    - Kết quả được so sánh giữa hai lần chạy bằng compare_results
+    """
+    cells = parse_modes(modes)
+    if repeat < 1:
+        raise ValueError("repeat must be at least 1")
+    rows = count_file_rows(ratingsfilepath)
+    recorder = BenchmarkRecorder(verbose)
+    
+    with contextlib.redirect_stdout(io.StringIO()) if not verbose else contextlib.nullcontext():
+        Interface.create_db(dbname)
+    con = Interface.getopenconnection(dbname=dbname)
+    con.autocommit = True
+    try:
+        reset_database(con)
+        for _ in range(repeat):
+            benchmark_loads(recorder, ratingsfilepath, rows, con)
+            for scheme, mode in cells:
+                for n in partitions:
+                    benchmark_partitioning(recorder, ratingsfilepath, rows, scheme, mode, n, insertrows, con)
+        environment = {'python': platform.python_version(), 'platform': platform.platform(),
+                       'postgresql': server_version(con), 'numpy': Interface.np is not None,
+                       'cpus': os.cpu_count()}
+    finally:
+        reset_database(con)
+        con.close()
+        Interface.close_connection_pools()
+    
+    return {
+        'version': BENCHMARK_FORMAT_VERSION,
+        'createdat': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'config': {'dbname': dbname, 'partitions': list(partitions), 'modes': list(modes), 'repeat': repeat,
+                   'insertrows': insertrows},
+        'environment': environment,
+        'dataset': {'path': os.path.abspath(ratingsfilepath), 'rows': rows,
+                    'bytes': os.path.getsize(ratingsfilepath)},
+        'results': recorder.results(),
+    }
+
+def result_key(result):
+    """
+    Function to get the key identifying one measurement across runs: (operation, scheme, mode, partitions).
+    """
+    return result['operation'], result['scheme'], result['mode'], result['partitions']
+
+def compare_results(base, new, threshold=COMPARE_THRESHOLD):
+    """
+    Function to compare two benchmark reports operation by operation.
+    
+    Parameters:
+    -----------
+    base, new : dict
+        Kết quả của run_benchmark (đọc từ file JSON)
+    threshold : float, optional
+        Tỉ lệ chậm đi (theo median) bị coi là regression, ví dụ 0.10 là 10%
+    
+    Returns:
+    --------
+    list of dict
+        Với mỗi phép đo có trong cả hai: operation, scheme, mode, partitions, base, new (median, giây),
+        change (tỉ lệ thay đổi), regression (True nếu change > threshold)
+    """
+    baseline = {result_key(result): result for result in base['results']}
+    comparisons = []
+    for result in new['results']:
+        old = baseline.get(result_key(result))
+        if old is None:
+            continue
+        change = (result['median'] - old['median']) / old['median'] if old['median'] > 0 else 0.0
+        comparisons.append({'operation': result['operation'], 'scheme': result['scheme'], 'mode': result['mode'],
+                            'partitions': result['partitions'], 'base': old['median'], 'new': result['median'],
+                            'change': change, 'regression': change > threshold})
+    return comparisons
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark các hàm của Interface")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    generate = commands.add_parser('generate', help="Sinh file ratings dạng MovieLens")
+    generate.add_argument('path')
+    generate.add_argument('--rows', type=int, default=100000)
+    generate.add_argument('--seed', type=int, default=GENERATOR_SEED)
+    generate.add_argument('--skew', type=float, default=1.0)
+    generate.add_argument('--movies', type=int, default=GENERATOR_MOVIES)
+    
+    run = commands.add_parser('run', help="Đo các hàm trên một file ratings")
+    run.add_argument('path')
+    run.add_argument('--dbname', default=BENCHMARK_DBNAME)
+    run.add_argument('--partitions', type=int, nargs='+', default=list(BENCHMARK_PARTITIONS))
+    run.add_argument('--modes', nargs='+', default=list(BENCHMARK_MODES))
+    run.add_argument('--repeat', type=int, default=1)
+    run.add_argument('--insert-rows', type=int, default=BENCHMARK_INSERT_ROWS)
+    run.add_argument('--output', default='benchmark.json', help="File JSON kết quả")
+    run.add_argument('--verbose', action='store_true')
+    
+    compare = commands.add_parser('compare', help="So sánh hai file kết quả")
+    compare.add_argument('base')
+    compare.add_argument('new')
+    compare.add_argument('--threshold', type=float, default=COMPARE_THRESHOLD)
+    
+    args = parser.parse_args(argv)
+    if args.command == 'generate':
+        stats = generate_ratings(args.path, args.rows, seed=args.seed, skew=args.skew, movies=args.movies)
+        print(json.dumps(stats, indent=2))
+        return 0
+    
+    if args.command == 'run':
+        report = run_benchmark(args.path, dbname=args.dbname, partitions=args.partitions, modes=args.modes,
+                               repeat=args.repeat, insertrows=args.insert_rows, verbose=args.verbose)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print('Đã ghi kết quả vào {0}'.format(args.output))
+        return 0
+    
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    regressions = 0
+    for comparison in compare_results(base, new, args.threshold):
+        marker = 'REGRESSION' if comparison['regression'] else ''
+        regressions += comparison['regression']
+        print(f"{comparison['operation']:<28} {comparison['scheme'] or '-':<11} {comparison['mode'] or '-':<15} "
+              f"{comparison['partitions'] or '-':>4} {comparison['base']:10.4f} -> {comparison['new']:10.4f} giây "
+              f"{comparison['change']:+8.1%} {marker}")
+    print('Số regression: {0}'.format(regressions))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
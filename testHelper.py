@@ -1,8 +1,11 @@
+import os
 import traceback
 import psycopg2
+import psycopg2.extensions
 
 RANGE_TABLE_PREFIX = 'range_part'
 RROBIN_TABLE_PREFIX = 'rrobin_part'
+HASH_TABLE_PREFIX = 'hash_part'
 USER_ID_COLNAME = 'userid'
 MOVIE_ID_COLNAME = 'movieid'
 RATING_COLNAME = 'rating'
@@ -52,32 +55,72 @@ def deleteAllPublicTables(openconnection):
 
     cur.close()
 
+def getpartitiontables(cur):
+    """
+    Return the names of every range, round robin and hash partition table.
+    """
+    cur.execute(
+        "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public' AND (table_name LIKE '{0}%' "
+        "OR table_name LIKE '{1}%' OR table_name LIKE '{2}%') ORDER BY table_name".format(
+            RANGE_TABLE_PREFIX, RROBIN_TABLE_PREFIX, HASH_TABLE_PREFIX))
+    return [row[0] for row in cur.fetchall()]
+
+def getpartitionrows(openconnection, condition, params=()):
+    """
+    Return the sorted (userid, movieid, rating) rows of every partition table that match @condition,
+    one row per partition holding it.
+    """
+    cur = openconnection.cursor()
+    tablenames = getpartitiontables(cur)
+    cur.execute(" UNION ALL ".join("SELECT {0}, {1}, {2} FROM {3} WHERE {4}".format(
+        USER_ID_COLNAME, MOVIE_ID_COLNAME, RATING_COLNAME, tablename, condition) for tablename in tablenames),
+        tuple(params) * len(tablenames))
+    rows = sorted(cur.fetchall())
+    cur.close()
+    openconnection.commit()
+    return rows
+
+def deletetestratings(openconnection, userids):
+    """
+    Delete the ratings of @userids from the ratings table and from every partition table,
+    so that a test script inserting fixed rows can be run again.
+    """
+    cur = openconnection.cursor()
+    for tablename in ['ratings'] + getpartitiontables(cur):
+        cur.execute("DELETE FROM {0} WHERE {1} = ANY(%s)".format(tablename, USER_ID_COLNAME), (list(userids),))
+    cur.close()
+    openconnection.commit()
+
 def getopenconnection(user='postgres', password='1234', dbname='postgres'):
-    return psycopg2.connect("dbname='" + dbname + "' user='" + user + "' host='localhost' password='" + password + "'")
+    # Settings in the CSDLPT_DSN environment variable (libpq DSN) override the defaults
+    settings = {'user': user, 'password': password, 'host': 'localhost'}
+    settings.update(psycopg2.extensions.parse_dsn(os.environ.get('CSDLPT_DSN', '')))
+    settings['dbname'] = dbname
+    return psycopg2.connect(**settings)
 
 
 ####### Tester support
 def getCountrangepartition(ratingstablename, numberofpartitions, openconnection):
     """
     Get number of rows for each partition
+    All partitions are counted with FILTER aggregates in a single scan of the ratings table
     :param ratingstablename:
     :param numberofpartitions:
     :param openconnection:
     :return:
     """
     cur = openconnection.cursor()
-    countList = []
+    filters = []
     interval = 5.0 / numberofpartitions
-    cur.execute("select count(*) from {0} where rating >= {1} and rating <= {2}".format(ratingstablename,0, interval))
-    countList.append(int(cur.fetchone()[0]))
+    filters.append("count(*) filter (where rating >= {0} and rating <= {1})".format(0, interval))
 
     lowerbound = interval
     for i in range(1, numberofpartitions):
-        cur.execute("select count(*) from {0} where rating > {1} and rating <= {2}".format(ratingstablename,
-                                                                                          lowerbound,
-                                                                                          lowerbound + interval))
+        filters.append("count(*) filter (where rating > {0} and rating <= {1})".format(lowerbound,
+                                                                                     lowerbound + interval))
         lowerbound += interval
-        countList.append(int(cur.fetchone()[0]))
+    cur.execute("select {0} from {1}".format(', '.join(filters), ratingstablename))
+    countList = [int(count) for count in cur.fetchone()]
 
     cur.close()
     return countList
@@ -86,18 +129,42 @@ def getCountrangepartition(ratingstablename, numberofpartitions, openconnection)
 def getCountroundrobinpartition(ratingstablename, numberofpartitions, openconnection):
     '''
     Get number of rows for each partition
+    Row k (0-based) goes to partition k % numberofpartitions, so the counts follow from the total row count
     :param ratingstablename:
     :param numberofpartitions:
     :param openconnection:
     :return:
     '''
     cur = openconnection.cursor()
-    countList = []
-    for i in range(0, numberofpartitions):
-        cur.execute(
-            "select count(*) from (select *, row_number() over () from {0}) as temp where (row_number-1)%{1}= {2}".format(
-                ratingstablename, numberofpartitions, i))
-        countList.append(int(cur.fetchone()[0]))
+    cur.execute("select count(*) from {0}".format(ratingstablename))
+    total = int(cur.fetchone()[0])
+    countList = [(total - i + numberofpartitions - 1) // numberofpartitions for i in range(0, numberofpartitions)]
+
+    cur.close()
+    return countList
+
+def gethashpartitionexpression(numberofpartitions):
+    '''
+    SQL expression for the hash partition of a row: ((userid * 2654435761) & 0xFFFFFFFF) % numberofpartitions
+    :param numberofpartitions:
+    :return:
+    '''
+    return "(((userid::bigint * 2654435761) & 4294967295) % {0})".format(numberofpartitions)
+
+
+def getCounthashpartition(ratingstablename, numberofpartitions, openconnection):
+    '''
+    Get number of rows for each partition
+    :param ratingstablename:
+    :param numberofpartitions:
+    :param openconnection:
+    :return:
+    '''
+    cur = openconnection.cursor()
+    cur.execute("select {1}, count(*) from {0} group by 1".format(
+        ratingstablename, gethashpartitionexpression(numberofpartitions)))
+    counts = dict(cur.fetchall())
+    countList = [int(counts.get(i, 0)) for i in range(0, numberofpartitions)]
 
     cur.close()
     return countList
@@ -123,32 +190,175 @@ def totalrowsinallpartitions(cur, n, rangepartitiontableprefix, partitionstartin
     return count
 
 
-def testrangeandrobinpartitioning(n, openconnection, rangepartitiontableprefix, partitionstartindex, ACTUAL_ROWS_IN_INPUT_FILE):
+# Verification engine
+SOURCE_PART = -1
+OFFENDING_ROWS_LIMIT = 5
+
+def getrowfingerprintexpression():
+    '''
+    SQL expression hashing one (userid, movieid, rating) row to a bigint
+    Summing it over a table gives an order-independent fingerprint of the rows (as a multiset)
+    :return:
+    '''
+    return "hashint8extended((({0}::bigint << 32) | ({1}::bigint & 4294967295)) # hashfloat8extended({2}::float8, 0), 0)".format(
+        USER_ID_COLNAME, MOVIE_ID_COLNAME, RATING_COLNAME)
+
+
+def getpartitionunion(n, partitionprefix, partitionstartindex, ratingstablename=None):
+    '''
+    UNION ALL of every partition (and the source table, tagged SOURCE_PART) with a part column
+    :return:
+    '''
+    selects = []
+    if ratingstablename is not None:
+        selects.append('SELECT {0} AS part, {2}, {3}, {4} FROM {1}'.format(
+            SOURCE_PART, ratingstablename, USER_ID_COLNAME, MOVIE_ID_COLNAME, RATING_COLNAME))
+    for i in range(0, n):
+        selects.append('SELECT {0} AS part, {2}, {3}, {4} FROM {1}{5}'.format(
+            i, partitionprefix, USER_ID_COLNAME, MOVIE_ID_COLNAME, RATING_COLNAME, i + partitionstartindex))
+    return ' UNION ALL '.join(selects)
+
+
+def getpartitionfingerprints(n, openconnection, partitionprefix, partitionstartindex=0, ratingstablename=None,
+                             partitionexpression=None):
+    '''
+    Count and fingerprint every partition (and the source table) in one statement
+    The partitions are read by one aggregate over a UNION ALL, which PostgreSQL scans with a Parallel Append
+    when the tables are large enough, so every row is read once whatever the number of partitions
+    :param n: Number of partitions
+    :param openconnection:
+    :param partitionprefix:
+    :param partitionstartindex:
+    :param ratingstablename: Source table to fingerprint in the same pass (optional)
+    :param partitionexpression: SQL expression giving the partition a row belongs to; rows of a partition
+        that evaluate to another index are counted as misplaced (optional)
+    :return: dict with 'source' -> (count, fingerprint) or None and 'partitions' -> list of
+        (count, fingerprint, misplaced) ordered by partition
+    '''
+    misplaced = '0'
+    if partitionexpression is not None:
+        misplaced = 'count(*) filter (where part <> {0} and ({1}) <> part)'.format(SOURCE_PART, partitionexpression)
+    with openconnection.cursor() as cur:
+        cur.execute('SELECT part, count(*), coalesce(sum({0}), 0), {1} FROM ({2}) AS T GROUP BY part'.format(
+            getrowfingerprintexpression(), misplaced,
+            getpartitionunion(n, partitionprefix, partitionstartindex, ratingstablename)))
+        results = {part: (int(count), int(fingerprint), int(wrong)) for part, count, fingerprint, wrong in cur.fetchall()}
+    # Bảng rỗng không xuất hiện trong GROUP BY
+    source = None
+    if ratingstablename is not None:
+        source = results.get(SOURCE_PART, (0, 0, 0))[:2]
+    partitions = [results.get(i, (0, 0, 0)) for i in range(0, n)]
+    return {'source': source, 'partitions': partitions}
+
+
+def getoffendingrows(n, openconnection, partitionprefix, partitionstartindex, ratingstablename,
+                     limit=OFFENDING_ROWS_LIMIT):
+    '''
+    First rows whose number of copies across the partitions differs from the source table, per kind of failure
+    Only run once the fingerprints disagree, to explain the failure
+    :return: dict 'missing' / 'duplicated' / 'foreign' -> list of (userid, movieid, rating, copies in source,
+        copies in partitions, partitions holding the row)
+    '''
+    with openconnection.cursor() as cur:
+        cur.execute('''
+            SELECT kind, {1}, {2}, {3}, sourcecopies, partitioncopies, parts
+            FROM (
+                SELECT *, row_number() OVER (PARTITION BY kind ORDER BY {1}, {2}, {3}) AS k
+                FROM (
+                    SELECT {1}, {2}, {3}, sourcecopies, partitioncopies, parts,
+                           CASE WHEN partitioncopies < sourcecopies THEN 'missing'
+                                WHEN sourcecopies > 0 THEN 'duplicated'
+                                ELSE 'foreign' END AS kind
+                    FROM (
+                        SELECT {1}, {2}, {3},
+                               count(*) filter (where part = {0}) AS sourcecopies,
+                               count(*) filter (where part <> {0}) AS partitioncopies,
+                               array_agg(part ORDER BY part) filter (where part <> {0}) AS parts
+                        FROM ({4}) AS T
+                        GROUP BY {1}, {2}, {3}
+                    ) AS C
+                    WHERE sourcecopies <> partitioncopies
+                ) AS O
+            ) AS R
+            WHERE k <= {5}
+            ORDER BY kind, {1}, {2}, {3}
+        '''.format(SOURCE_PART, USER_ID_COLNAME, MOVIE_ID_COLNAME, RATING_COLNAME,
+                   getpartitionunion(n, partitionprefix, partitionstartindex, ratingstablename), limit))
+        rows = cur.fetchall()
+    offending = {'missing': [], 'duplicated': [], 'foreign': []}
+    for kind, userid, movieid, rating, sourcecopies, partitioncopies, parts in rows:
+        offending[kind].append((userid, movieid, rating, int(sourcecopies), int(partitioncopies),
+                                [part + partitionstartindex for part in (parts or [])]))
+    return offending
+
+
+def formatoffendingrows(rows, partitionprefix):
+    return '; '.join('({0}, {1}, {2}) {3} time(s) in source, {4} time(s) in partitions [{5}]'.format(
+        userid, movieid, rating, sourcecopies, partitioncopies,
+        ', '.join('{0}{1}'.format(partitionprefix, part) for part in parts))
+        for userid, movieid, rating, sourcecopies, partitioncopies, parts in rows)
+
+
+def verifypartitioning(n, openconnection, partitionprefix, partitionstartindex, ratingstablename,
+                       partitionexpression=None):
+    '''
+    Check Completeness, Disjointness and Reconstruction of the partitions against the source table exactly
+    The partitions must hold every row of the source table as many times as the source does: equal counts
+    and fingerprints prove it, and only when they differ are the offending rows looked up and reported
+    :return: Result of getpartitionfingerprints (per-partition counts can be reused by the per-partition tests)
+    '''
+    result = getpartitionfingerprints(n, openconnection, partitionprefix, partitionstartindex, ratingstablename,
+                                      partitionexpression)
+    sourcecount, sourcefingerprint = result['source']
+    count = sum(partition[0] for partition in result['partitions'])
+    fingerprint = sum(partition[1] for partition in result['partitions'])
+    if count != sourcecount or fingerprint != sourcefingerprint:
+        offending = getoffendingrows(n, openconnection, partitionprefix, partitionstartindex, ratingstablename)
+        failures = []
+        if offending['missing']:
+            failures.append("Completeness property of Partitioning failed. Rows of {0} missing from the partitions: {1}".format(
+                ratingstablename, formatoffendingrows(offending['missing'], partitionprefix)))
+        if offending['duplicated']:
+            failures.append("Dijointness property of Partitioning failed. Rows of {0} stored more than once: {1}".format(
+                ratingstablename, formatoffendingrows(offending['duplicated'], partitionprefix)))
+        if offending['foreign']:
+            failures.append("Rescontruction property of Partitioning failed. Rows not in {0} found in the partitions: {1}".format(
+                ratingstablename, formatoffendingrows(offending['foreign'], partitionprefix)))
+        raise Exception('\n'.join(failures))
+    return result
+
+
+def testrangeandrobinpartitioning(n, openconnection, rangepartitiontableprefix, partitionstartindex, ACTUAL_ROWS_IN_INPUT_FILE,
+                                  ratingstablename=None, partitionexpression=None):
+    '''
+    Check the partition tables; with ratingstablename the rows are compared exactly (see verifypartitioning),
+    otherwise only the total row count is compared with ACTUAL_ROWS_IN_INPUT_FILE
+    :return: Result of getpartitionfingerprints, or None if n is invalid
+    '''
     with openconnection.cursor() as cur:
         if not isinstance(n, int) or n < 0:
             # Test 1: Check the number of tables created, if 'n' is invalid
             checkpartitioncount(cur, 0, rangepartitiontableprefix)
-        else:
-            # Test 2: Check the number of tables created, if all args are correct
-            checkpartitioncount(cur, n, rangepartitiontableprefix)
+            return None
 
-            # Test 3: Test Completeness by SQL UNION ALL Magic
-            count = totalrowsinallpartitions(cur, n, rangepartitiontableprefix, partitionstartindex)
-            if count < ACTUAL_ROWS_IN_INPUT_FILE: raise Exception(
-                "Completeness property of Partitioning failed. Excpected {0} rows after merging all tables, but found {1} rows".format(
-                    ACTUAL_ROWS_IN_INPUT_FILE, count))
+        # Test 2: Check the number of tables created, if all args are correct
+        checkpartitioncount(cur, n, rangepartitiontableprefix)
 
-            # Test 4: Test Disjointness by SQL UNION Magic
-            count = totalrowsinallpartitions(cur, n, rangepartitiontableprefix, partitionstartindex)
-            if count > ACTUAL_ROWS_IN_INPUT_FILE: raise Exception(
-                "Dijointness property of Partitioning failed. Excpected {0} rows after merging all tables, but found {1} rows".format(
-                    ACTUAL_ROWS_IN_INPUT_FILE, count))
-
-            # Test 5: Test Reconstruction by SQL UNION Magic
-            count = totalrowsinallpartitions(cur, n, rangepartitiontableprefix, partitionstartindex)
-            if count != ACTUAL_ROWS_IN_INPUT_FILE: raise Exception(
-                "Rescontruction property of Partitioning failed. Excpected {0} rows after merging all tables, but found {1} rows".format(
-                    ACTUAL_ROWS_IN_INPUT_FILE, count))
+    # Test 3, 4, 5: Completeness, Disjointness and Reconstruction from one pass over all partitions
+    if ratingstablename is not None:
+        result = verifypartitioning(n, openconnection, rangepartitiontableprefix, partitionstartindex,
+                                    ratingstablename, partitionexpression)
+    else:
+        result = getpartitionfingerprints(n, openconnection, rangepartitiontableprefix, partitionstartindex,
+                                          partitionexpression=partitionexpression)
+    count = sum(partition[0] for partition in result['partitions'])
+    if count < ACTUAL_ROWS_IN_INPUT_FILE: raise Exception(
+        "Completeness property of Partitioning failed. Excpected {0} rows after merging all tables, but found {1} rows".format(
+            ACTUAL_ROWS_IN_INPUT_FILE, count))
+    if count > ACTUAL_ROWS_IN_INPUT_FILE: raise Exception(
+        "Dijointness property of Partitioning failed. Excpected {0} rows after merging all tables, but found {1} rows".format(
+            ACTUAL_ROWS_IN_INPUT_FILE, count))
+    return result
 
 
 def testrangerobininsert(expectedtablename, itemid, openconnection, rating, userid):
@@ -163,26 +373,36 @@ def testrangerobininsert(expectedtablename, itemid, openconnection, rating, user
         if count != 1:  return False
         return True
 
-def testEachRangePartition(ratingstablename, n, openconnection, rangepartitiontableprefix):
-    countList = getCountrangepartition(ratingstablename, n, openconnection)
-    cur = openconnection.cursor()
+def checkeachpartitioncount(countList, n, openconnection, partitionprefix, partitionresult):
+    if partitionresult is None:
+        partitionresult = getpartitionfingerprints(n, openconnection, partitionprefix)
     for i in range(0, n):
-        cur.execute("select count(*) from {0}{1}".format(rangepartitiontableprefix, i))
-        count = int(cur.fetchone()[0])
+        count = partitionresult['partitions'][i][0]
         if count != countList[i]:
             raise Exception("{0}{1} has {2} of rows while the correct number should be {3}".format(
-                rangepartitiontableprefix, i, count, countList[i]
+                partitionprefix, i, count, countList[i]
             ))
 
-def testEachRoundrobinPartition(ratingstablename, n, openconnection, roundrobinpartitiontableprefix):
+def testEachRangePartition(ratingstablename, n, openconnection, rangepartitiontableprefix, partitionresult=None):
+    countList = getCountrangepartition(ratingstablename, n, openconnection)
+    checkeachpartitioncount(countList, n, openconnection, rangepartitiontableprefix, partitionresult)
+
+def testEachRoundrobinPartition(ratingstablename, n, openconnection, roundrobinpartitiontableprefix, partitionresult=None):
     countList = getCountroundrobinpartition(ratingstablename, n, openconnection)
-    cur = openconnection.cursor()
+    checkeachpartitioncount(countList, n, openconnection, roundrobinpartitiontableprefix, partitionresult)
+
+def testEachHashPartition(ratingstablename, n, openconnection, hashpartitiontableprefix, partitionresult=None):
+    countList = getCounthashpartition(ratingstablename, n, openconnection)
+    if partitionresult is None:
+        partitionresult = getpartitionfingerprints(n, openconnection, hashpartitiontableprefix,
+                                                   partitionexpression=gethashpartitionexpression(n))
+    checkeachpartitioncount(countList, n, openconnection, hashpartitiontableprefix, partitionresult)
+    # Every row of a partition must hash to that partition
     for i in range(0, n):
-        cur.execute("select count(*) from {0}{1}".format(roundrobinpartitiontableprefix, i))
-        count = cur.fetchone()[0]
-        if count != countList[i]:
-            raise Exception("{0}{1} has {2} of rows while the correct number should be {3}".format(
-                roundrobinpartitiontableprefix, i, count, countList[i]
+        count = partitionresult['partitions'][i][2]
+        if count != 0:
+            raise Exception("{0}{1} has {2} row(s) that belong to another partition".format(
+                hashpartitiontableprefix, i, count
             ))
 
 # ##########
@@ -223,8 +443,9 @@ def testrangepartition(MyAssignment, ratingstablename, n, openconnection, partit
 
     try:
         MyAssignment.rangepartition(ratingstablename, n, openconnection)
-        testrangeandrobinpartitioning(n, openconnection, RANGE_TABLE_PREFIX, partitionstartindex, ACTUAL_ROWS_IN_INPUT_FILE)
-        testEachRangePartition(ratingstablename, n, openconnection, RANGE_TABLE_PREFIX)
+        result = testrangeandrobinpartitioning(n, openconnection, RANGE_TABLE_PREFIX, partitionstartindex,
+                                               ACTUAL_ROWS_IN_INPUT_FILE, ratingstablename)
+        testEachRangePartition(ratingstablename, n, openconnection, RANGE_TABLE_PREFIX, result)
         return [True, None]
     except Exception as e:
         traceback.print_exc()
@@ -243,8 +464,9 @@ def testroundrobinpartition(MyAssignment, ratingstablename, numberofpartitions,
     """
     try:
         MyAssignment.roundrobinpartition(ratingstablename, numberofpartitions, openconnection)
-        testrangeandrobinpartitioning(numberofpartitions, openconnection, RROBIN_TABLE_PREFIX, partitionstartindex, ACTUAL_ROWS_IN_INPUT_FILE)
-        testEachRoundrobinPartition(ratingstablename, numberofpartitions, openconnection, RROBIN_TABLE_PREFIX)
+        result = testrangeandrobinpartitioning(numberofpartitions, openconnection, RROBIN_TABLE_PREFIX, partitionstartindex,
+                                               ACTUAL_ROWS_IN_INPUT_FILE, ratingstablename)
+        testEachRoundrobinPartition(ratingstablename, numberofpartitions, openconnection, RROBIN_TABLE_PREFIX, result)
     except Exception as e:
         traceback.print_exc()
         return [False, e]
@@ -310,4 +532,50 @@ def testrangeinsert(MyAssignment, ratingstablename, userid, itemid, rating, open
     except Exception as e:
         traceback.print_exc()
         return [False, e]
-    return [True, None]
\ No newline at end of file
+    return [True, None]
+
+
+def testhashpartition(MyAssignment, ratingstablename, numberofpartitions, openconnection,
+                      partitionstartindex, ACTUAL_ROWS_IN_INPUT_FILE):
+    """
+    Tests the hash partitioning (by userid) for Completness, Disjointness and Reconstruction
+    :param ratingstablename: Argument for function to be tested
+    :param numberofpartitions: Argument for function to be tested
+    :param openconnection: Argument for function to be tested
+    :param partitionstartindex: Indicates how the table names are indexed. Do they start as hashpart1, 2 ... or hashpart0, 1, 2...
+    :return:Raises exception if any test fails
+    """
+    try:
+        MyAssignment.hashpartition(ratingstablename, numberofpartitions, openconnection)
+        result = testrangeandrobinpartitioning(numberofpartitions, openconnection, HASH_TABLE_PREFIX, partitionstartindex,
+                                               ACTUAL_ROWS_IN_INPUT_FILE, ratingstablename,
+                                               gethashpartitionexpression(numberofpartitions))
+        testEachHashPartition(ratingstablename, numberofpartitions, openconnection, HASH_TABLE_PREFIX, result)
+    except Exception as e:
+        traceback.print_exc()
+        return [False, e]
+    return [True, None]
+
+
+def testhashinsert(MyAssignment, ratingstablename, userid, itemid, rating, openconnection, expectedtableindex):
+    """
+    Tests the hash insert function by checking whether the tuple is inserted in the Expected table you provide
+    :param ratingstablename: Argument for function to be tested
+    :param userid: Argument for function to be tested
+    :param itemid: Argument for function to be tested
+    :param rating: Argument for function to be tested
+    :param openconnection: Argument for function to be tested
+    :param expectedtableindex: The expected table to which the record has to be saved
+    :return:Raises exception if any test fails
+    """
+    try:
+        expectedtablename = HASH_TABLE_PREFIX + expectedtableindex
+        MyAssignment.hashinsert(ratingstablename, userid, itemid, rating, openconnection)
+        if not testrangerobininsert(expectedtablename, itemid, openconnection, rating, userid):
+            raise Exception(
+                'Hash insert failed! Couldnt find ({0}, {1}, {2}) tuple in {3} table'.format(userid, itemid, rating,
+                                                                                             expectedtablename))
+    except Exception as e:
+        traceback.print_exc()
+        return [False, e]
+    return [True, None]
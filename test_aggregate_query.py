@@ -0,0 +1,52 @@
+import Interface
+import testHelper
+import psycopg2
+
+def test_aggregate_query():
+    # Kết nối đến database
+    conn = psycopg2.connect(
+        database="csdlpt",  # Thay đổi tên database của bạn ở đây
+        user="postgres",
+        password="1234",
+        host="localhost",
+        port="5432"
+    )
+    
+    try:
+        # Test case 1: Tổng hợp trên toàn bộ các phân mảnh range
+        print("Test case 1: Aggregate all ratings")
+        result = Interface.aggregatequery(conn)
+        print(result)
+        expected = partition_aggregate(conn, testHelper.RANGE_TABLE_PREFIX)[None]
+        if (result['count'], result['sum'], result['min'], result['max']) != expected:
+            raise Exception(f"aggregatequery returned {result}, expected (count, sum, min, max) = {expected}")
+        
+        # Test case 2: Điểm trung bình theo movie, tính trên các phân mảnh round robin
+        print("Test case 2: Average rating per movie")
+        result = Interface.aggregatequery(conn, "movieid", "roundrobin")
+        for movieid, stats in sorted(result.items()):
+            print(movieid, stats["avg"])
+        expected = partition_aggregate(conn, testHelper.RROBIN_TABLE_PREFIX, "movieid")
+        if {movieid: (stats['count'], stats['sum'], stats['min'], stats['max'])
+                for movieid, stats in result.items()} != expected:
+            raise Exception("aggregatequery per movie does not match the round robin partitions")
+        
+        print("All test cases completed!")
+        
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        raise
+    finally:
+        conn.close()
+
+def partition_aggregate(conn, prefix, groupby=None):
+    # Tính trực tiếp trên hợp của các phân mảnh để so sánh
+    with conn.cursor() as cur:
+        tablenames = [table for table in testHelper.getpartitiontables(cur) if table.startswith(prefix)]
+        cur.execute(f"SELECT {groupby or 'NULL'}, COUNT(rating), SUM(rating), MIN(rating), MAX(rating) FROM ("
+                    + " UNION ALL ".join(f"SELECT * FROM {table}" for table in tablenames)
+                    + ") AS T" + (f" GROUP BY {groupby}" if groupby else ""))
+        return {row[0]: tuple(row[1:]) for row in cur.fetchall()}
+
+if __name__ == "__main__":
+    test_aggregate_query()
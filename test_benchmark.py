@@ -0,0 +1,62 @@
+import filecmp
+import os
+import tempfile
+
+import benchmark
+
+def test_benchmark():
+    # Thư mục tạm chứa các file ratings sinh ra
+    directory = tempfile.mkdtemp()
+    first = os.path.join(directory, 'ratings_a.dat')
+    second = os.path.join(directory, 'ratings_b.dat')
+    
+    try:
+        # Test case 1: Cùng seed sinh ra cùng một file
+        print("Test case 1: Generator is reproducible")
+        benchmark.generate_ratings(first, 20000, seed=7, skew=1.5)
+        benchmark.generate_ratings(second, 20000, seed=7, skew=1.5)
+        same = filecmp.cmp(first, second, shallow=False)
+        rows = benchmark.count_file_rows(first)
+        print(same, rows)
+        if not same:
+            raise Exception("Two files generated with the same seed differ")
+        if rows != 20000:
+            raise Exception(f"Expected 20000 rows in the generated file, found {rows}")
+        
+        # Test case 2: Chạy một ma trận nhỏ
+        print("Test case 2: Run a small benchmark matrix")
+        report = benchmark.run_benchmark(first, partitions=[2], modes=['range:equidepth', 'hash:userid'],
+                                         insertrows=100)
+        print(len(report['results']), report['dataset'])
+        keys = {benchmark.result_key(result) for result in report['results']}
+        for loader in ('loadratings', 'loadratings_parallel', 'loadratings_binary'):
+            if (loader, None, None, None) not in keys:
+                raise Exception(f"No result for {loader}")
+        for scheme, mode in (('range', 'equidepth'), ('hash', 'userid')):
+            if (scheme + 'partition', scheme, mode, 2) not in keys:
+                raise Exception(f"No partitioning result for the cell {scheme}:{mode}")
+            for operation in ('rangequery', 'pointquery', 'aggregatequery', 'repartition'):
+                if (operation, scheme, mode, 2) not in keys:
+                    raise Exception(f"No {operation} result for the cell {scheme}:{mode}")
+        
+        # Test case 3: So sánh kết quả với chính nó
+        print("Test case 3: Compare a report with itself")
+        comparisons = benchmark.compare_results(report, report)
+        regressions = sum(comparison['regression'] for comparison in comparisons)
+        print(regressions)
+        if len(comparisons) != len(report['results']) or regressions:
+            raise Exception(f"Comparing a report with itself found {regressions} regressions")
+        
+        print("All test cases completed!")
+        
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        raise
+    finally:
+        for path in (first, second):
+            if os.path.exists(path):
+                os.remove(path)
+        os.rmdir(directory)
+
+if __name__ == "__main__":
+    test_benchmark()
@@ -0,0 +1,52 @@
+import Interface
+import testHelper
+import psycopg2
+
+def test_hash_insert():
+    # Kết nối đến database
+    conn = psycopg2.connect(
+        database="csdlpt",  # Thay đổi tên database của bạn ở đây
+        user="postgres",
+        password="1234",
+        host="localhost",
+        port="5432"
+    )
+    
+    try:
+        # Xóa các dòng của lần chạy trước
+        for userid, itemid in ((51, 1), (51, 2), (52, 1)):
+            with conn.cursor() as cur:
+                for tablename in ['ratings'] + testHelper.getpartitiontables(cur):
+                    cur.execute(f"DELETE FROM {tablename} WHERE userid = %s AND movieid = %s", (userid, itemid))
+        conn.commit()
+        
+        # Test case 1: Hai rating của cùng một user vào cùng một phân mảnh
+        print("Test case 1: Insert two ratings of user 51")
+        check_hash_insert(conn, 51, 1, 3.5)
+        check_hash_insert(conn, 51, 2, 4.0)
+        
+        # Test case 2: Rating của user khác
+        print("Test case 2: Insert a rating of user 52")
+        check_hash_insert(conn, 52, 1, 2.5)
+        
+        print("All test cases completed!")
+        
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        raise
+    finally:
+        conn.close()
+
+def check_hash_insert(conn, userid, itemid, rating):
+    # Phân mảnh đích tính theo cùng biểu thức hash với testHelper
+    metadata = Interface.get_partition_metadata(Interface.HASH_TABLE_PREFIX, conn, refresh=True)
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT {testHelper.gethashpartitionexpression(metadata['numberofpartitions'])} "
+                    f"FROM (SELECT {userid:d} AS userid) AS T")
+        expectedtableindex = str(cur.fetchone()[0])
+    result = testHelper.testhashinsert(Interface, "ratings", userid, itemid, rating, conn, expectedtableindex)
+    if not result[0]:
+        raise result[1]
+
+if __name__ == "__main__":
+    test_hash_insert() 
\ No newline at end of file
@@ -0,0 +1,70 @@
+import asyncio
+
+import Interface
+import testHelper
+import psycopg2
+
+def test_insert_service():
+    # Kết nối đến database
+    conn = psycopg2.connect(
+        database="csdlpt",  # Thay đổi tên database của bạn ở đây
+        user="postgres",
+        password="1234",
+        host="localhost",
+        port="5432"
+    )
+    
+    async def run():
+        async with Interface.InsertService("ratings", conn, scheme="range") as service:
+            # Test case 1: Nhiều coroutine cùng insert, các dòng được ghi theo lô
+            print("Test case 1: Submit ratings from many coroutines")
+            await asyncio.gather(*[service.insert(41 + i, 41 + i, 0.5 + i % 10 / 2) for i in range(20)])
+            print("Service stats:", service.stats())
+        stats = service.stats()
+        if stats['committed'] != 20 or stats['failed']:
+            raise Exception(f"InsertService committed {stats['committed']} of 20 rows, {stats['failed']} failed")
+        
+        # Test case 2: Dừng service trong lúc các insert đang chờ hàng đợi đầy
+        print("Test case 2: Stop the service while inserts wait on a full queue")
+        async with Interface.InsertService("ratings", conn, scheme="range", batchsize=2, queuesize=2) as service:
+            tasks = [asyncio.ensure_future(service.insert(61 + i, 61 + i, 0.5 + i % 10 / 2)) for i in range(30)]
+            # Dừng khi lô đầu tiên đang được ghi và các insert còn lại đang chờ
+            while not service.stats()['batches']:
+                await asyncio.sleep(0.001)
+        # Mọi insert đã được nhận phải hoàn tất sau khi stop() trả về
+        done, pending = await asyncio.wait(tasks, timeout=10)
+        if pending:
+            raise Exception(f"{len(pending)} inserts never completed after stop()")
+        stats = service.stats()
+        print("Service stats:", stats)
+        if stats['committed'] != 30 or stats['failed']:
+            raise Exception(f"InsertService committed {stats['committed']} of 30 rows, {stats['failed']} failed")
+        try:
+            await service.insert(91, 91, 1.0)
+        except RuntimeError:
+            pass
+        else:
+            raise Exception("A stopped InsertService accepted a new row")
+    
+    try:
+        # Xóa các dòng của lần chạy trước
+        testHelper.deletetestratings(conn, range(41, 92))
+        asyncio.run(run())
+        # rangeinsert chỉ ghi vào phân mảnh range, không ghi vào bảng ratings
+        metadata = Interface.get_partition_metadata(Interface.RANGE_TABLE_PREFIX, conn, refresh=True)
+        with conn.cursor() as cur:
+            cur.execute(" UNION ALL ".join(f"SELECT COUNT(*) FROM {table} WHERE userid BETWEEN 41 AND 91"
+                                           for table in metadata['tablenames']))
+            rows = sum(row[0] for row in cur.fetchall())
+        if rows != 50:
+            raise Exception(f"Expected 50 submitted rows in the range partitions, found {rows}")
+        print("All test cases completed!")
+        
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    test_insert_service()
@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+
+import Interface
+import psycopg2
+
+def test_instrumentation():
+    # Kết nối đến database
+    conn = psycopg2.connect(
+        database="csdlpt",  # Thay đổi tên database của bạn ở đây
+        user="postgres",
+        password="1234",
+        host="localhost",
+        port="5432"
+    )
+    conn.autocommit = True
+    path = os.path.join(tempfile.mkdtemp(), 'events.jsonl')
+    
+    try:
+        # Test case 1: Các giai đoạn của rangepartition
+        print("Test case 1: Spans of rangepartition")
+        Interface.droppartitions(Interface.RANGE_TABLE_PREFIX, conn)
+        with Interface.instrumentation(Interface.MemorySink()) as sink:
+            Interface.rangepartition('ratings', 4, conn)
+        for event in sink.events:
+            print(event['depth'], event['span'], f"{event['seconds']:.4f}", event['rows'],
+                  event['statements'], event['roundtrips'])
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM ratings")
+            rows = cur.fetchone()[0]
+        root = sink.events[-1]
+        if (root['span'], root['depth'], root['rows']) != ('rangepartition', 0, rows):
+            raise Exception(f"Unexpected root span of rangepartition: {root}")
+        if not {'create', 'fill'} <= {event['span'] for event in sink.events if event['depth'] == 1}:
+            raise Exception("The create and fill phases of rangepartition were not recorded")
+        
+        # Test case 2: Ghi event ra file JSONL kèm EXPLAIN (ANALYZE, BUFFERS)
+        print("Test case 2: JSONL sink with EXPLAIN capture")
+        sink = Interface.JsonlSink(path)
+        with Interface.instrumentation(sink, explain=True):
+            Interface.droppartitions(Interface.HASH_TABLE_PREFIX, conn)
+            Interface.hashpartition('ratings', 3, conn)
+        sink.close()
+        with open(path) as f:
+            events = [json.loads(line) for line in f]
+        print(len(events), 'events')
+        if not any(event['span'] == 'fill' and event.get('plans') for event in events):
+            raise Exception("No EXPLAIN plan was captured for the fill phase of hashpartition")
+        
+        # Test case 3: Số dòng của truy vấn
+        print("Test case 3: Rows of a range query")
+        with Interface.instrumentation(Interface.MemorySink()) as sink:
+            rows = list(Interface.rangequery(1.5, 3.5, conn))
+        print(len(rows), sink.events[-1]['rows'])
+        if sink.events[-1]['rows'] != len(rows):
+            raise Exception(f"rangequery returned {len(rows)} rows but its span recorded {sink.events[-1]['rows']}")
+        
+        print("All test cases completed!")
+        
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        raise
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+        os.rmdir(os.path.dirname(path))
+        conn.close()
+        Interface.close_connection_pools()
+
+if __name__ == "__main__":
+    test_instrumentation()
@@ -0,0 +1,68 @@
+import Interface
+import psycopg2
+
+def test_multinode():
+    # Kết nối đến database (coordinator, chứa bảng ratings và partition_catalog)
+    conn = psycopg2.connect(
+        database="csdlpt",  # Thay đổi tên database của bạn ở đây
+        user="postgres",
+        password="1234",
+        host="localhost",
+        port="5432"
+    )
+    # Các node: database khác trên cùng server; có thể dùng DSN như 'port=5433 dbname=csdlpt'
+    nodes = ['csdlpt_node1', 'csdlpt_node2']
+    
+    try:
+        for node in nodes:
+            Interface.create_db(node)
+        
+        # Test case 1: Đặt các phân mảnh range lên hai node
+        print("Test case 1: Range partitions placed on two nodes")
+        Interface.droppartitions(Interface.RANGE_TABLE_PREFIX, conn)
+        Interface.rangepartition('ratings', 4, conn, nodes=nodes)
+        placement = Interface.get_partition_metadata(Interface.RANGE_TABLE_PREFIX, conn, refresh=True)['nodes']
+        print(placement)
+        if placement != [nodes[i % len(nodes)] for i in range(4)]:
+            raise Exception(f"Unexpected placement of the range partitions: {placement}")
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('range_part0') IS NULL")
+            if not cur.fetchone()[0]:
+                raise Exception("range_part0 was created on the coordinator instead of its node")
+            cur.execute("SELECT COUNT(*) FROM ratings")
+            rows = cur.fetchone()[0]
+        conn.commit()
+        
+        # Test case 2: Insert được định tuyến đến node chứa phân mảnh
+        print("Test case 2: Range insert routed to the owning node")
+        Interface.rangeinsert('ratings', 1, 999999, 4.5, conn)
+        result = list(Interface.pointquery(4.5, conn, userid=1))
+        print(result)
+        tablenames = [tablename for tablename in Interface.query_partition_tables(conn, 4.5, 4.5)
+                      if tablename.startswith(Interface.RANGE_TABLE_PREFIX)]
+        if [row for row in result if row[2] == 999999] != [(tablenames[0], 1, 999999, 4.5)]:
+            raise Exception(f"The inserted rating was not found once in {tablenames[0]}")
+        
+        # Test case 3: Truy vấn tổng hợp chạy song song trên các node
+        print("Test case 3: Aggregate query over the nodes")
+        result = Interface.aggregatequery(conn)
+        print(result)
+        if result['count'] != rows + 1:
+            raise Exception(f"aggregatequery counted {result['count']} ratings, expected {rows + 1}")
+        
+        # Test case 4: Trở lại các phân mảnh cục bộ
+        print("Test case 4: Drop the placed partitions and rebuild them locally")
+        Interface.droppartitions(Interface.RANGE_TABLE_PREFIX, conn)
+        Interface.rangepartition('ratings', 4, conn)
+        
+        print("All test cases completed!")
+        
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        raise
+    finally:
+        conn.close()
+        Interface.close_connection_pools()
+
+if __name__ == "__main__":
+    test_multinode()
@@ -0,0 +1,59 @@
+import Interface
+import psycopg2
+
+def test_partition_indexes():
+    # Kết nối đến database
+    conn = psycopg2.connect(
+        database="csdlpt",  # Thay đổi tên database của bạn ở đây
+        user="postgres",
+        password="1234",
+        host="localhost",
+        port="5432"
+    )
+    
+    try:
+        # Test case 1: Kiểm tra và chuẩn hóa index spec
+        print("Test case 1: Parse an index spec")
+        specs = Interface.parse_index_spec(['btree(userid, movieid)', 'BRIN(rating)', 'unique(userid, movieid)'])
+        print(specs)
+        if specs != ['btree(userid,movieid)', 'brin(rating)', 'unique(userid,movieid)']:
+            raise Exception(f"Unexpected normalized index specs: {specs}")
+        
+        # Test case 2: Tạo index song song trên các phân mảnh range đã có, in thời gian tạo từng index
+        print("Test case 2: Build indexes on the range partitions")
+        tablenames = Interface.partition_tablenames(Interface.RANGE_TABLE_PREFIX, conn)
+        timings = Interface.build_partition_indexes(conn, tablenames, ['btree(userid,movieid)', 'brin(rating)'])
+        print(timings)
+        if sorted((timing['table'], timing['spec']) for timing in timings) != sorted(
+                (tablename, spec) for tablename in tablenames for spec in ['btree(userid,movieid)', 'brin(rating)']):
+            raise Exception("build_partition_indexes did not build every index on every partition")
+        if existing_indexes(conn, timings) != len(timings):
+            raise Exception("Some reported indexes do not exist")
+        
+        # Test case 3: Xóa các index vừa tạo
+        print("Test case 3: Drop the indexes")
+        cur = conn.cursor()
+        for timing in timings:
+            cur.execute(f"DROP INDEX IF EXISTS {timing['index']}")
+        conn.commit()
+        cur.close()
+        if existing_indexes(conn, timings):
+            raise Exception("Some indexes were not dropped")
+        
+        print("All test cases completed!")
+        
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        raise
+    finally:
+        conn.close()
+
+def existing_indexes(conn, timings):
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM pg_indexes WHERE indexname = ANY(%s)", ([timing['index'] for timing in timings],))
+        count = cur.fetchone()[0]
+    conn.commit()
+    return count
+
+if __name__ == "__main__":
+    test_partition_indexes()
@@ -0,0 +1,57 @@
+import Interface
+import testHelper
+import psycopg2
+
+def test_partition_verification():
+    # Kết nối đến database
+    conn = psycopg2.connect(
+        database="csdlpt",  # Thay đổi tên database của bạn ở đây
+        user="postgres",
+        password="1234",
+        host="localhost",
+        port="5432"
+    )
+    conn.autocommit = True
+    
+    try:
+        # Test case 1: Phân mảnh round robin đúng phải qua được kiểm tra
+        print("Test case 1: Verify a fresh round robin partitioning")
+        Interface.droppartitions(testHelper.RROBIN_TABLE_PREFIX, conn)
+        Interface.roundrobinpartition("ratings", 3, conn)
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM ratings")
+            rows = cur.fetchone()[0]
+        result = verify_roundrobin(conn, rows)
+        print(f"Partition counts: {[partition[0] for partition in result['partitions']]}")
+        if sum(partition[0] for partition in result['partitions']) != rows:
+            raise Exception(f"Expected {rows} rows in the round robin partitions")
+        
+        # Test case 2: Một dòng bị chép sang phân mảnh khác và một dòng bị mất (tổng số dòng không đổi)
+        print("Test case 2: Detect a row stored twice and a missing row")
+        with conn.cursor() as cur:
+            cur.execute(f"INSERT INTO {testHelper.RROBIN_TABLE_PREFIX}1 SELECT * FROM {testHelper.RROBIN_TABLE_PREFIX}0 LIMIT 1")
+            cur.execute(f"DELETE FROM {testHelper.RROBIN_TABLE_PREFIX}2 WHERE ctid = (SELECT MIN(ctid) FROM {testHelper.RROBIN_TABLE_PREFIX}2)")
+        try:
+            verify_roundrobin(conn, rows)
+        except Exception as e:
+            print(f"Detected: {e}")
+        else:
+            raise Exception("Corruption was not detected!")
+        
+        # Dựng lại phân mảnh đúng
+        Interface.droppartitions(testHelper.RROBIN_TABLE_PREFIX, conn)
+        Interface.roundrobinpartition("ratings", 3, conn)
+        print("All test cases completed!")
+        
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        raise
+    finally:
+        conn.close()
+        Interface.close_connection_pools()
+
+def verify_roundrobin(conn, rows):
+    return testHelper.testrangeandrobinpartitioning(3, conn, testHelper.RROBIN_TABLE_PREFIX, 0, rows, "ratings")
+
+if __name__ == "__main__":
+    test_partition_verification()
@@ -0,0 +1,42 @@
+import Interface
+import testHelper
+import psycopg2
+
+def test_point_query():
+    # Kết nối đến database
+    conn = psycopg2.connect(
+        database="csdlpt",  # Thay đổi tên database của bạn ở đây
+        user="postgres",
+        password="1234",
+        host="localhost",
+        port="5432"
+    )
+    
+    try:
+        # Test case 1: Lọc theo rating, chỉ đọc một phân mảnh range
+        print("Test case 1: Query ratings equal to 3.0")
+        rows = sorted(row[1:] for row in Interface.pointquery(3.0, conn))
+        print(f"{len(rows)} rows")
+        if rows != testHelper.getpartitionrows(conn, "rating = %s", (3.0,)):
+            raise Exception("pointquery did not return every partition row with rating 3.0 exactly once")
+        
+        # Test case 2: Lọc theo user, giới hạn số dòng trả về
+        print("Test case 2: Query at most 3 ratings of user 1")
+        rows = list(Interface.pointquery(None, conn, userid=1, limit=3))
+        for row in rows:
+            print(row)
+        if len(rows) != min(3, len(testHelper.getpartitionrows(conn, "userid = %s", (1,)))):
+            raise Exception(f"pointquery returned {len(rows)} rows of user 1 with limit 3")
+        if any(row[1] != 1 for row in rows):
+            raise Exception("pointquery returned ratings of another user")
+        
+        print("All test cases completed!")
+        
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    test_point_query()
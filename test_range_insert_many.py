@@ -0,0 +1,49 @@
+import Interface
+import testHelper
+import psycopg2
+
+def test_range_insert_many():
+    # Kết nối đến database
+    conn = psycopg2.connect(
+        database="csdlpt",  # Thay đổi tên database của bạn ở đây
+        user="postgres",
+        password="1234",
+        host="localhost",
+        port="5432"
+    )
+    
+    try:
+        # Xóa các dòng của lần chạy trước
+        testHelper.deletetestratings(conn, range(11, 16))
+        
+        # Insert một lô gồm các rating thuộc nhiều phân mảnh khác nhau
+        print("Test case 1: Insert a batch of ratings")
+        rows = [
+            (11, 11, 1.5),
+            (12, 12, 2.5),
+            (13, 13, 3.5),
+            (14, 14, 4.5),
+            (15, 15, 5.0),
+        ]
+        counts = Interface.rangeinsert_many("ratings", rows, conn)
+        print("Rows per partition:", counts)
+        if sum(counts.values()) != len(rows):
+            raise Exception(f"rangeinsert_many wrote {sum(counts.values())} rows, expected {len(rows)}")
+        
+        # Test case 2: Lô rỗng không ghi gì
+        print("Test case 2: Insert an empty batch")
+        counts = Interface.rangeinsert_many("ratings", [], conn)
+        print("Rows per partition:", counts)
+        if any(counts.values()):
+            raise Exception(f"rangeinsert_many wrote rows for an empty batch: {counts}")
+        
+        print("All test cases completed!")
+        
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    test_range_insert_many()
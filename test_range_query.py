@@ -0,0 +1,41 @@
+import Interface
+import testHelper
+import psycopg2
+
+def test_range_query():
+    # Kết nối đến database
+    conn = psycopg2.connect(
+        database="csdlpt",  # Thay đổi tên database của bạn ở đây
+        user="postgres",
+        password="1234",
+        host="localhost",
+        port="5432"
+    )
+    
+    try:
+        # Test case 1: Khoảng chỉ giao với một phần các phân mảnh range
+        print("Test case 1: Query ratings between 1.5 and 3.0")
+        rows = sorted(row[1:] for row in Interface.rangequery(1.5, 3.0, conn))
+        print(f"{len(rows)} rows")
+        if rows != testHelper.getpartitionrows(conn, "rating >= %s AND rating <= %s", (1.5, 3.0)):
+            raise Exception("rangequery did not return every partition row between 1.5 and 3.0 exactly once")
+        
+        # Test case 2: Đọc theo lô nhỏ và dừng sớm
+        print("Test case 2: Stop after the first row")
+        rows = Interface.rangequery(0, 5, conn, batchsize=2)
+        row = next(rows, None)
+        print(row)
+        rows.close()
+        if row is None:
+            raise Exception("rangequery returned no rows between 0 and 5")
+        
+        print("All test cases completed!")
+        
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    test_range_query()
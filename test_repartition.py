@@ -0,0 +1,95 @@
+import Interface
+import psycopg2
+import threading
+
+def test_repartition():
+    # Kết nối đến database
+    conn = psycopg2.connect(
+        database="csdlpt",  # Thay đổi tên database của bạn ở đây
+        user="postgres",
+        password="1234",
+        host="localhost",
+        port="5432"
+    )
+    
+    try:
+        # Test case 1: Tăng số phân mảnh range, chỉ các dòng đổi phân mảnh bị chuyển
+        print("Test case 1: Repartition range_part into 6 partitions")
+        rows = range_partition_rows(conn)
+        print(Interface.repartition(Interface.RANGE_TABLE_PREFIX, 6, conn))
+        check_range_partitions(conn, 6, rows)
+        
+        # Test case 2: Trở lại số phân mảnh ban đầu
+        print("Test case 2: Repartition range_part back into 4 partitions")
+        print(Interface.repartition(Interface.RANGE_TABLE_PREFIX, 4, conn))
+        check_range_partitions(conn, 4, rows)
+        
+        # Test case 3: Các truy vấn đọc chạy song song với repartition luôn thấy mỗi dòng đúng một lần
+        print("Test case 3: Count rrobin_part with aggregatequery while it is repartitioned")
+        metadata = Interface.get_partition_metadata(Interface.RROBIN_TABLE_PREFIX, conn, refresh=True)
+        conn.commit()
+        expected = Interface.aggregatequery(conn, scheme='roundrobin')['count']
+        stop = threading.Event()
+        wrong = []
+        
+        def reader():
+            reader_conn = psycopg2.connect(database="csdlpt", user="postgres", password="1234",
+                                           host="localhost", port="5432")
+            reader_conn.autocommit = True
+            try:
+                while not stop.is_set():
+                    count = Interface.aggregatequery(reader_conn, scheme='roundrobin')['count']
+                    if count != expected:
+                        wrong.append(f"aggregatequery counted {count} rows during repartition, expected {expected}")
+            except Exception as e:
+                wrong.append(f"aggregatequery failed during repartition: {e}")
+            finally:
+                reader_conn.close()
+        
+        thread = threading.Thread(target=reader)
+        thread.start()
+        try:
+            print(Interface.repartition(Interface.RROBIN_TABLE_PREFIX, metadata['numberofpartitions'] + 3, conn,
+                                        batchsize=2))
+            print(Interface.repartition(Interface.RROBIN_TABLE_PREFIX, metadata['numberofpartitions'], conn,
+                                        batchsize=2))
+        finally:
+            stop.set()
+            thread.join()
+        if wrong:
+            raise Exception(wrong[0])
+        
+        print("All test cases completed!")
+        
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        raise
+    finally:
+        conn.close()
+
+def range_partition_rows(conn):
+    # Các dòng (userid, movieid, rating) của từng phân mảnh range theo metadata hiện tại
+    metadata = Interface.get_partition_metadata(Interface.RANGE_TABLE_PREFIX, conn, refresh=True)
+    partitions = []
+    with conn.cursor() as cur:
+        for tablename in metadata['tablenames']:
+            cur.execute(f"SELECT userid, movieid, rating FROM {tablename}")
+            partitions.append(cur.fetchall())
+    conn.commit()
+    return metadata, partitions
+
+def check_range_partitions(conn, numberofpartitions, before):
+    metadata, partitions = range_partition_rows(conn)
+    if metadata['numberofpartitions'] != numberofpartitions or len(partitions) != numberofpartitions:
+        raise Exception(f"Expected {numberofpartitions} range partitions, found {len(partitions)}")
+    if sorted(row for rows in partitions for row in rows) != sorted(row for rows in before[1] for row in rows):
+        raise Exception("Repartition lost or duplicated rows")
+    # Phân mảnh 0 chứa [b0, b1], phân mảnh i > 0 chứa (bi, bi+1]
+    boundaries = metadata['boundaries']
+    for i, rows in enumerate(partitions):
+        for row in rows:
+            if not (boundaries[i] < row[2] or (i == 0 and boundaries[i] == row[2])) or row[2] > boundaries[i + 1]:
+                raise Exception(f"Rating {row} is outside the range of range_part{i}")
+
+if __name__ == "__main__":
+    test_repartition()
@@ -0,0 +1,70 @@
+import Interface
+import psycopg2
+
+def test_replicas():
+    # Kết nối đến database (chứa các phân mảnh, partition_catalog và insert log)
+    conn = psycopg2.connect(
+        database="csdlpt",  # Thay đổi tên database của bạn ở đây
+        user="postgres",
+        password="1234",
+        host="localhost",
+        port="5432"
+    )
+    # Node chứa bản sao: database khác trên cùng server; có thể dùng DSN như 'port=5433 dbname=csdlpt'
+    replica = 'csdlpt_replica1'
+    
+    try:
+        Interface.create_db(replica)
+        
+        # Test case 1: Tạo bản sao của các phân mảnh range
+        print("Test case 1: Add a replica of the range partitions")
+        Interface.droppartitions(Interface.RANGE_TABLE_PREFIX, conn)
+        Interface.rangepartition('ratings', 4, conn)
+        Interface.addreplica(Interface.RANGE_TABLE_PREFIX, replica, conn)
+        replicas = Interface.get_partition_metadata(Interface.RANGE_TABLE_PREFIX, conn, refresh=True)['replicas']
+        print(replicas)
+        if replicas != [replica]:
+            raise Exception(f"Expected the replicas [{replica}], found {replicas}")
+        
+        # Test case 2: Ghi vào bản chính, đồng bộ bản sao từ insert log
+        print("Test case 2: Insert on the primary and synchronise the replica")
+        Interface.rangeinsert('ratings', 1, 999999, 4.5, conn)
+        lag = Interface.replicalag(Interface.RANGE_TABLE_PREFIX, conn)
+        print(lag)
+        if [state['pendingrows'] for state in lag] != [1]:
+            raise Exception("The inserted row is not pending for the replica")
+        applied = Interface.syncreplicas(Interface.RANGE_TABLE_PREFIX, conn)
+        print(applied)
+        if applied != {replica: 1}:
+            raise Exception(f"Expected one row applied to {replica}, got {applied}")
+        lag = Interface.replicalag(Interface.RANGE_TABLE_PREFIX, conn)
+        print(lag)
+        if [state['pendingrows'] for state in lag] != [0]:
+            raise Exception("The replica still has pending rows after syncreplicas")
+        
+        # Test case 3: Truy vấn đọc trên bản sao và trên bản chính cho cùng kết quả
+        print("Test case 3: Reads routed to the replica match the primary")
+        result = Interface.aggregatequery(conn)
+        print(result == Interface.aggregatequery(conn, maxstaleness=None))
+        if result != Interface.aggregatequery(conn, maxstaleness=None):
+            raise Exception("Reads on the replica differ from reads on the primary")
+        
+        # Test case 4: Xóa bản sao
+        print("Test case 4: Remove the replica")
+        Interface.removereplica(Interface.RANGE_TABLE_PREFIX, replica, conn)
+        replicas = Interface.get_partition_metadata(Interface.RANGE_TABLE_PREFIX, conn, refresh=True)['replicas']
+        print(replicas)
+        if replicas:
+            raise Exception(f"The replica was not removed: {replicas}")
+        
+        print("All test cases completed!")
+        
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        raise
+    finally:
+        conn.close()
+        Interface.close_connection_pools()
+
+if __name__ == "__main__":
+    test_replicas()
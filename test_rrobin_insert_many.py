@@ -0,0 +1,51 @@
+import Interface
+import testHelper
+import psycopg2
+
+def test_rrobin_insert_many():
+    # Kết nối đến database
+    conn = psycopg2.connect(
+        database="csdlpt",  # Thay đổi tên database của bạn ở đây
+        user="postgres",
+        password="1234",
+        host="localhost",
+        port="5432"
+    )
+    
+    try:
+        # Xóa các dòng của lần chạy trước
+        testHelper.deletetestratings(conn, range(31, 36))
+        
+        # Insert một lô, các dòng được chia lần lượt vào các phân mảnh
+        print("Test case 1: Insert a batch of ratings")
+        rows = [
+            (31, 31, 1.5),
+            (32, 32, 2.5),
+            (33, 33, 3.5),
+            (34, 34, 4.5),
+            (35, 35, 5.0),
+        ]
+        counts = Interface.roundrobininsert_many("ratings", rows, conn)
+        print("Rows per partition:", counts)
+        if sum(counts.values()) != len(rows):
+            raise Exception(f"roundrobininsert_many wrote {sum(counts.values())} rows, expected {len(rows)}")
+        if max(counts.values()) - min(counts.values()) > 1:
+            raise Exception(f"roundrobininsert_many did not spread the batch evenly: {counts}")
+        
+        # Test case 2: Lô rỗng không ghi gì
+        print("Test case 2: Insert an empty batch")
+        counts = Interface.roundrobininsert_many("ratings", [], conn)
+        print("Rows per partition:", counts)
+        if any(counts.values()):
+            raise Exception(f"roundrobininsert_many wrote rows for an empty batch: {counts}")
+        
+        print("All test cases completed!")
+        
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    test_rrobin_insert_many()
@@ -0,0 +1,134 @@
+import Interface
+import testHelper
+import psycopg2
+import threading
+
+def test_split_partition():
+    # Kết nối đến database
+    conn = psycopg2.connect(
+        database="csdlpt",  # Thay đổi tên database của bạn ở đây
+        user="postgres",
+        password="1234",
+        host="localhost",
+        port="5432"
+    )
+    
+    try:
+        # Xóa các dòng của lần chạy trước (các luồng ghi ở test case 2)
+        testHelper.deletetestratings(conn, range(910001, 910005))
+        
+        # Test case 1: Tách phân mảnh range cuối tại trung vị rating của nó
+        print("Test case 1: Split the last range partition")
+        metadata = Interface.get_partition_metadata(Interface.RANGE_TABLE_PREFIX, conn, refresh=True)
+        rows_before = partition_rows(conn)
+        result = Interface.splitrangepartition(metadata['numberofpartitions'] - 1, conn)
+        print(result)
+        if result is None:
+            # Chỉ được bỏ qua khi phân mảnh cuối chỉ có một giá trị rating
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT COUNT(DISTINCT rating) FROM {metadata['tablenames'][-1]}")
+                values = cur.fetchone()[0]
+            conn.commit()
+            if values > 1:
+                raise Exception(f"{metadata['tablenames'][-1]} holds {values} rating values but was not split")
+        elif partition_count(conn) != metadata['numberofpartitions'] + 1:
+            raise Exception("splitrangepartition did not add a partition")
+        if partition_rows(conn) != rows_before:
+            raise Exception(f"Expected {rows_before} rows in the range partitions, found {partition_rows(conn)}")
+        
+        # Test case 2: Tách phân mảnh trong lúc các insert đơn lẻ và theo lô đang chạy
+        print("Test case 2: Split while rangeinsert and rangeinsert_many are running")
+        stop = threading.Event()
+        errors = []
+        inserted = [0] * 4  # Số dòng đã ghi của từng luồng
+        
+        def writer(k, userid, batch):
+            writer_conn = psycopg2.connect(database="csdlpt", user="postgres", password="1234",
+                                           host="localhost", port="5432")
+            movieid = 0
+            try:
+                while not stop.is_set():
+                    movieid += 1
+                    if batch:
+                        Interface.rangeinsert_many("ratings", [(userid, movieid * 10 + k, 4.5) for k in range(10)],
+                                                   writer_conn)
+                        inserted[k] += 10
+                    else:
+                        Interface.rangeinsert("ratings", userid, movieid, 5.0, writer_conn)
+                        inserted[k] += 1
+            except Exception as e:
+                errors.append(e)
+            finally:
+                writer_conn.close()
+        
+        rows_before = partition_rows(conn)
+        writers = [threading.Thread(target=writer, args=(k, 910001 + k, k % 2 == 0)) for k in range(4)]
+        for thread in writers:
+            thread.start()
+        try:
+            # Tách phân mảnh thấp nhất có thể tách, khóa các bảng range phía sau mà các luồng đang ghi vào
+            for _ in range(2):
+                index = splittable_partition(conn)
+                result = Interface.splitrangepartition(index, conn)
+                print(result)
+                if result is None:
+                    raise Exception(f"range_part{index} could not be split")
+        finally:
+            stop.set()
+            for thread in writers:
+                thread.join()
+        if errors:
+            raise errors[0]
+        if partition_rows(conn) != rows_before + sum(inserted):
+            raise Exception(f"Expected {rows_before + sum(inserted)} rows in the range partitions, "
+                            f"found {partition_rows(conn)}")
+        
+        # Test case 3: Một lần kiểm tra của tác vụ nền, tách các phân mảnh lệch quá 1.5 lần trung bình
+        print("Test case 3: Split hot partitions with HotPartitionSplitter")
+        rows_before = partition_rows(conn)
+        splitter = Interface.HotPartitionSplitter(conn, maxskew=1.5, minrows=1)
+        splits = splitter.check()
+        print(splits)
+        if any(split['left'] + split['right'] == 0 for split in splits):
+            raise Exception(f"HotPartitionSplitter split an empty partition: {splits}")
+        if partition_rows(conn) != rows_before:
+            raise Exception(f"Expected {rows_before} rows in the range partitions, found {partition_rows(conn)}")
+        
+        # Test case 4: Trở lại số phân mảnh ban đầu
+        print("Test case 4: Repartition range_part back into 4 partitions")
+        print(Interface.repartition(Interface.RANGE_TABLE_PREFIX, 4, conn))
+        if partition_count(conn) != 4 or partition_rows(conn) != rows_before:
+            raise Exception("Repartition back into 4 partitions changed the partition rows")
+        
+        print("All test cases completed!")
+        
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        raise
+    finally:
+        conn.close()
+
+def partition_rows(conn):
+    with conn.cursor() as cur:
+        metadata = Interface.get_partition_metadata(Interface.RANGE_TABLE_PREFIX, conn, refresh=True)
+        cur.execute(" UNION ALL ".join(f"SELECT COUNT(*) FROM {table}" for table in metadata['tablenames']))
+        rows = sum(row[0] for row in cur.fetchall())
+    # Không giữ transaction (và khóa trên các bảng) trong lúc tách
+    conn.commit()
+    return rows
+
+def splittable_partition(conn):
+    # Phân mảnh đầu tiên có ít nhất hai giá trị rating
+    metadata = Interface.get_partition_metadata(Interface.RANGE_TABLE_PREFIX, conn, refresh=True)
+    with conn.cursor() as cur:
+        cur.execute(" UNION ALL ".join(f"SELECT {index}, COUNT(DISTINCT rating) FROM {table}"
+                                       for index, table in enumerate(metadata['tablenames'])))
+        values = dict(cur.fetchall())
+    conn.commit()
+    return min(index for index, count in values.items() if count > 1)
+
+def partition_count(conn):
+    return Interface.get_partition_metadata(Interface.RANGE_TABLE_PREFIX, conn, refresh=True)['numberofpartitions']
+
+if __name__ == "__main__":
+    test_split_partition()